@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+"""A full text trigram index over the bold definitions table.
+1. bold and commentary, for plain and regex searches,
+2. bold_fuzzy and commentary_fuzzy, for fuzzy searches.
+The index only narrows down the candidates, the actual regex
+is still run on the candidates, so results are unchanged."""
+
+import re
+
+from sqlalchemy import Integer, column, text
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.selectable import TextualSelect
+
+from db.models import BoldDefinition
+from tools.fuzzy_search_regex import pali_letter_groups
+
+bd_fts_table = "bold_definitions_fts"
+
+# fuzzy_replace makes each group of similar letters interchangeable,
+# so fold each group to one letter, drop aspiration and double letters.
+# m and ṃ are also interchangeable with n in fuzzy_replace.
+fuzzy_letters_dict: dict[str, str | None] = {"m": "n", "h": None}
+for replacement, letters in pali_letter_groups:
+    for letter in letters:
+        if len(letter) == 1 and letter != replacement:
+            fuzzy_letters_dict.setdefault(letter, replacement)
+fuzzy_letters = str.maketrans(fuzzy_letters_dict)
+double_letters = re.compile(r"(.)\1+")
+regex_characters = re.compile(r"[\\.^$*+?{}\[\]|()]")
+
+
+def fuzzy_skeleton(string: str) -> str:
+    """Any text matching fuzzy_replace(q) contains fuzzy_skeleton(q)
+    within its own fuzzy_skeleton."""
+
+    string = string.casefold().translate(fuzzy_letters)
+    return double_letters.sub(r"\1", string)
+
+
+def make_bold_definitions_fts(db_session: Session) -> None:
+    """(Re)build the index from the bold definitions table."""
+
+    db_session.execute(text(f"DROP TABLE IF EXISTS {bd_fts_table}"))
+    db_session.execute(
+        text(
+            f"""CREATE VIRTUAL TABLE {bd_fts_table} USING fts5(
+                bold, commentary, bold_fuzzy, commentary_fuzzy,
+                content='', tokenize='trigram')"""
+        )
+    )
+
+    results = db_session.query(
+        BoldDefinition.id, BoldDefinition.bold, BoldDefinition.commentary
+    ).all()
+    rows = [
+        {
+            "id": id,
+            "bold": bold,
+            "commentary": commentary,
+            "bold_fuzzy": fuzzy_skeleton(bold),
+            "commentary_fuzzy": fuzzy_skeleton(commentary),
+        }
+        for id, bold, commentary in results
+    ]
+    db_session.execute(
+        text(
+            f"""INSERT INTO {bd_fts_table}
+            (rowid, bold, commentary, bold_fuzzy, commentary_fuzzy)
+            VALUES (:id, :bold, :commentary, :bold_fuzzy, :commentary_fuzzy)"""
+        ),
+        rows,
+    )
+    db_session.execute(
+        text(f"INSERT INTO {bd_fts_table}({bd_fts_table}) VALUES('optimize')")
+    )
+    db_session.commit()
+
+
+def bold_definitions_fts_exists(db_session: Session) -> bool:
+    result = db_session.execute(
+        text("SELECT name FROM sqlite_master WHERE type='table' AND name=:name"),
+        {"name": bd_fts_table},
+    ).first()
+    return result is not None
+
+
+def required_literal(pattern: str) -> str:
+    """The longest literal string which every match of a regex
+    must contain, or an empty string if there is none.
+    Conservative: groups, classes and alternations are skipped."""
+
+    if "|" in pattern:
+        return ""
+
+    runs: list[str] = []
+    run = ""
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+
+        # escapes
+        if char == "\\":
+            next_char = pattern[i + 1 : i + 2]
+            if next_char and not next_char.isalnum():
+                run += next_char
+            else:
+                runs.append(run)
+                run = ""
+            i += 2
+            continue
+
+        # character classes and groups
+        if char in "[(":
+            runs.append(run)
+            run = ""
+            i = _skip_bracket(pattern, i)
+            continue
+
+        # quantifiers which make the previous character optional
+        if char in "*?" or (char == "{" and re.match(r"\{\d*,?\d*\}", pattern[i:])):
+            runs.append(run[:-1])
+            run = ""
+            if char == "{":
+                i = pattern.index("}", i)
+            i += 1
+            continue
+
+        # quantifiers which repeat the previous character
+        if char == "+":
+            runs.append(run)
+            run = ""
+            i += 1
+            continue
+
+        # anchors and wildcards
+        if char in ".^$":
+            runs.append(run)
+            run = ""
+            i += 1
+            continue
+
+        run += char
+        i += 1
+
+    runs.append(run)
+    return max(runs, key=len)
+
+
+def _skip_bracket(pattern: str, i: int) -> int:
+    """Return the index after the class or group starting at i,
+    and after any quantifier following it."""
+
+    if pattern[i] == "[":
+        i += 1
+        if pattern[i : i + 1] == "^":
+            i += 1
+        if pattern[i : i + 1] == "]":
+            i += 1
+        while i < len(pattern) and pattern[i] != "]":
+            i += 2 if pattern[i] == "\\" else 1
+        i += 1
+    else:
+        depth = 0
+        while i < len(pattern):
+            if pattern[i] == "\\":
+                i += 2
+                continue
+            if pattern[i] == "(":
+                depth += 1
+            elif pattern[i] == ")":
+                depth -= 1
+                if depth == 0:
+                    break
+            i += 1
+        i += 1
+
+    quantifier = re.match(r"[*+?]|\{\d*,?\d*\}", pattern[i:])
+    if quantifier:
+        i += quantifier.end()
+    return i
+
+
+def _fts_phrase(fts_column: str, string: str) -> str:
+    phrase = string.replace('"', '""')
+    return f'{fts_column} : "{phrase}"'
+
+
+def make_fts_match(q1: str, q2: str, option: str) -> str:
+    """An FTS5 MATCH expression narrowing down the candidates
+    of a bold definitions search, or an empty string.
+    The trigram index needs at least three characters."""
+
+    phrases = []
+    if option in ["starts_with", "regex"]:
+        for fts_column, pattern in [("bold", q1), ("commentary", q2)]:
+            literal = required_literal(pattern)
+            if len(literal) >= 3:
+                phrases.append(_fts_phrase(fts_column, literal))
+
+    elif option == "fuzzy":
+        for fts_column, string in [("bold_fuzzy", q1), ("commentary_fuzzy", q2)]:
+            if regex_characters.search(string):
+                continue
+            skeleton = fuzzy_skeleton(string)
+            if len(skeleton) >= 3:
+                phrases.append(_fts_phrase(fts_column, skeleton))
+
+    return " AND ".join(phrases)
+
+
+def fts_candidates(match: str) -> TextualSelect:
+    """Subquery of candidate ids, to use with BoldDefinition.id.in_()"""
+
+    return (
+        text(f"SELECT rowid FROM {bd_fts_table} WHERE {bd_fts_table} MATCH :match")
+        .bindparams(match=match)
+        .columns(column("rowid", Integer))
+    )
@@ -0,0 +1,163 @@
+"""A journal of which rows have changed, so that each stage which derives
+data from a table can process only the rows changed since its last run.
+
+1. update_change_journal hashes every row of the tracked tables,
+   and gives the rows whose hash has changed the next sequence number,
+2. get_changed_since returns the keys of the rows changed after a sequence number,
+3. each stage saves the sequence number it has processed up to
+   as its checkpoint in db_info.
+
+get_changes does all that for a stage, e.g.
+
+    seq, changes = get_changes(db_session, "inflection_tables", "dpd_headwords")
+    for id in changes["dpd_headwords"]:
+        ...
+    save_checkpoint(db_session, "inflection_tables", seq)
+    db_session.commit()
+
+A new or rebuilt db has no journal and no checkpoints,
+so every row counts as changed the first time."""
+
+from hashlib import blake2b
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+
+from db.models import ChangeJournal, DbInfo, DpdHeadword, DpdRoot
+from db.models import InflectionTemplates, Lookup
+
+
+TRACKED_TABLES = {
+    "dpd_headwords": DpdHeadword,
+    "dpd_roots": DpdRoot,
+    "inflection_templates": InflectionTemplates,
+    "lookup": Lookup,
+}
+
+# columns which are generated from the others, or only timestamps,
+# so that a stage writing them doesn't count as a change
+UNTRACKED_COLUMNS = {
+    "dpd_headwords": {
+        "created_at", "updated_at",
+        "inflections", "inflections_api_ca_eva_iti", "inflections_sinhala",
+        "inflections_devanagari", "inflections_thai", "inflections_html",
+        "freq_data", "freq_html", "ebt_count"},
+    "dpd_roots": {"created_at", "updated_at"},
+    "inflection_templates": set(),
+    "lookup": {"sinhala", "devanagari", "thai"},
+}
+
+
+def _row_hashes(db_session: Session, table_name: str) -> dict[str, str]:
+    """The content hash of the tracked columns of each row, by primary key."""
+
+    table = TRACKED_TABLES[table_name].__table__
+    key = table.primary_key.columns[0]
+    columns = [
+        column for column in table.columns
+        if column is not key
+        and column.name not in UNTRACKED_COLUMNS[table_name]]
+
+    row_hashes: dict[str, str] = {}
+    for row_key, *values in db_session.execute(select(key, *columns)):
+        h = blake2b(repr(values).encode("utf-8"), digest_size=16)
+        row_hashes[str(row_key)] = h.hexdigest()
+    return row_hashes
+
+
+def get_current_seq(db_session: Session) -> int:
+    """The sequence number of the last change."""
+
+    seq = db_session.execute(select(func.max(ChangeJournal.seq))).scalar()
+    return seq or 0
+
+
+def update_change_journal(db_session: Session, *table_names: str) -> int:
+    """Journal the rows of the tables which are new, changed or deleted,
+    commit, and return the current sequence number."""
+
+    ChangeJournal.__table__.create(db_session.get_bind(), checkfirst=True)
+
+    new_seq = get_current_seq(db_session) + 1
+    changes: list[dict] = []
+
+    for table_name in table_names:
+        row_hashes = _row_hashes(db_session, table_name)
+        journal_hashes: dict[str, str] = dict(
+            db_session.execute(
+                select(ChangeJournal.row_key, ChangeJournal.row_hash)
+                .where(ChangeJournal.table_name == table_name)
+            ).tuples().all())
+
+        for row_key, row_hash in row_hashes.items():
+            if journal_hashes.get(row_key) != row_hash:
+                changes.append({
+                    "table_name": table_name, "row_key": row_key,
+                    "row_hash": row_hash, "seq": new_seq})
+
+        for row_key, row_hash in journal_hashes.items():
+            if row_key not in row_hashes and row_hash != "":
+                changes.append({
+                    "table_name": table_name, "row_key": row_key,
+                    "row_hash": "", "seq": new_seq})
+
+    if changes:
+        db_session.execute(
+            insert(ChangeJournal).prefix_with("OR REPLACE"), changes)
+    db_session.commit()
+
+    return new_seq if changes else new_seq - 1
+
+
+def get_changed_since(
+    db_session: Session,
+    table_name: str,
+    seq: int
+) -> set[str]:
+    """The keys of the rows of a table which changed after a sequence number,
+    including deleted rows. Keys are strings, e.g. DpdHeadword ids."""
+
+    return set(db_session.execute(
+        select(ChangeJournal.row_key)
+        .where(
+            ChangeJournal.table_name == table_name,
+            ChangeJournal.seq > seq)
+    ).scalars())
+
+
+def get_checkpoint(db_session: Session, stage: str) -> int:
+    """The sequence number a stage has processed up to."""
+
+    checkpoint = db_session.query(DbInfo) \
+        .filter_by(key=f"change_journal_{stage}") \
+        .first()
+    return checkpoint.value_unpack if checkpoint else 0
+
+
+def save_checkpoint(db_session: Session, stage: str, seq: int) -> None:
+    """Save the sequence number a stage has processed up to, without committing."""
+
+    checkpoint = db_session.query(DbInfo) \
+        .filter_by(key=f"change_journal_{stage}") \
+        .first()
+    if not checkpoint:
+        checkpoint = DbInfo(key=f"change_journal_{stage}")
+        db_session.add(checkpoint)
+    checkpoint.value_pack(seq)
+
+
+def get_changes(
+    db_session: Session,
+    stage: str,
+    *table_names: str
+) -> tuple[int, dict[str, set[str]]]:
+    """Update the journal of the tables and return the current sequence number,
+    to save as the stage's checkpoint when it's done,
+    and the keys of the rows of each table changed since its last checkpoint."""
+
+    seq = update_change_journal(db_session, *table_names)
+    checkpoint = get_checkpoint(db_session, stage)
+    changes = {
+        table_name: get_changed_since(db_session, table_name, checkpoint)
+        for table_name in table_names}
+    return seq, changes
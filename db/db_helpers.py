@@ -1,20 +1,44 @@
 """DB related functions:
 1. Create db if doesn't already exist,
-2. Create db Session
-3. Get column names,
-4. Print column names.
+2. Create db Session, with COLLATE PALI and SANSKRIT
+3. Create a pooled, read-only engine and session for servers,
+4. Stream headwords in keyset pages,
+5. Get column names,
+6. Print column names.
 """
 
 import os
 import sys
 
 from pathlib import Path
+from typing import Any, Iterable, Iterator
+
 from sqlalchemy import create_engine
+from sqlalchemy import event
 from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
 from sqlalchemy_utils import database_exists
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.orm import joinedload, load_only, sessionmaker, Session
+
+from db.models import Base, DpdHeadword
+from tools.pali_sort_key import register_collations
+
+
+# per-connection settings for the read-only engine
+READ_ONLY_PRAGMAS: dict[str, str | int] = {
+    "query_only": "ON",
+    "mmap_size": 268_435_456,  # 256 MB
+    "cache_size": -65_536,  # 64 MB, negative values are in KiB
+    "temp_store": "MEMORY",
+}
 
-from db.models import Base
+# seconds to wait for another process to unlock the db,
+# e.g. when the build runs stages at the same time
+DB_TIMEOUT = 600
+
+# one engine and session factory per db path per process
+_read_only_engines: dict[tuple[Path, int], Engine] = {}
+_read_only_sessionmakers: dict[tuple[Path, int], sessionmaker[Session]] = {}
 
 
 def create_db_if_not_exists(db_path: Path):
@@ -31,9 +55,15 @@ def get_db_session(db_path: Path) -> Session:
         sys.exit(1)
 
     try:
-        db_eng = create_engine(f"sqlite+pysqlite:///{db_path}", echo=False)
+        db_eng = create_engine(
+            f"sqlite+pysqlite:///{db_path}", echo=False,
+            connect_args={"timeout": DB_TIMEOUT})
         # db_conn = db_eng.connect()
 
+        @event.listens_for(db_eng, "connect")
+        def add_collations(dbapi_connection, connection_record):
+            register_collations(dbapi_connection)
+
         Session = sessionmaker(db_eng)
         Session.configure(bind=db_eng)
         db_sess = Session()
@@ -45,6 +75,107 @@ def get_db_session(db_path: Path) -> Session:
     return db_sess
 
 
+def get_read_only_engine(
+    db_path: Path, pool_size: int = 8, max_overflow: int = 8
+) -> Engine:
+    """Get a process-wide, pooled, read-only engine.
+    The engine is created once and then reused, so connections
+    and SQLite's page cache stay warm between requests.
+    Used by the webapp and other long-running readers."""
+
+    key = (Path(db_path).resolve(), os.getpid())
+    if key in _read_only_engines:
+        return _read_only_engines[key]
+
+    if not os.path.isfile(db_path):
+        print(f"Database file doesn't exist: {db_path}")
+        sys.exit(1)
+
+    db_eng = create_engine(
+        f"sqlite+pysqlite:///file:{key[0]}?mode=ro&uri=true",
+        echo=False,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_pre_ping=False,
+        connect_args={"check_same_thread": False},
+    )
+
+    @event.listens_for(db_eng, "connect")
+    def set_read_only_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in READ_ONLY_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+        cursor.close()
+        register_collations(dbapi_connection)
+
+    _read_only_engines[key] = db_eng
+    return db_eng
+
+
+def get_read_only_session(db_path: Path) -> Session:
+    """Get a session bound to the shared read-only engine.
+    Use as a context manager so the connection returns to the pool:
+    with get_read_only_session(pth.dpd_db_path) as db_session:"""
+
+    key = (Path(db_path).resolve(), os.getpid())
+    if key not in _read_only_sessionmakers:
+        _read_only_sessionmakers[key] = sessionmaker(
+            bind=get_read_only_engine(db_path),
+            autoflush=False,
+            expire_on_commit=False,
+        )
+    return _read_only_sessionmakers[key]()
+
+
+def iter_headwords(
+    db_session: Session,
+    columns: Iterable[str] | None = None,
+    eager: Iterable[str] = (),
+    keyset: str = "id",
+    filters: Iterable[Any] = (),
+    page_size: int = 5000,
+    limit: int = 0,
+) -> Iterator[DpdHeadword]:
+    """Stream DpdHeadwords in pages, using keyset pagination on the
+    unique id or lemma_1 column, instead of OFFSET or loading the whole table.
+    1. columns: only load these columns,
+        any others are deferred and only loaded if accessed,
+    2. eager: relationships to join in the same query:
+        ru, sbs, rt, fr (family root) or fw (family word),
+    3. keyset: "id" or "lemma_1", which is also the order of the rows,
+    4. filters: extra filters, use .has() for related tables,
+    5. limit: stop after this many headwords, 0 for all."""
+
+    key_column = getattr(DpdHeadword, keyset)
+
+    options = []
+    if columns is not None:
+        load_columns = set(columns) | {keyset}
+        options.append(
+            load_only(*[getattr(DpdHeadword, column) for column in load_columns])
+        )
+    for relationship in eager:
+        options.append(joinedload(getattr(DpdHeadword, relationship)))
+
+    counter = 0
+    last_key = None
+    while True:
+        query = db_session.query(DpdHeadword).options(*options).filter(*filters)
+        if last_key is not None:
+            query = query.filter(key_column > last_key)
+        page = query.order_by(key_column).limit(page_size).all()
+
+        for i in page:
+            yield i
+            counter += 1
+            if counter == limit:
+                return
+
+        if len(page) < page_size:
+            return
+        last_key = getattr(page[-1], keyset)
+
+
 def print_column_names(tables_name):
     """Print a numbered list of all the column names in a given table."""
 
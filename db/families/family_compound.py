@@ -13,6 +13,7 @@ from db.models import DbInfo, DpdHeadword, FamilyCompound
 from scripts.build.anki_updater import family_updater
 
 
+from tools.cache_load import invalidate_db_info_sets
 from tools.configger import config_test
 from tools.meaning_construction import clean_construction
 from tools.meaning_construction import degree_of_completion, rus_degree_of_completion
@@ -247,6 +248,7 @@ def update_db_cache(db_session, cf_dict):
     cf_set_cache.value = json.dumps(list(cf_set), ensure_ascii=False, indent=1)
     db_session.add(cf_set_cache)
     db_session.commit()
+    invalidate_db_info_sets()
 
 
 if __name__ == "__main__":
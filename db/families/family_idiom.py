@@ -10,6 +10,7 @@ from rich import print
 from db.db_helpers import get_db_session
 from db.models import DbInfo, DpdHeadword, FamilyIdiom
 
+from tools.cache_load import invalidate_db_info_sets
 from tools.configger import config_test
 from tools.meaning_construction import degree_of_completion, rus_degree_of_completion
 from tools.meaning_construction import make_meaning_combo
@@ -228,6 +229,7 @@ def update_db_cache(db_session, idioms_dict):
     idioms_set_cache.value = json.dumps(list(idioms_set), ensure_ascii=False, indent=1)
     db_session.add(idioms_set_cache)
     db_session.commit()
+    invalidate_db_info_sets()
 
 
 if __name__ == "__main__":
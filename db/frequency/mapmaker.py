@@ -2,19 +2,20 @@
 
 """Create frequency map data and HTML and save into database."""
 
-import psutil
+import os
 from typing import List, TypedDict
+import numpy as np
 import pandas as pd
 import pickle
 import re
-from multiprocessing.managers import ListProxy
-from multiprocessing import Process, Manager
 
 from rich import print
 from mako.template import Template
 from sqlalchemy import update
+from sqlalchemy.orm import load_only
 from sqlalchemy.orm.session import Session
 
+from db.change_journal import get_changes, save_checkpoint
 from db.db_helpers import get_db_session
 from db.models import DpdHeadword
 
@@ -23,7 +24,60 @@ from tools.configger import config_test, config_update
 from tools.tic_toc import tic, toc
 from tools.superscripter import superscripter_uni
 from tools.paths import ProjectPaths
-from tools.utils import list_into_batches
+
+
+# the word count csvs, in the order of the sections of frequency.html
+SECTIONS = [
+    "vinaya_pārājika_mūla",
+    "vinaya_pārājika_aṭṭhakathā",
+    "vinaya_ṭīkā",
+    "vinaya_pācittiya_mūla",
+    "vinaya_pācittiya_aṭṭhakathā",
+    "vinaya_mahāvagga_mūla",
+    "vinaya_mahāvagga_aṭṭhakathā",
+    "vinaya_cūḷavagga_mūla",
+    "vinaya_cūḷavagga_aṭṭhakathā",
+    "vinaya_parivāra_mūla",
+    "vinaya_parivāra_aṭṭhakathā",
+    "sutta_dīgha_mūla",
+    "sutta_dīgha_aṭṭhakathā",
+    "sutta_dīgha_ṭīkā",
+    "sutta_majjhima_mūla",
+    "sutta_majjhima_aṭṭhakathā",
+    "sutta_majjhima_ṭīkā",
+    "sutta_saṃyutta_mūla",
+    "sutta_saṃyutta_aṭṭhakathā",
+    "sutta_saṃyutta_ṭīkā",
+    "sutta_aṅguttara_mūla",
+    "sutta_aṅguttara_aṭṭhakathā",
+    "sutta_aṅguttara_ṭīkā",
+    "sutta_khuddaka1_mūla",
+    "sutta_khuddaka1_aṭṭhakathā",
+    "sutta_khuddaka2_mūla",
+    "sutta_khuddaka2_aṭṭhakathā",
+    "sutta_khuddaka3_mūla",
+    "sutta_khuddaka3_aṭṭhakathā",
+    "sutta_khuddaka3_ṭīkā",
+    "abhidhamma_dhammasaṅgaṇī_mūla",
+    "abhidhamma_aṭṭhakathā",
+    "abhidhamma_ṭīkā",
+    "abhidhamma_vibhāṅga_mūla",
+    "abhidhamma_dhātukathā_mūla",
+    "abhidhamma_puggalapaññatti_mūla",
+    "abhidhamma_kathāvatthu_mūla",
+    "abhidhamma_yamaka_mūla",
+    "abhidhamma_paṭṭhāna_mūla",
+    "aññā_visuddhimagga",
+    "aññā_visuddhimagga_ṭīkā",
+    "aññā_leḍī",
+    "aññā_buddha_vandanā",
+    "aññā_vaṃsa",
+    "aññā_byākaraṇa",
+    "aññā_pucchavisajjana",
+    "aññā_nīti",
+    "aññā_pakiṇṇaka",
+    "aññā_sihaḷa",
+]
 
 
 def main():
@@ -54,22 +108,18 @@ def main():
     pth = ProjectPaths()
     db_session = get_db_session(pth.dpd_db_path)
 
+    journal_seq = test_changes_since_last_run(db_session)
     if not regenerate_all:
-        test_inflection_template_changed(pth)
-        test_changed_headwords(pth)
         test_html_file_missing(db_session)
 
     else:
-        global changed_templates
-        global changed_headwords
         global html_file_missing
-        changed_templates = []
-        changed_headwords = []
         html_file_missing = []
 
-    dicts = make_dfs_and_dicts(pth)
-    num_logical_cores = psutil.cpu_count()
-    make_data_dict_and_html(pth, db_session, dicts, num_logical_cores, regenerate_all)
+    matrix = make_word_count_matrix(pth)
+    make_data_dict_and_html(pth, db_session, matrix, regenerate_all)
+    save_checkpoint(db_session, "mapmaker", journal_seq)
+    db_session.commit()
     db_session.close()
 
     # reset config
@@ -81,39 +131,24 @@ def main():
     toc()
 
 
-def test_inflection_template_changed(pth: ProjectPaths):
-    print("[green]test if inflection templates changed", end=" ")
-
-    global changed_templates
-    try:
-        with open(pth.template_changed_path, "rb") as f:
-            changed_templates = pickle.load(f)
-
-            if changed_templates == []:
-                print("[white]ok")
-            else:
-                print(f"[bright_red]{len(changed_templates)}")
-
-    except FileNotFoundError as e:
-        print(f"[red]{e}")
-        assert(changed_templates == [])
+def test_changes_since_last_run(db_session: Session) -> int:
+    """Find the headwords and inflection templates changed since last run,
+    in the change journal, and return the journal's sequence number."""
 
+    print("[green]test if headwords or templates have changed", end=" ")
 
-def test_changed_headwords(pth: ProjectPaths):
-    print("[green]test if stems or patterns have changed", end=" ")
-
+    global changed_templates
     global changed_headwords
-    try:
-        with open(pth.changed_headwords_path, "rb") as f:
-            changed_headwords = pickle.load(f)
-        if changed_headwords == []:
-            print("[white] ok")
-        else:
-            print(f"[bright_red]{len(changed_headwords)}")
+    journal_seq, changes = get_changes(
+        db_session, "mapmaker", "dpd_headwords", "inflection_templates")
+    changed_templates = changes["inflection_templates"]
+    changed_headwords = {int(id) for id in changes["dpd_headwords"]}
 
-    except FileNotFoundError as e:
-        print(f"[bright_red]{e}")
-        assert(changed_templates == [])
+    if not changed_templates and not changed_headwords:
+        print("[white]ok")
+    else:
+        print(f"[bright_red]{len(changed_headwords)} {len(changed_templates)}")
+    return journal_seq
 
 
 def test_html_file_missing(db_session: Session):
@@ -132,7 +167,7 @@ def test_html_file_missing(db_session: Session):
         .all()
 
     global html_file_missing
-    html_file_missing = [i.id for i in missing_html_db]
+    html_file_missing = {i.id for i in missing_html_db}
 
     if len(html_file_missing) > 0:
         print(f"[bright_red]{len(html_file_missing)}")
@@ -140,163 +175,134 @@ def test_html_file_missing(db_session: Session):
         print("ok")
 
 
-def make_dfs_and_dicts(pth: ProjectPaths) -> List[dict]:
-    print("[green]making word count dicts and df's")
-
-    wc_dir = pth.word_count_dir
-
-    vinaya_pārājika_mūla = pd.read_csv(wc_dir.joinpath("vinaya_pārājika_mūla.csv"), sep="\t", header=None)
-    vinaya_pārājika_aṭṭhakathā = pd.read_csv(wc_dir.joinpath("vinaya_pārājika_aṭṭhakathā.csv"), sep="\t", header=None)
-    vinaya_ṭīkā = pd.read_csv(wc_dir.joinpath("vinaya_ṭīkā.csv"), sep="\t", header=None)
-    vinaya_pācittiya_mūla = pd.read_csv(wc_dir.joinpath("vinaya_pācittiya_mūla.csv"), sep="\t", header=None)
-    vinaya_pācittiya_aṭṭhakathā = pd.read_csv(wc_dir.joinpath("vinaya_pācittiya_aṭṭhakathā.csv"), sep="\t", header=None)
-    vinaya_mahāvagga_mūla = pd.read_csv(wc_dir.joinpath("vinaya_mahāvagga_mūla.csv"), sep="\t", header=None)
-    vinaya_mahāvagga_aṭṭhakathā = pd.read_csv(wc_dir.joinpath("vinaya_mahāvagga_aṭṭhakathā.csv"), sep="\t", header=None)
-    vinaya_cūḷavagga_mūla = pd.read_csv(wc_dir.joinpath("vinaya_cūḷavagga_mūla.csv"), sep="\t", header=None)
-    vinaya_cūḷavagga_aṭṭhakathā = pd.read_csv(wc_dir.joinpath("vinaya_cūḷavagga_aṭṭhakathā.csv"), sep="\t", header=None)
-    vinaya_parivāra_mūla = pd.read_csv(wc_dir.joinpath("vinaya_parivāra_mūla.csv"), sep="\t", header=None)
-    vinaya_parivāra_aṭṭhakathā = pd.read_csv(wc_dir.joinpath("vinaya_parivāra_aṭṭhakathā.csv"), sep="\t", header=None)
-    sutta_dīgha_mūla = pd.read_csv(wc_dir.joinpath("sutta_dīgha_mūla.csv"), sep="\t", header=None)
-    sutta_dīgha_aṭṭhakathā = pd.read_csv(wc_dir.joinpath("sutta_dīgha_aṭṭhakathā.csv"), sep="\t", header=None)
-    sutta_dīgha_ṭīkā = pd.read_csv(wc_dir.joinpath("sutta_dīgha_ṭīkā.csv"), sep="\t", header=None)
-    sutta_majjhima_mūla = pd.read_csv(wc_dir.joinpath("sutta_majjhima_mūla.csv"), sep="\t", header=None)
-    sutta_majjhima_aṭṭhakathā = pd.read_csv(wc_dir.joinpath("sutta_majjhima_aṭṭhakathā.csv"), sep="\t", header=None)
-    sutta_majjhima_ṭīkā = pd.read_csv(wc_dir.joinpath("sutta_majjhima_ṭīkā.csv"), sep="\t", header=None)
-    sutta_saṃyutta_mūla = pd.read_csv(wc_dir.joinpath("sutta_saṃyutta_mūla.csv"), sep="\t", header=None)
-    sutta_saṃyutta_aṭṭhakathā = pd.read_csv(wc_dir.joinpath("sutta_saṃyutta_aṭṭhakathā.csv"), sep="\t", header=None)
-    sutta_saṃyutta_ṭīkā = pd.read_csv(wc_dir.joinpath("sutta_saṃyutta_ṭīkā.csv"), sep="\t", header=None)
-    sutta_aṅguttara_mūla = pd.read_csv(wc_dir.joinpath("sutta_aṅguttara_mūla.csv"), sep="\t", header=None)
-    sutta_aṅguttara_aṭṭhakathā = pd.read_csv(wc_dir.joinpath("sutta_aṅguttara_aṭṭhakathā.csv"), sep="\t", header=None)
-    sutta_aṅguttara_ṭīkā = pd.read_csv(wc_dir.joinpath("sutta_aṅguttara_ṭīkā.csv"), sep="\t", header=None)
-    sutta_khuddaka1_mūla = pd.read_csv(wc_dir.joinpath("sutta_khuddaka1_mūla.csv"), sep="\t", header=None)
-    sutta_khuddaka1_aṭṭhakathā = pd.read_csv(wc_dir.joinpath("sutta_khuddaka1_aṭṭhakathā.csv"), sep="\t", header=None)
-    sutta_khuddaka2_mūla = pd.read_csv(wc_dir.joinpath("sutta_khuddaka2_mūla.csv"), sep="\t", header=None)
-    sutta_khuddaka2_aṭṭhakathā = pd.read_csv(wc_dir.joinpath("sutta_khuddaka2_aṭṭhakathā.csv"), sep="\t", header=None)
-    sutta_khuddaka3_mūla = pd.read_csv(wc_dir.joinpath("sutta_khuddaka3_mūla.csv"), sep="\t", header=None)
-    sutta_khuddaka3_aṭṭhakathā = pd.read_csv(wc_dir.joinpath("sutta_khuddaka3_aṭṭhakathā.csv"), sep="\t", header=None)
-    sutta_khuddaka3_ṭīkā = pd.read_csv(wc_dir.joinpath("sutta_khuddaka3_ṭīkā.csv"), sep="\t", header=None)
-    abhidhamma_dhammasaṅgaṇī_mūla = pd.read_csv(wc_dir.joinpath("abhidhamma_dhammasaṅgaṇī_mūla.csv"), sep="\t", header=None)
-    abhidhamma_vibhāṅga_mūla = pd.read_csv(wc_dir.joinpath("abhidhamma_vibhāṅga_mūla.csv"), sep="\t", header=None)
-    abhidhamma_dhātukathā_mūla = pd.read_csv(wc_dir.joinpath("abhidhamma_dhātukathā_mūla.csv"), sep="\t", header=None)
-    abhidhamma_puggalapaññatti_mūla = pd.read_csv(wc_dir.joinpath("abhidhamma_puggalapaññatti_mūla.csv"), sep="\t", header=None)
-    abhidhamma_kathāvatthu_mūla = pd.read_csv(wc_dir.joinpath("abhidhamma_kathāvatthu_mūla.csv"), sep="\t", header=None)
-    abhidhamma_yamaka_mūla = pd.read_csv(wc_dir.joinpath("abhidhamma_yamaka_mūla.csv"), sep="\t", header=None)
-    abhidhamma_paṭṭhāna_mūla = pd.read_csv(wc_dir.joinpath("abhidhamma_paṭṭhāna_mūla.csv"), sep="\t", header=None)
-    abhidhamma_aṭṭhakathā = pd.read_csv(wc_dir.joinpath("abhidhamma_aṭṭhakathā.csv"), sep="\t", header=None)
-    abhidhamma_ṭīkā = pd.read_csv(wc_dir.joinpath("abhidhamma_ṭīkā.csv"), sep="\t", header=None)
-    aññā_visuddhimagga = pd.read_csv(wc_dir.joinpath("aññā_visuddhimagga.csv"), sep="\t", header=None)
-    aññā_visuddhimagga_ṭīkā = pd.read_csv(wc_dir.joinpath("aññā_visuddhimagga_ṭīkā.csv"), sep="\t", header=None)
-    aññā_leḍī = pd.read_csv(wc_dir.joinpath("aññā_leḍī.csv"), sep="\t", header=None)
-    aññā_buddha_vandanā = pd.read_csv(wc_dir.joinpath("aññā_buddha_vandanā.csv"), sep="\t", header=None)
-    aññā_vaṃsa = pd.read_csv(wc_dir.joinpath("aññā_vaṃsa.csv"), sep="\t", header=None)
-    aññā_byākaraṇa = pd.read_csv(wc_dir.joinpath("aññā_byākaraṇa.csv"), sep="\t", header=None)
-    aññā_pucchavisajjana = pd.read_csv(wc_dir.joinpath("aññā_pucchavisajjana.csv"), sep="\t", header=None)
-    aññā_nīti = pd.read_csv(wc_dir.joinpath("aññā_nīti.csv"), sep="\t", header=None)
-    aññā_pakiṇṇaka = pd.read_csv(wc_dir.joinpath("aññā_pakiṇṇaka.csv"), sep="\t", header=None)
-    aññā_sihaḷa = pd.read_csv(wc_dir.joinpath("aññā_sihaḷa.csv"), sep="\t", header=None)
-
-    vinaya_pārājika_mūla_dict = dict(vinaya_pārājika_mūla.values.tolist())
-    vinaya_pārājika_aṭṭhakathā_dict = dict(vinaya_pārājika_aṭṭhakathā.values.tolist())
-    vinaya_ṭīkā_dict = dict(vinaya_ṭīkā.values.tolist())
-    vinaya_pācittiya_mūla_dict = dict(vinaya_pācittiya_mūla.values.tolist())
-    vinaya_pācittiya_aṭṭhakathā_dict = dict(vinaya_pācittiya_aṭṭhakathā.values.tolist())
-    vinaya_mahāvagga_mūla_dict = dict(vinaya_mahāvagga_mūla.values.tolist())
-    vinaya_mahāvagga_aṭṭhakathā_dict = dict(vinaya_mahāvagga_aṭṭhakathā.values.tolist())
-    vinaya_cūḷavagga_mūla_dict = dict(vinaya_cūḷavagga_mūla.values.tolist())
-    vinaya_cūḷavagga_aṭṭhakathā_dict = dict(vinaya_cūḷavagga_aṭṭhakathā.values.tolist())
-    vinaya_parivāra_mūla_dict = dict(vinaya_parivāra_mūla.values.tolist())
-    vinaya_parivāra_aṭṭhakathā_dict = dict(vinaya_parivāra_aṭṭhakathā.values.tolist())
-    sutta_dīgha_mūla_dict = dict(sutta_dīgha_mūla.values.tolist())
-    sutta_dīgha_aṭṭhakathā_dict = dict(sutta_dīgha_aṭṭhakathā.values.tolist())
-    sutta_dīgha_ṭīkā_dict = dict(sutta_dīgha_ṭīkā.values.tolist())
-    sutta_majjhima_mūla_dict = dict(sutta_majjhima_mūla.values.tolist())
-    sutta_majjhima_aṭṭhakathā_dict = dict(sutta_majjhima_aṭṭhakathā.values.tolist())
-    sutta_majjhima_ṭīkā_dict = dict(sutta_majjhima_ṭīkā.values.tolist())
-    sutta_saṃyutta_mūla_dict = dict(sutta_saṃyutta_mūla.values.tolist())
-    sutta_saṃyutta_aṭṭhakathā_dict = dict(sutta_saṃyutta_aṭṭhakathā.values.tolist())
-    sutta_saṃyutta_ṭīkā_dict = dict(sutta_saṃyutta_ṭīkā.values.tolist())
-    sutta_aṅguttara_mūla_dict = dict(sutta_aṅguttara_mūla.values.tolist())
-    sutta_aṅguttara_aṭṭhakathā_dict = dict(sutta_aṅguttara_aṭṭhakathā.values.tolist())
-    sutta_aṅguttara_ṭīkā_dict = dict(sutta_aṅguttara_ṭīkā.values.tolist())
-    sutta_khuddaka1_mūla_dict = dict(sutta_khuddaka1_mūla.values.tolist())
-    sutta_khuddaka1_aṭṭhakathā_dict = dict(sutta_khuddaka1_aṭṭhakathā.values.tolist())
-    sutta_khuddaka2_mūla_dict = dict(sutta_khuddaka2_mūla.values.tolist())
-    sutta_khuddaka2_aṭṭhakathā_dict = dict(sutta_khuddaka2_aṭṭhakathā.values.tolist())
-    sutta_khuddaka3_mūla_dict = dict(sutta_khuddaka3_mūla.values.tolist())
-    sutta_khuddaka3_aṭṭhakathā_dict = dict(sutta_khuddaka3_aṭṭhakathā.values.tolist())
-    sutta_khuddaka3_ṭīkā_dict = dict(sutta_khuddaka3_ṭīkā.values.tolist())
-    abhidhamma_dhammasaṅgaṇī_mūla_dict = dict(abhidhamma_dhammasaṅgaṇī_mūla.values.tolist())
-    abhidhamma_vibhāṅga_mūla_dict = dict(abhidhamma_vibhāṅga_mūla.values.tolist())
-    abhidhamma_dhātukathā_mūla_dict = dict(abhidhamma_dhātukathā_mūla.values.tolist())
-    abhidhamma_puggalapaññatti_mūla_dict = dict(abhidhamma_puggalapaññatti_mūla.values.tolist())
-    abhidhamma_kathāvatthu_mūla_dict = dict(abhidhamma_kathāvatthu_mūla.values.tolist())
-    abhidhamma_yamaka_mūla_dict = dict(abhidhamma_yamaka_mūla.values.tolist())
-    abhidhamma_paṭṭhāna_mūla_dict = dict(abhidhamma_paṭṭhāna_mūla.values.tolist())
-    abhidhamma_aṭṭhakathā_dict = dict(abhidhamma_aṭṭhakathā.values.tolist())
-    abhidhamma_ṭīkā_dict = dict(abhidhamma_ṭīkā.values.tolist())
-    aññā_visuddhimagga_dict = dict(aññā_visuddhimagga.values.tolist())
-    aññā_visuddhimagga_ṭīkā_dict = dict(aññā_visuddhimagga_ṭīkā.values.tolist())
-    aññā_leḍī_dict = dict(aññā_leḍī.values.tolist())
-    aññā_buddha_vandanā_dict = dict(aññā_buddha_vandanā.values.tolist())
-    aññā_vaṃsa_dict = dict(aññā_vaṃsa.values.tolist())
-    aññā_byākaraṇa_dict = dict(aññā_byākaraṇa.values.tolist())
-    aññā_pucchavisajjana_dict = dict(aññā_pucchavisajjana.values.tolist())
-    aññā_nīti_dict = dict(aññā_nīti.values.tolist())
-    aññā_pakiṇṇaka_dict = dict(aññā_pakiṇṇaka.values.tolist())
-    aññā_sihaḷa_dict = dict(aññā_sihaḷa.values.tolist())
-
-    dicts = [
-        vinaya_pārājika_mūla_dict,
-        vinaya_pārājika_aṭṭhakathā_dict,
-        vinaya_ṭīkā_dict,
-        vinaya_pācittiya_mūla_dict,
-        vinaya_pācittiya_aṭṭhakathā_dict,
-        vinaya_mahāvagga_mūla_dict,
-        vinaya_mahāvagga_aṭṭhakathā_dict,
-        vinaya_cūḷavagga_mūla_dict,
-        vinaya_cūḷavagga_aṭṭhakathā_dict,
-        vinaya_parivāra_mūla_dict,
-        vinaya_parivāra_aṭṭhakathā_dict,
-        sutta_dīgha_mūla_dict,
-        sutta_dīgha_aṭṭhakathā_dict,
-        sutta_dīgha_ṭīkā_dict,
-        sutta_majjhima_mūla_dict,
-        sutta_majjhima_aṭṭhakathā_dict,
-        sutta_majjhima_ṭīkā_dict,
-        sutta_saṃyutta_mūla_dict,
-        sutta_saṃyutta_aṭṭhakathā_dict,
-        sutta_saṃyutta_ṭīkā_dict,
-        sutta_aṅguttara_mūla_dict,
-        sutta_aṅguttara_aṭṭhakathā_dict,
-        sutta_aṅguttara_ṭīkā_dict,
-        sutta_khuddaka1_mūla_dict,
-        sutta_khuddaka1_aṭṭhakathā_dict,
-        sutta_khuddaka2_mūla_dict,
-        sutta_khuddaka2_aṭṭhakathā_dict,
-        sutta_khuddaka3_mūla_dict,
-        sutta_khuddaka3_aṭṭhakathā_dict,
-        sutta_khuddaka3_ṭīkā_dict,
-        abhidhamma_dhammasaṅgaṇī_mūla_dict,
-        abhidhamma_aṭṭhakathā_dict,
-        abhidhamma_ṭīkā_dict,
-        abhidhamma_vibhāṅga_mūla_dict,
-        abhidhamma_dhātukathā_mūla_dict,
-        abhidhamma_puggalapaññatti_mūla_dict,
-        abhidhamma_kathāvatthu_mūla_dict,
-        abhidhamma_yamaka_mūla_dict,
-        abhidhamma_paṭṭhāna_mūla_dict,
-        aññā_visuddhimagga_dict,
-        aññā_visuddhimagga_ṭīkā_dict,
-        aññā_leḍī_dict,
-        aññā_buddha_vandanā_dict,
-        aññā_vaṃsa_dict,
-        aññā_byākaraṇa_dict,
-        aññā_pucchavisajjana_dict,
-        aññā_nīti_dict,
-        aññā_pakiṇṇaka_dict,
-        aññā_sihaḷa_dict
-    ]
-    return dicts
+class WordCountMatrix:
+    """The word counts of all sections as a sparse matrix,
+    one row per word and one column per section, stored row by row:
+    the counts of row r are counts[indptr[r]:indptr[r + 1]]
+    in the columns cols[indptr[r]:indptr[r + 1]]."""
+
+    def __init__(
+        self,
+        word_index: dict[str, int],
+        indptr: np.ndarray,
+        cols: np.ndarray,
+        counts: np.ndarray
+    ) -> None:
+        self.word_index = word_index
+        self.indptr = indptr
+        self.cols = cols
+        self.counts = counts
+
+    def sum_rows(self, word_lists: List[List[str]]) -> List[List[int]]:
+        """Sum the section counts of each list of words in one go.
+        Words which appear twice in a list are counted twice."""
+
+        list_index: List[int] = []
+        rows: List[int] = []
+        for index, words in enumerate(word_lists):
+            for word in words:
+                row = self.word_index.get(word)
+                if row is not None:
+                    list_index.append(index)
+                    rows.append(row)
+
+        list_index_arr = np.array(list_index, dtype=np.int64)
+        rows_arr = np.array(rows, dtype=np.int64)
+
+        # expand each row into the positions of its counts
+        starts = self.indptr[rows_arr]
+        lengths = self.indptr[rows_arr + 1] - starts
+        offsets = np.cumsum(lengths) - lengths
+        positions = (
+            np.repeat(starts - offsets, lengths) + np.arange(lengths.sum()))
+
+        # and add them to the cell of their list and section
+        cells = (
+            np.repeat(list_index_arr, lengths) * len(SECTIONS)
+            + self.cols[positions])
+        totals = np.bincount(
+            cells,
+            weights=self.counts[positions],
+            minlength=len(word_lists) * len(SECTIONS))
+
+        return totals.astype(np.int64).reshape(
+            len(word_lists), len(SECTIONS)).tolist()
+
+
+def get_word_count_fingerprint(pth: ProjectPaths) -> list[tuple[str, int, int]]:
+    """The modification time and size of each word count csv."""
+
+    fingerprint = []
+    for section in SECTIONS:
+        stat = os.stat(pth.word_count_dir.joinpath(f"{section}.csv"))
+        fingerprint.append((section, stat.st_mtime_ns, stat.st_size))
+    return fingerprint
+
+
+def make_word_count_matrix(pth: ProjectPaths) -> WordCountMatrix:
+    """Load the word count matrix from the cache,
+    or rebuild it if any of the word count csvs has changed."""
+
+    print("[green]making word count matrix", end=" ")
+
+    fingerprint = get_word_count_fingerprint(pth)
+    try:
+        with open(pth.word_count_matrix_path, "rb") as f:
+            cache = pickle.load(f)
+        if cache["fingerprint"] == fingerprint:
+            print("[white]cached")
+            return WordCountMatrix(
+                cache["word_index"], cache["indptr"],
+                cache["cols"], cache["counts"])
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError, KeyError):
+        pass
+
+    word_index: dict[str, int] = {}
+    rows: List[np.ndarray] = []
+    cols: List[np.ndarray] = []
+    counts: List[np.ndarray] = []
+
+    for col, section in enumerate(SECTIONS):
+        df = pd.read_csv(
+            pth.word_count_dir.joinpath(f"{section}.csv"),
+            sep="\t", header=None)
+        # the last count of a word wins, like dict()
+        # and words which pandas reads as nan can never match an inflection
+        section_dict = {
+            word: count for word, count in df.values.tolist()
+            if isinstance(word, str)}
+
+        section_rows = np.fromiter(
+            (word_index.setdefault(word, len(word_index))
+                for word in section_dict),
+            dtype=np.int64, count=len(section_dict))
+        rows.append(section_rows)
+        cols.append(np.full(len(section_dict), col, dtype=np.int64))
+        counts.append(np.fromiter(
+            section_dict.values(), dtype=np.int64, count=len(section_dict)))
+
+    rows_arr = np.concatenate(rows)
+    order = np.argsort(rows_arr, kind="stable")
+    indptr = np.zeros(len(word_index) + 1, dtype=np.int64)
+    np.cumsum(
+        np.bincount(rows_arr, minlength=len(word_index)), out=indptr[1:])
+    matrix = WordCountMatrix(
+        word_index, indptr,
+        np.concatenate(cols)[order], np.concatenate(counts)[order])
+
+    temp_path = pth.word_count_matrix_path.with_suffix(".tmp")
+    with open(temp_path, "wb") as f:
+        pickle.dump({
+            "fingerprint": fingerprint,
+            "word_index": matrix.word_index,
+            "indptr": matrix.indptr,
+            "cols": matrix.cols,
+            "counts": matrix.counts,
+        }, f, protocol=pickle.HIGHEST_PROTOCOL)
+    temp_path.replace(pth.word_count_matrix_path)
+
+    print(f"[white]{len(word_index)}")
+    return matrix
 
 
 def colourme(value, hi, low):
@@ -345,26 +351,18 @@ class ParsedResult(TypedDict):
     id: int
     freq_html: str
 
-def _parse_item(i: DpdHeadword, dicts: List[dict]) -> ParsedResult:
-    inflections = i.inflections_list_all    # this include all api ca eva iti
+def _parse_item(
+        i: DpdHeadword,
+        section_counts: List[int],
+        template: Template
+) -> ParsedResult:
 
-    section = 1
     d = {}
-    for dict in dicts:
-        count = 0
-        for inflection in inflections:
-            if inflection in dict:
-                infl = dict.get(inflection)
-                if infl is not None:
-                    count += infl
-
+    for section, count in enumerate(section_counts, start=1):
         d[str(section)] = {"data": count, "class": ""}
-        section += 1
 
-    d_values = [v["data"] for __k__, v, in d.items()]
-
-    value_max = max(d_values)
-    value_min = min(d_values)
+    value_max = max(section_counts)
+    value_min = min(section_counts)
 
     for x in d:
         # add class
@@ -387,7 +385,6 @@ def _parse_item(i: DpdHeadword, dicts: List[dict]) -> ParsedResult:
         elif i.pos in DECLENSIONS:
             map_html += f"""<p class="heading underlined">Exact matches of <b>{superscripter_uni(i.lemma_1)} and its declensions</b> in the Chaṭṭha Saṅgāyana corpus.</p>"""
 
-        template = Template(filename='db/frequency/frequency.html')
         map_html += str(template.render(d=d))
 
     else:
@@ -398,87 +395,49 @@ def _parse_item(i: DpdHeadword, dicts: List[dict]) -> ParsedResult:
 def make_data_dict_and_html(
         pth: ProjectPaths,
         db_session: Session,
-        dicts: List[dict],
-        use_n_processes: int,
+        matrix: WordCountMatrix,
         regenerate_all: bool
 ):
     print("[green]compiling data csvs and html")
 
-    dpd_db = db_session.query(DpdHeadword).all()
+    dpd_db = db_session.query(DpdHeadword) \
+        .options(load_only(
+            DpdHeadword.id,
+            DpdHeadword.lemma_1,
+            DpdHeadword.pos,
+            DpdHeadword.stem,
+            DpdHeadword.pattern,
+            DpdHeadword.inflections,
+            DpdHeadword.inflections_api_ca_eva_iti)) \
+        .all()
 
     def _keep(i: DpdHeadword) -> bool:
         """Filter predicate function which returns whether an item should be kept.
         """
         return (i.pos != "idiom" and \
                 (i.pattern in changed_templates or \
-                 i.lemma_1 in changed_headwords or \
+                 i.id in changed_headwords or \
                  i.id in html_file_missing or \
                  regenerate_all is True))
 
-    # Filter the DpdHeadword and Derived data list, while keeping the related items together in a Tuple.
-    filtered_pairs: List = [i for i in dpd_db if _keep(i)]
+    filtered: List[DpdHeadword] = [i for i in dpd_db if _keep(i)]
 
-    # Split the list into batches, each batch will be assigned to a Process() thread.
-    batches: List = list_into_batches(filtered_pairs, use_n_processes)
+    # the section counts of all headwords in one sparse sum,
+    # inflections_list_all includes all api ca eva iti
+    all_section_counts = matrix.sum_rows(
+        [i.inflections_list_all for i in filtered])
 
-    processes: List[Process] = []
-
-    # The Manager allows shared memory between the worker threads.
-    manager = Manager()
-    results_list: ListProxy = manager.list()
-
-    # Don't need to pass everything as arguments, sub-threads have access to
-    # memory objects of the parent scope. This is a good way to access shared
-    # read-only memory object between threads.
-
-    def _parse_batch(batch: List, __batch_idx__: int):
-        """Takes a batch of items (and the necessary lookup dicts for the work), applies the work with _parse_item_pair() to each work item.
-
-        The results are added to a ListProxy, which is going to be a list() in shared memory from the multiprocessing Manager().
-        """
-
-        if len(batch) == 0:
-            print("[yellow]Batch list has 0 length")
-            return
-
-        res = [_parse_item(i, dicts) for i in batch]
-        results_list.extend(res)
-
-        # Save the details of the first item of the batch for logging and review.
-        first_word = batch[0]
-        first_map_html = res[0]["freq_html"]
+    template = Template(filename="db/frequency/frequency.html")
+    add_to_db: List[ParsedResult] = [
+        _parse_item(i, section_counts, template)
+        for i, section_counts in zip(filtered, all_section_counts)]
 
+    # Save the details of the first item for logging and review.
+    if add_to_db:
         with open(
             pth.freq_html_dir.joinpath(
-                first_word.lemma_1).with_suffix(".html"), "w") as f:
-            f.write(first_map_html)
-
-    for batch_idx, batch in enumerate(batches):
-        # Assign a Process() thread to each batch list.
-        p = Process(target=_parse_batch, args=(batch, batch_idx,))
-
-        # Start the Process's target function, i.e. _parse_batch()
-        p.start()
-
-        # Keep a handle to the process.
-        processes.append(p)
-
-    # At this point the thread workers are started.
-    #
-    # However, the main thread will not automatically wait for sub-threads to
-    # complete, it would simply continue (and exit), terminating the worker
-    # threads before they complete.
-
-    # Process.join() blocks the main thread (i.e. makes it wait) until the
-    # process whose join() method is called terminates.
-    for p in processes:
-        p.join()
-
-    # At this point all worker processes are completed and the main thread will
-    # continue.
-
-    # Convert the ListProxy from Manager() back to a regular list()
-    add_to_db: List[ParsedResult] = list(results_list)
+                filtered[0].lemma_1).with_suffix(".html"), "w") as f:
+            f.write(add_to_db[0]["freq_html"])
 
     # Add the results to the database.
     print("[green]adding to db", end=" ")
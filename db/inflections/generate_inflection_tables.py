@@ -5,9 +5,14 @@
 import re
 import json
 import pickle
+import psutil
 
+from multiprocessing import Pool
+from sqlalchemy import update
+
+from db.change_journal import get_changes, save_checkpoint
 from db.db_helpers import get_db_session
-from db.models import DpdHeadword, InflectionTemplates, DbInfo
+from db.models import DpdHeadword, InflectionTemplates
 
 from tools.configger import config_test, config_update
 from tools.tic_toc import tic, toc
@@ -17,6 +22,9 @@ from tools.superscripter import superscripter_uni
 from tools.paths import ProjectPaths
 from tools.printer import p_title, p_green, p_red, p_yes, p_green_title
 
+# headwords per batch sent to a worker
+BATCH_SIZE = 500
+
 
 class GlobalVars():
     """Globally used variables."""
@@ -33,13 +41,9 @@ class GlobalVars():
         .filter(DpdHeadword.pattern != "") \
         .all()
 
-    changed_templates_db: DbInfo = db_session \
-        .query(DbInfo) \
-        .filter_by(key="changed_templates_list") \
-        .first()
-    
-    changed_templates = changed_templates_db.value_unpack
-    changed_headwords: list = []
+    changed_templates: set[str] = set()
+    changed_headwords: set[str] = set()
+    journal_seq = 0
     updated_counter = 0
 
     # all tipitaka words
@@ -55,13 +59,6 @@ class GlobalVars():
     else:
         regenerate_all: bool = False
 
-    # current headword
-    i: DpdHeadword
-
-    # generated data
-    inflections_html: str
-    inflections_list: list[str]
-
 
 def test_missing_stem(g: GlobalVars) -> None:
     """Test for missing stem in db."""
@@ -106,36 +103,23 @@ def test_wrong_pattern(g: GlobalVars) -> None:
     p_yes("ok")
 
 
-def test_changes_in_stem_pattern(g: GlobalVars) -> None:
-    """Test for changes in stem and pattern since last run."""
+def test_changes_since_last_run(g: GlobalVars) -> None:
+    """Test for headwords and templates changed since last run,
+    in the change journal."""
 
-    p_green_title("testing for changes in stem and pattern")
-    try:
-        with open(g.pth.headword_stem_pattern_dict_path, "rb") as f:
-            old_dict: dict = pickle.load(f)
-    except FileNotFoundError:
-        old_dict = {}
+    p_green_title("testing for changes since last run")
+    g.journal_seq, changes = get_changes(
+        g.db_session, "inflection_tables", "dpd_headwords", "inflection_templates")
 
-    new_dict: dict[str, dict] = {}
+    changed_ids = {int(id) for id in changes["dpd_headwords"]}
     for i in g.dpd_db:
-        new_dict[i.lemma_1] = {
-            "stem": i.stem, "pattern": i.pattern}
-
-    for headword, value in new_dict.items():
-        if value != old_dict.get(headword, None):
-            p_red(f"\t{headword}")
-            g.changed_headwords.append(headword)
-
-    def save_pickle() -> None:
-        headword_stem_pattern_dict: dict[str, dict] = {}
-        for i in g.dpd_db:
-            headword_stem_pattern_dict[i.lemma_1] = {
-                "stem": i.stem, "pattern": i.pattern}
-
-        with open(g.pth.headword_stem_pattern_dict_path, "wb") as f:
-            pickle.dump(headword_stem_pattern_dict, f)
+        if i.id in changed_ids:
+            p_red(f"\t{i.lemma_1}")
+            g.changed_headwords.add(i.lemma_1)
 
-    save_pickle()
+    for pattern in changes["inflection_templates"]:
+        p_red(f"\t{pattern}")
+        g.changed_templates.add(pattern)
 
 
 def test_missing_inflection_list_html(g: GlobalVars) -> None:
@@ -145,94 +129,180 @@ def test_missing_inflection_list_html(g: GlobalVars) -> None:
     for i in g.dpd_db:
         if not i.inflections:
             p_red(f"\t{i.lemma_1}")
-            g.changed_headwords.append(i.lemma_1)
+            g.changed_headwords.add(i.lemma_1)
     
 
-def generate_inflection_table(g: GlobalVars):
-    """Generate the inflection table based on stem + pattern and template"""
+class CompiledTemplate():
+    """An inflection template parsed once into a skeleton,
+    which doesn't depend on the stem:
+    the inflections, and the html parts before, between and after them."""
+
+    def __init__(self, template: InflectionTemplates) -> None:
+        self.pattern: str = template.pattern
+        self.like: str = template.like
+        self.inflections: list[str] = []
+        self.html_parts: list[str] = []
+
+        table_data = json.loads(template.data)
+        html: str = "<table class='inflection'>"
+
+        # data is a nest of lists
+        # list[] table
+        # list[[]] row
+        # list[[[]]] cell
+        # row 0 is the top header
+        # column 0 is the grammar header
+        # odd rows > 0 are inflections
+        # even rows > 0 are grammar info
+
+        for row_number, row_data in enumerate(table_data):
+            html += "<tr>"
+            for column_number, cell_data in enumerate(row_data):
+                if row_number == 0:
+                    if column_number == 0:
+                        html += "<th></th>"
+                    if column_number % 2 == 1:
+                        html += f"<th>{cell_data[0]}</th>"
+                elif row_number > 0:
+                    if column_number == 0:
+                        html += f"<th>{cell_data[0]}</th>"
+                    elif column_number % 2 == 1 and column_number > 0:
+                        title: str = [row_data[column_number + 1]][0][0]
+
+                        for inflection in cell_data:
+                            if not inflection:
+                                html += f"<td title='{title}'></td>"
+                            else:
+                                if len(cell_data) == 1:
+                                    before, after = f"<td title='{title}'>", "</td>"
+                                else:
+                                    if inflection == cell_data[0]:
+                                        before, after = f"<td title='{title}'>", "<br>"
+                                    elif inflection != cell_data[-1]:
+                                        before, after = "", "<br>"
+                                    else:
+                                        before, after = "", "</td>"
+
+                                # the word goes in between
+                                self.html_parts.append(html + before)
+                                self.inflections.append(inflection)
+                                html = after
+
+            html += "</tr>"
+        html += "</table>"
+        self.html_parts.append(html)
+
+    def render(self, stem: str, all_tipitaka_words: set[str]) -> tuple[str, list[str]]:
+        """Return the html table and the inflected words of a stem."""
+
+        html_parts: list[str] = []
+        words_clean: list[str] = []
+        for html_part, inflection in zip(self.html_parts, self.inflections):
+            word_clean = f"{stem}{inflection}"
+            if word_clean in all_tipitaka_words:
+                word = f"{stem}<b>{inflection}</b>"
+            else:
+                word = f"<span class='gray'>{stem}<b>{inflection}</b></span>"
+            html_parts.append(html_part)
+            html_parts.append(word)
+            words_clean.append(word_clean)
+        html_parts.append(self.html_parts[-1])
+
+        return "".join(html_parts), words_clean
+
+
+def compile_templates(g: GlobalVars) -> dict[str, CompiledTemplate]:
+    """Compile each inflection template once."""
 
-    i = g.i
+    compiled_templates: dict[str, CompiledTemplate] = {}
+    for t in g.inflection_templates_db:
+        if t.data is not None and t.pattern not in compiled_templates:
+            compiled_templates[t.pattern] = CompiledTemplate(t)
+    return compiled_templates
 
-    if i.it is None or i.it.data is None:
-        p_red(f"ERROR: {i.id} {i.lemma_1} {i.pattern} does not exist")
-        return "", []
 
-    table_data = json.loads(i.it.data)
-    g.inflections_list = [i.lemma_clean]
+def generate_inflection_table(
+    headword: tuple[int, str, str, str, str, str],
+    template: CompiledTemplate,
+    all_tipitaka_words: set[str],
+) -> tuple[str, list[str]]:
+    """Generate the inflection table based on stem + pattern and template.
+    headword is (id, lemma_1, lemma_clean, pos, stem, pattern)"""
+
+    __id__, lemma_1, lemma_clean, pos, stem, pattern = headword
 
     # heading
     html: str = "<p class='heading'>"
-    html += f"<b>{superscripter_uni(i.lemma_1)}</b> is <b>{i.pattern}</b> "
-    if i.it.like != "irreg":
-        if i.pos in CONJUGATIONS:
+    html += f"<b>{superscripter_uni(lemma_1)}</b> is <b>{pattern}</b> "
+    if template.like != "irreg":
+        if pos in CONJUGATIONS:
             html += "conjugation "
-        elif i.pos in DECLENSIONS:
+        elif pos in DECLENSIONS:
             html += "declension "
-        html += f"(like <b>{i.it.like})</b>"
+        html += f"(like <b>{template.like})</b>"
     else:
-        if i.pos in CONJUGATIONS:
+        if pos in CONJUGATIONS:
             html += "conjugation "
-        if i.pos in DECLENSIONS:
+        if pos in DECLENSIONS:
             html += "declension "
         html += "(irregular)"
     html += "</p>"
 
-    html += "<table class='inflection'>"
-    stem = re.sub(r"\!|\*", "", i.stem)
-
-    # data is a nest of lists
-    # list[] table
-    # list[[]] row
-    # list[[[]]] cell
-    # row 0 is the top header
-    # column 0 is the grammar header
-    # odd rows > 0 are inflections
-    # even rows > 0 are grammar info
-
-    for row in enumerate(table_data):
-        row_number: int = row[0]
-        row_data: list[list] = row[1]
-        html += "<tr>"
-        for column in enumerate(row_data):
-            column_number: int = column[0]
-            cell_data: list = column[1]
-            if row_number == 0:
-                if column_number == 0:
-                    html += "<th></th>"
-                if column_number % 2 == 1:
-                    html += f"<th>{cell_data[0]}</th>"
-            elif row_number > 0:
-                if column_number == 0:
-                    html += f"<th>{cell_data[0]}</th>"
-                elif column_number % 2 == 1 and column_number > 0:
-                    title: str = [row_data[column_number + 1]][0][0]
-
-                    for inflection in cell_data:
-                        if not inflection:
-                            html += f"<td title='{title}'></td>"
-                        else:
-                            word_clean = f"{stem}{inflection}"
-                            if word_clean in g.all_tipitaka_words:
-                                word = f"{stem}<b>{inflection}</b>"
-                            else:
-                                word = f"<span class='gray'>{stem}<b>{inflection}</b></span>"
+    stem = re.sub(r"\!|\*", "", stem)
+    table_html, words_clean = template.render(stem, all_tipitaka_words)
 
-                            if len(cell_data) == 1:
-                                html += f"<td title='{title}'>{word}</td>"
-                            else:
-                                if inflection == cell_data[0]:
-                                    html += f"<td title='{title}'>{word}<br>"
-                                elif inflection != cell_data[-1]:
-                                    html += f"{word}<br>"
-                                else:
-                                    html += f"{word}</td>"
-                            if word_clean not in g.inflections_list:
-                                g.inflections_list.append(word_clean)
+    # the headword first, then each inflection once, in table order
+    inflections_list = list(dict.fromkeys([lemma_clean, *words_clean]))
 
-        html += "</tr>"
-    html += "</table>"
+    return html + table_html, inflections_list
 
-    g.inflections_html = html
+
+_worker_templates: dict[str, CompiledTemplate]
+_worker_all_tipitaka_words: set[str]
+
+
+def _init_inflection_worker(
+    compiled_templates: dict[str, CompiledTemplate],
+    all_tipitaka_words: set[str],
+) -> None:
+    global _worker_templates, _worker_all_tipitaka_words
+    _worker_templates = compiled_templates
+    _worker_all_tipitaka_words = all_tipitaka_words
+
+
+def _generate_inflections_batch(
+    batch: list[tuple[int, str, str, str, str, str]]
+) -> list[dict]:
+    """Generate the inflections and html of a batch of headwords,
+    as DpdHeadword column values for a bulk update."""
+
+    results = []
+    for headword in batch:
+        id, lemma_1, lemma_clean, pos, stem, pattern = headword
+
+        template = _worker_templates.get(pattern)
+        if template is None:
+            p_red(f"ERROR: {id} {lemma_1} {pattern} does not exist")
+            continue
+
+        inflections_html, inflections_list = generate_inflection_table(
+            headword, template, _worker_all_tipitaka_words)
+
+        if "!" in stem:
+            # in this case the headword itself is inflected
+            # add the html table and clean headword 
+            inflections = lemma_clean
+        else:
+            # in this case it's a normal headword
+            # add the html table and inflections list
+            inflections = ",".join(inflections_list)
+
+        results.append({
+            "id": id,
+            "inflections": inflections,
+            "inflections_html": inflections_html})
+
+    return results
 
 
 def run_tests(g: GlobalVars):
@@ -241,41 +311,50 @@ def run_tests(g: GlobalVars):
     test_missing_stem(g)
     test_missing_pattern(g)
     test_wrong_pattern(g)
-    test_changes_in_stem_pattern(g)
+    test_changes_since_last_run(g)
     test_missing_inflection_list_html(g)
 
 
-def process_inflection(g: GlobalVars):
-    """Process inflection for each headword"""
+def process_inflections(g: GlobalVars):
+    """Process inflections of each headword which needs them,
+    in parallel, and update the db in bulk."""
 
-    i = g.i
+    headwords: list[tuple[int, str, str, str, str, str]] = []
+    updates: list[dict] = []
 
-    test1 = i.lemma_1 in g.changed_headwords
-    test2 = i.pattern in g.changed_templates
-    test3 = g.regenerate_all is True
+    for i in g.dpd_db:
+        test1 = i.lemma_1 in g.changed_headwords
+        test2 = i.pattern in g.changed_templates
+        test3 = g.regenerate_all is True
+
+        if test1 or test2 or test3:
+            if i.pattern:
+                headwords.append(
+                    (i.id, i.lemma_1, i.lemma_clean, i.pos, i.stem, i.pattern))
+            else:
+                # in this case it's an indeclinable
+                # don't add the html table, only the clean headword
+                updates.append({"id": i.id, "inflections": i.lemma_clean})
+                g.updated_counter += 1
 
-    if test1 or test2 or test3:
-        if i.pattern:
-            generate_inflection_table(g)
+    batches = [
+        headwords[start:start + BATCH_SIZE]
+        for start in range(0, len(headwords), BATCH_SIZE)]
 
-            if "!" in i.stem:
-                # in this case the headword itself is inflected
-                # add the html table and clean headword 
-                i.inflections = i.lemma_clean
-                i.inflections_html = g.inflections_html
-            
-            else:
-                # in this case it's a normal headword
-                # add the html table and inflections list
-                i.inflections = ",".join(g.inflections_list)                
-                i.inflections_html = g.inflections_html
-        
-        else:
-            # in this case it's an indeclinable
-            # don't add the html table, only the clean headword
-            i.inflections = i.lemma_clean
-        
-        g.updated_counter += 1
+    num_logical_cores = psutil.cpu_count()
+
+    with Pool(
+        processes=num_logical_cores,
+        initializer=_init_inflection_worker,
+        initargs=(compile_templates(g), g.all_tipitaka_words),
+    ) as pool:
+        for results in pool.imap_unordered(_generate_inflections_batch, batches):
+            updates.extend(results)
+            g.updated_counter += len(results)
+
+    # bulk update by primary key
+    if updates:
+        g.db_session.execute(update(DpdHeadword), updates)
 
 
 def main():
@@ -288,20 +367,18 @@ def main():
         run_tests(g)
     else:
         test_wrong_pattern(g)
+        test_changes_since_last_run(g)
     
     p_green("generating html tables and lists")
-    for g.i in g.dpd_db:
-        process_inflection(g)
+    process_inflections(g)
     p_yes(g.updated_counter)
 
     p_green("committing to db")
+    save_checkpoint(g.db_session, "inflection_tables", g.journal_seq)
     g.db_session.commit()
     g.db_session.close()
     p_yes(g.updated_counter)
 
-    with open(g.pth.changed_headwords_path, "wb") as f:
-        pickle.dump(g.changed_headwords, f)
-
     if config_test("regenerate", "inflections", "yes"):
         config_update("regenerate", "inflections", "no")
 
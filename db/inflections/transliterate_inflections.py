@@ -4,13 +4,13 @@
 """
 Transliterate all inflections into Sinhala, Devanagari and Thai.
 - Regenerate from scratch OR
-- Update if stem & pattern has changed or inflection template has changed.
+- Update if the headword or its inflection template has changed since last run,
+  according to the change journal.
 Save into database.
 """
 
 
 import json
-import pickle
 
 from aksharamukha import transliterate
 from subprocess import check_output
@@ -20,6 +20,7 @@ import psutil
 from multiprocessing.managers import ListProxy
 from multiprocessing import Process, Manager
 
+from db.change_journal import get_changes, save_checkpoint
 from db.db_helpers import get_db_session
 from db.models import DpdHeadword
 
@@ -34,8 +35,8 @@ from tools.utils import list_into_batches
 def _parse_batch(
     batch: List[DpdHeadword],
     pth: ProjectPaths,
-    changed_headwords: list,
-    changed_templates: list,
+    changed_headwords: set,
+    changed_templates: set,
     regenerate_all: bool,
     results_list: ListProxy,
     batch_idx: int,
@@ -195,14 +196,17 @@ def main():
     db_session = get_db_session(pth.dpd_db_path)
     dpd_db = db_session.query(DpdHeadword).all()
 
-    with open(pth.changed_headwords_path, "rb") as f:
-        changed_headwords: list = pickle.load(f)
-
-    with open(pth.template_changed_path, "rb") as f:
-        changed_templates: list = pickle.load(f)
-
     tic()
     p_title("transliterating inflections")
+
+    p_green("changes since last run")
+    journal_seq, changes = get_changes(
+        db_session, "transliterate_inflections",
+        "dpd_headwords", "inflection_templates")
+    changed_ids = {int(id) for id in changes["dpd_headwords"]}
+    changed_headwords: set = {i.lemma_1 for i in dpd_db if i.id in changed_ids}
+    changed_templates: set = changes["inflection_templates"]
+    p_yes(len(changed_headwords) + len(changed_templates))
     
     p_green("regenerate all")
 
@@ -266,6 +270,7 @@ def main():
             i.inflections_thai = ",".join(list(translit_dict[i.lemma_1]["thai"]))
             translit_counter += 1
 
+    save_checkpoint(db_session, "transliterate_inflections", journal_seq)
     db_session.commit()
     db_session.close()
     p_yes(translit_counter)
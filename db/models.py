@@ -2,6 +2,8 @@
 import json
 import re
 
+from functools import cache
+
 from typing import List
 from typing import Optional
 
@@ -38,6 +40,14 @@ class Base(DeclarativeBase):
     pass
 
 
+@cache
+def _cache_load():
+    """tools.cache_load, imported on first use, as it imports this module.
+    Cached, as an import statement costs more than the set lookup."""
+    import tools.cache_load
+    return tools.cache_load
+
+
 class DbInfo(Base):
     """
     Store general key-value data such as
@@ -58,6 +68,25 @@ class DbInfo(Base):
     def value_unpack(self) -> list[str]:
         return json.loads(self.value)
 
+
+class ChangeJournal(Base):
+    """
+    The content hash of each row of the tracked tables,
+    and the sequence number of the last time it changed.
+    Deleted rows keep their key with an empty hash.
+    See db/change_journal.py
+    """
+
+    __tablename__ = "change_journal"
+    table_name: Mapped[str] = mapped_column(primary_key=True)
+    row_key: Mapped[str] = mapped_column(primary_key=True)
+    row_hash: Mapped[str] = mapped_column(default='')
+    seq: Mapped[int] = mapped_column(default=0, index=True)
+
+    def __repr__(self) -> str:
+        return f"ChangeJournal: {self.table_name} {self.row_key} {self.seq}"
+
+
 class InflectionTemplates(Base):
     """Inflection templates for generating html tables."""
 
@@ -1075,14 +1104,12 @@ class DpdHeadword(Base):
         return bool(self.family_word)
 
     @property
-    def cf_set(self) -> set[str]:
-        from tools.cache_load import load_cf_set
-        return load_cf_set()
+    def cf_set(self) -> frozenset[str]:
+        return _cache_load().load_cf_set()
 
     @property
-    def idioms_set(self) -> set[str]:
-        from tools.cache_load import load_idioms_set
-        return load_idioms_set( )
+    def idioms_set(self) -> frozenset[str]:
+        return _cache_load().load_idioms_set()
     
     @property
     def needs_compound_family_button(self) -> bool:
@@ -1092,13 +1119,8 @@ class DpdHeadword(Base):
             and "sandhi" not in self.pos
             and "idiom" not in self.pos
             and "?" not in self.compound_type
-            and(
-                any(item in self.cf_set for item in self.family_compound_list) 
-                or (
-                    self.lemma_clean in self.cf_set #type:ignore
-                    and not self.family_compound
-                )
-            )
+            # family_compound_list falls back to [lemma_clean]
+            and not self.cf_set.isdisjoint(self.family_compound_list)
         )
 
         # alternative logic
@@ -1118,29 +1140,17 @@ class DpdHeadword(Base):
             and "sandhi" not in self.pos
             and "idiom" not in self.pos
             and len(self.lemma_clean) < 30
-            and(
-                any(item in self.cf_set for item in self.family_compound_list)
-                or (
-                    self.lemma_clean in self.cf_set #type:ignore
-                    and not self.family_compound
-                )
-            )
+            # family_compound_list falls back to [lemma_clean]
+            and not self.cf_set.isdisjoint(self.family_compound_list)
         )
 
     @property
     def needs_idioms_button(self) -> bool:
         return bool(
             self.meaning_1
-            and(
-                any(
-                    item in self.idioms_set
-                    for item in self.family_idioms_list
-                )
-                or (
-                    not self.family_idioms_list
-                    and self.lemma_clean in self.idioms_set
-                )
-            ))
+            # family_idioms_list falls back to [lemma_clean]
+            and not self.idioms_set.isdisjoint(self.family_idioms_list)
+        )
 
     @property
     def needs_set_button(self) -> bool:
@@ -6,7 +6,7 @@ import re
 from db.variants.variants_modules import VariantsDict
 
 from tools.goldendict_exporter import DictEntry, DictInfo, DictVariables
-from tools.goldendict_exporter import export_to_goldendict_with_pyglossary
+from tools.goldendict_exporter import export_to_goldendict
 from tools.mdict_exporter import export_to_mdict
 from tools.niggahitas import add_niggahitas
 from tools.paths import ProjectPaths
@@ -122,7 +122,7 @@ def export_to_goldendict_mdict(
         icon_path=pth.icon_path,
     )
 
-    export_to_goldendict_with_pyglossary(
+    export_to_goldendict(
         dict_info, 
         dict_vars,
         dict_data, 
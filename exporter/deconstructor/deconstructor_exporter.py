@@ -2,10 +2,20 @@
 
 """Export Deconstructor To GoldenDict and MDict formats."""
 
+import hashlib
+import pickle
+import psutil
 import re
+
+from itertools import chain
 from mako.template import Template
 from minify_html import minify
+from multiprocessing import Pool
+from pathlib import Path
 from rich import print
+from sqlalchemy import func
+from sqlalchemy.orm import load_only
+from typing import Iterable, Iterator
 
 from exporter.goldendict.helpers import TODAY
 
@@ -19,12 +29,25 @@ from tools.printer import p_green, p_title, p_yes
 from tools.sandhi_contraction import make_sandhi_contraction_dict
 from tools.tic_toc import tic, toc, bip, bop
 from tools.goldendict_exporter import DictEntry
-from tools.goldendict_exporter import DictInfo, DictVariables, export_to_goldendict_with_pyglossary
+from tools.goldendict_exporter import DictInfo, DictVariables, export_to_goldendict
 from tools.mdict_exporter import export_to_mdict
 
 from exporter.goldendict.ru_components.tools.paths_ru import RuPaths
 from tools.utils import squash_whitespaces
 
+rules_pattern = re.compile(r".+\[(.+)\]")
+decon_pattern = re.compile(r" \[.+")
+
+# lookup rows per batch sent to a worker
+BATCH_SIZE = 250
+
+# change this when the html is made differently
+CACHE_VERSION = 2
+
+# the cached html has this instead of the date,
+# which is filled in when the entry is made
+TODAY_PLACEHOLDER = "{{today}}"
+
 
 class ProgData():
     """Global variables."""
@@ -52,75 +75,230 @@ class ProgData():
 
 
 def make_deconstructor_dict_data(g: ProgData) -> None:
-    """Prepare data set for GoldenDict of deconstructions and synonyms."""
+    """Prepare data set for GoldenDict of deconstructions and synonyms.
+    Entries are rendered in parallel, and entries which have not changed
+    since the last build reuse their html from the cache."""
 
     p_green("making deconstructor data list")
 
     db_session = get_db_session(g.pth.dpd_db_path)
+    sandhi_contractions: dict = make_sandhi_contraction_dict(db_session)
+    deconstructor_db_length: int = db_session \
+        .query(func.count(Lookup.lookup_key)) \
+        .filter(Lookup.deconstructor!="") \
+        .scalar()
     deconstructor_db = db_session \
         .query(Lookup) \
+        .options(load_only(
+            Lookup.lookup_key, Lookup.deconstructor,
+            Lookup.sinhala, Lookup.devanagari, Lookup.thai)) \
         .filter(Lookup.deconstructor!="") \
-        .all()
-    deconstructor_db_length: int = len(deconstructor_db)
-    sandhi_contractions: dict = make_sandhi_contraction_dict(db_session)
-    dict_data: list = []
+        .yield_per(5000)
+    dict_data: list[DictEntry] = []
 
+    # the header is the same for every entry
     header_templ = Template(filename=str(g.pth.deconstructor_header_templ_path))
-    deconstructor_header = str(header_templ.render(css="", js=""))
+    deconstructor_header = squash_whitespaces(
+        str(header_templ.render(css="", js="")))
 
     if g.lang == "en":
-        deconstructor_templ = Template(filename=str(g.pth.deconstructor_templ_path))
+        deconstructor_templ_path = g.pth.deconstructor_templ_path
     elif g.lang == "ru":
-        deconstructor_templ = Template(filename=str(g.rupth.deconstructor_templ_path))
+        deconstructor_templ_path = g.rupth.deconstructor_templ_path
+
+    # a cache for each language, so they don't invalidate each other
+    cache_path = g.pth.deconstructor_html_cache_path
+    cache_path = cache_path.with_name(f"{cache_path.name}_{g.lang}")
+    fingerprint = make_cache_fingerprint(deconstructor_templ_path, g.lang)
+    html_cache = load_html_cache(cache_path, fingerprint)
+    reused_count = 0
+    today = str(TODAY)
+
+    p_yes(deconstructor_db_length)
+
+    num_logical_cores = psutil.cpu_count()
+    window_size = num_logical_cores * 4 * BATCH_SIZE
+
+    # the new cache is written a window at a time, via a temp file
+    # so an interrupted build can't leave half a cache
+    cache_temp_path = cache_path.with_suffix(".tmp")
+    with (
+        Pool(
+            processes=num_logical_cores,
+            initializer=_init_deconstructor_worker,
+            initargs=(deconstructor_templ_path,),
+        ) as pool,
+        open(cache_temp_path, "wb") as cache_file,
+    ):
+        pickle.dump(
+            {"fingerprint": fingerprint}, cache_file,
+            protocol=pickle.HIGHEST_PROTOCOL)
+
+        counter = 0
+        for window in _windows(deconstructor_db, window_size):
+
+            # only render what has changed since the last build
+            digests = [make_content_hash(i.deconstructor) for i in window]
+            to_render = [
+                (i.lookup_key, i.deconstructor)
+                for i, digest in zip(window, digests)
+                if html_cache.get(i.lookup_key, (None,))[0] != digest]
+            rendered = iter(chain.from_iterable(pool.map(
+                _render_deconstructor_html_batch,
+                _batches(to_render, BATCH_SIZE))))
+
+            window_cache: dict[str, tuple[bytes, str]] = {}
+            for i, digest in zip(window, digests):
+                # the old entries are not needed after this
+                cached = html_cache.pop(i.lookup_key, None)
+                if cached is not None and cached[0] == digest:
+                    html_string = cached[1]
+                    reused_count += 1
+                else:
+                    html_string = next(rendered)
+                window_cache[i.lookup_key] = (digest, html_string)
+
+                # make synonyms list
+                synonyms = add_niggahitas([i.lookup_key], all=False)
+                if g.lang != "ru":
+                    synonyms.extend(i.sinhala_unpack)
+                    synonyms.extend(i.devanagari_unpack)
+                    synonyms.extend(i.thai_unpack)
+                if i.lookup_key in sandhi_contractions:
+                    contractions = sandhi_contractions[i.lookup_key]["contractions"]
+                    synonyms.extend(contractions)
+
+                dict_data.append(DictEntry(
+                    word=i.lookup_key,
+                    definition_html=deconstructor_header
+                        + html_string.replace(TODAY_PLACEHOLDER, today),
+                    definition_plain="",
+                    synonyms=synonyms
+                ))
+
+                if counter % 50000 == 0:
+                    print(
+                        f"{counter:>10,} / {deconstructor_db_length:<10,} {i.lookup_key[:20]:<20}{bop():>10}")
+                    bip()
+                counter += 1
+
+            pickle.dump(
+                window_cache, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+            # the rows are not needed after this window
+            db_session.expunge_all()
+
+    db_session.close()
+    cache_temp_path.replace(cache_path)
+
+    g.dict_data = dict_data
+    p_yes(len(dict_data))
+    p_green("reused from cache")
+    p_yes(reused_count)
 
-    p_yes(len(deconstructor_db))
 
-    for counter, i in enumerate(deconstructor_db):
-        deconstructions = i.deconstructor_unpack
+def make_content_hash(deconstructor: str) -> bytes:
+    """The hash of what an entry's html is made from.
+    The lookup_key is the key of the cache, so it is not included."""
+    return hashlib.blake2b(deconstructor.encode("utf-8"), digest_size=16).digest()
 
-        # repack the deconstructions into a list of tuples
-        # [0] is the deconstruction, [1] is the rules
-        deconstructions_repack: list[tuple[str, str]] = []
-        for d in deconstructions:
-            rules = re.sub(r".+\[(.+)\]", r"\1", d)     # just whats in-between [...]
-            decon = re.sub(r" \[.+", "", d)             # everything except ' [...]'
-            deconstructions_repack.append((decon, rules))
 
-        html_string: str = ""
-        html_string += "<body>"
-        html_string += str(deconstructor_templ.render(
-            i=i,
-            deconstructions=deconstructions_repack,
-            today=TODAY))
+def make_cache_fingerprint(templ_path: Path, lang: str) -> str:
+    """Everything else the html depends on, except the date,
+    which isn't in the cached html. When any of it changes,
+    the whole cache is out of date."""
 
-        html_string += "</body></html>"
-        
-        html_string = squash_whitespaces(deconstructor_header) + minify(html_string)
-
-        # make synonyms list
-        synonyms = add_niggahitas([i.lookup_key], all=False)
-        if g.lang != "ru":
-            synonyms.extend(i.sinhala_unpack)
-            synonyms.extend(i.devanagari_unpack)
-            synonyms.extend(i.thai_unpack)
-        if i.lookup_key in sandhi_contractions:
-            contractions = sandhi_contractions[i.lookup_key]["contractions"]
-            synonyms.extend(contractions)
-
-        dict_data += [DictEntry(
-            word=i.lookup_key,
-            definition_html=html_string,
-            definition_plain="",
-            synonyms=synonyms
-        )]
-
-        if counter % 50000 == 0:
-            print(
-                f"{counter:>10,} / {deconstructor_db_length:<10,} {i.lookup_key[:20]:<20}{bop():>10}")
-            bip()
+    fingerprint = hashlib.blake2b(digest_size=16)
+    fingerprint.update(templ_path.read_bytes())
+    fingerprint.update(f"{lang}|{CACHE_VERSION}".encode("utf-8"))
+    return fingerprint.hexdigest()
 
-    g.dict_data = dict_data
-    p_yes(len(dict_data))
+
+def load_html_cache(
+    cache_path: Path,
+    fingerprint: str
+) -> dict[str, tuple[bytes, str]]:
+    """Load the {lookup_key: (content_hash, html)} cache of the last build,
+    saved as the fingerprint followed by one dict per window,
+    or an empty one if it is missing, unreadable or out of date."""
+
+    html_cache: dict[str, tuple[bytes, str]] = {}
+    try:
+        with open(cache_path, "rb") as f:
+            header = pickle.load(f)
+            if not isinstance(header, dict) or header.get("fingerprint") != fingerprint:
+                return {}
+            while True:
+                try:
+                    html_cache.update(pickle.load(f))
+                except EOFError:
+                    break
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return {}
+    return html_cache
+
+
+def _windows(iterable: Iterable[Lookup], size: int) -> Iterator[list[Lookup]]:
+    window: list[Lookup] = []
+    for i in iterable:
+        window.append(i)
+        if len(window) == size:
+            yield window
+            window = []
+    if window:
+        yield window
+
+
+def _batches(items: list, size: int) -> list[list]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+_worker_templ: Template
+
+
+def _init_deconstructor_worker(templ_path: Path) -> None:
+    """Compile the template once in each worker process."""
+
+    global _worker_templ
+    _worker_templ = Template(filename=str(templ_path))
+
+
+def _render_deconstructor_html_batch(
+    batch: list[tuple[str, str]]
+) -> list[str]:
+    """Render and minify the html of a batch of (lookup_key, deconstructor)."""
+
+    return [
+        render_deconstructor_html(
+            Lookup(lookup_key=lookup_key, deconstructor=deconstructor),
+            _worker_templ)
+        for lookup_key, deconstructor in batch]
+
+
+def render_deconstructor_html(i: Lookup, deconstructor_templ: Template) -> str:
+    """Render the minified html of one entry, without the header,
+    and with TODAY_PLACEHOLDER instead of the date."""
+
+    deconstructions = i.deconstructor_unpack
+
+    # repack the deconstructions into a list of tuples
+    # [0] is the deconstruction, [1] is the rules
+    deconstructions_repack: list[tuple[str, str]] = []
+    for d in deconstructions:
+        rules = rules_pattern.sub(r"\1", d)     # just whats in-between [...]
+        decon = decon_pattern.sub("", d)        # everything except ' [...]'
+        deconstructions_repack.append((decon, rules))
+
+    html_string: str = ""
+    html_string += "<body>"
+    html_string += str(deconstructor_templ.render(
+        i=i,
+        deconstructions=deconstructions_repack,
+        today=TODAY_PLACEHOLDER))
+
+    html_string += "</body></html>"
+
+    return minify(html_string)
 
 
 def prepare_and_export_to_gd_mdict(g: ProgData) -> None:
@@ -155,7 +333,7 @@ def prepare_and_export_to_gd_mdict(g: ProgData) -> None:
         delete_original=False,
     )
 
-    export_to_goldendict_with_pyglossary(
+    export_to_goldendict(
         dict_info,
         dict_vars,
         g.dict_data)
@@ -8,14 +8,14 @@ from sqlalchemy.sql import func
 # from css_html_js_minify import css_minify, js_minify
 from mako.template import Template
 from minify_html import minify
-from multiprocessing.managers import ListProxy
-from multiprocessing import Process, Manager
-from typing import List, Set, TypedDict, Tuple, Union
+from multiprocessing import Pool
+from typing import Iterator, List, TypedDict, Tuple, Union
 
 from sqlalchemy.orm.session import Session
 
 from exporter.goldendict.helpers import TODAY
 
+from db.db_helpers import get_db_session, iter_headwords
 from db.models import DpdHeadword
 from db.models import DpdRoot
 from db.models import FamilyCompound
@@ -28,7 +28,7 @@ from db.models import SBS
 
 from tools.configger import config_test
 from tools.date_and_time import year_month_day_dash
-from tools.exporter_functions import get_family_compounds, get_family_idioms, get_family_set
+from tools.exporter_functions import FamilyLookup
 from tools.goldendict_exporter import DictEntry
 from tools.meaning_construction import make_meaning_combo_html, make_grammar_line
 from tools.meaning_construction import summarize_construction, degree_of_completion, rus_degree_of_completion
@@ -38,7 +38,7 @@ from tools.pos import CONJUGATIONS, DECLENSIONS, INDECLINABLES
 from tools.printer import p_counter, p_green_title
 from tools.sandhi_contraction import SandhiContractions
 from tools.superscripter import superscripter_uni
-from tools.utils import RenderedSizes, default_rendered_sizes, list_into_batches
+from tools.utils import RenderedSizes, default_rendered_sizes
 from tools.utils import sum_rendered_sizes, squash_whitespaces
 
 from exporter.goldendict.ru_components.tools.paths_ru import RuPaths
@@ -84,8 +84,8 @@ class DpdHeadwordRenderData(TypedDict):
     pth: Union[ProjectPaths, RuPaths]
     word_templates: DpdHeadwordTemplates
     sandhi_contractions: SandhiContractions
-    cf_set: Set[str]
-    idioms_set: Set[str]
+    cf_set: frozenset[str]
+    idioms_set: frozenset[str]
     make_link: bool
     show_id: bool
     show_ebt_count: bool
@@ -275,13 +275,130 @@ def render_pali_word_dpd_html(
 
     return (res, size_dict)
 
+# worker process state, set once per worker by _init_dpd_html_worker
+_worker_db_session: Session
+_worker_render_data: DpdHeadwordRenderData
+_worker_lang: str
+_worker_extended_synonyms: bool
+_worker_show_sbs_data: bool
+
+
+def _init_dpd_html_worker(
+        pth: ProjectPaths,
+        rupth: RuPaths,
+        sandhi_contractions: SandhiContractions,
+        cf_set: frozenset[str],
+        idioms_set: frozenset[str],
+        make_link: bool,
+        show_id: bool,
+        show_ebt_count: bool,
+        show_sbs_data: bool,
+        show_ru_data: bool,
+        extended_synonyms: bool,
+        lang: str,
+) -> None:
+    """Open a db session and compile the templates once per worker."""
+
+    global _worker_db_session, _worker_render_data, _worker_lang
+    global _worker_extended_synonyms, _worker_show_sbs_data
+
+    if lang == "en":
+        paths = pth
+    elif lang == "ru":
+        paths = rupth
+
+    _worker_db_session = get_db_session(pth.dpd_db_path)
+    _worker_render_data = DpdHeadwordRenderData(
+        pth = pth,
+        word_templates = DpdHeadwordTemplates(paths, lang),
+        sandhi_contractions = sandhi_contractions,
+        cf_set = cf_set,
+        idioms_set = idioms_set,
+        make_link = make_link,
+        show_id = show_id,
+        show_ebt_count = show_ebt_count,
+        show_sbs_data = show_sbs_data,
+        show_ru_data = show_ru_data,
+    )
+    _worker_lang = lang
+    _worker_extended_synonyms = extended_synonyms
+    _worker_show_sbs_data = show_sbs_data
+
+
+def _render_dpd_html_batch(ids: List[int]) -> List[Tuple[DictEntry, RenderedSizes]]:
+    """Query and render one batch of headwords in a worker."""
+
+    db_session = _worker_db_session
+    dpd_db = db_session.query(DpdHeadword, FamilyRoot, FamilyWord, SBS, Russian) \
+        .outerjoin(FamilyRoot, DpdHeadword.root_family_key == FamilyRoot.root_family_key) \
+        .outerjoin(FamilyWord, DpdHeadword.family_word == FamilyWord.word_family) \
+        .outerjoin(Russian, DpdHeadword.id == Russian.id) \
+        .outerjoin(SBS, DpdHeadword.id == SBS.id) \
+        .filter(DpdHeadword.id.in_(ids)) \
+        .all()
+
+    # all the family compounds, idioms and sets of the batch in three queries
+    families = FamilyLookup(db_session, [row[0] for row in dpd_db])
+
+    results: List[Tuple[DictEntry, RenderedSizes]] = []
+    for pw, fr, fw, sbs, ru in dpd_db:
+        db_parts = DpdHeadwordDbParts(
+            pali_word = pw,
+            pali_root = pw.rt,
+            sbs = sbs,
+            ru = ru,
+            family_root = fr,
+            family_word = fw,
+            family_compounds = families.family_compounds(pw),
+            family_idioms = families.family_idioms(pw),
+            family_set = families.family_set(pw),
+        )
+        results.append(render_pali_word_dpd_html(
+            db_parts, _worker_render_data, _worker_lang,
+            _worker_extended_synonyms, _worker_show_sbs_data))
+
+    # rendering edits some attributes, don't keep the objects in the session
+    db_session.expunge_all()
+
+    return results
+
+
+def _dpd_headword_id_batches(
+        db_session: Session,
+        lang: str,
+        batch_size: int,
+        data_limit: int,
+) -> Iterator[List[int]]:
+    """Stream headword ids in lemma_1 order, in batches for the workers."""
+
+    filters = []
+    if lang == "ru":
+        filters.append(DpdHeadword.ru.has())
+
+    headwords = iter_headwords(
+        db_session,
+        columns=["id", "lemma_1"],
+        keyset="lemma_1",
+        filters=filters,
+        limit=data_limit)
+
+    batch: List[int] = []
+    for i in headwords:
+        batch.append(i.id)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
 def generate_dpd_html(
         db_session: Session,
         pth: ProjectPaths,
         rupth: RuPaths,
         sandhi_contractions: SandhiContractions,
-        cf_set: Set[str],
-        idioms_set: set[str],
+        cf_set: frozenset[str],
+        idioms_set: frozenset[str],
         make_link=False,
         show_sbs_data=False,
         show_ru_data=False,
@@ -291,13 +408,6 @@ def generate_dpd_html(
 
     p_green_title("generating dpd html")
 
-    if lang == "en":
-        paths = pth
-    elif lang == "ru":
-        paths = rupth
-
-    word_templates = DpdHeadwordTemplates(paths, lang)
-
     if config_test("dictionary", "extended_synonyms", "yes"):
         extended_synonyms: bool = True
     else:
@@ -313,8 +423,6 @@ def generate_dpd_html(
     else:
         show_ebt_count: bool = False
 
-    dpd_data_list: List[DictEntry] = []
-
     if lang == "en":
         pali_words_count = db_session \
             .query(func.count(DpdHeadword.id)) \
@@ -325,113 +433,44 @@ def generate_dpd_html(
             .join(Russian, DpdHeadword.id == Russian.id) \
             .filter(Russian.id.isnot(None)) \
             .scalar()
-    
+
     # limit the data size for testing purposes
     if data_limit != 0:
-        pali_words_count = data_limit
-        
-    # If the work items per loop are too high, low-memory systems will slow down
-    # when multi-threading.
-    #
-    # Setting the threshold to 9 GB to make sure 8 GB systems are covered.
-    low_mem_threshold = 9*1024*1024*1024
-    mem = psutil.virtual_memory()
-    if mem.total < low_mem_threshold:
-        limit = 2000
-    else:
-        limit = 5000
+        pali_words_count = min(data_limit, pali_words_count)
 
-    offset = 0
+    # the main process only pages through ids,
+    # the workers query, render and send back small batches
+    batch_size = 100
 
-    manager = Manager()
-    dpd_data_results_list: ListProxy = manager.list()
-    rendered_sizes_results_list: ListProxy = manager.list()
+    dpd_data_list: List[DictEntry] = []
+    rendered_sizes: List[RenderedSizes] = []
     num_logical_cores = psutil.cpu_count()
     p_green_title(f"running with {num_logical_cores} cores")
 
-    while offset <= pali_words_count:
-
-        dpd_db_query = db_session.query(DpdHeadword, FamilyRoot, FamilyWord, SBS, Russian) \
-            .outerjoin(FamilyRoot, DpdHeadword.root_family_key == FamilyRoot.root_family_key) \
-            .outerjoin(FamilyWord, DpdHeadword.family_word == FamilyWord.word_family) \
-            .outerjoin(Russian, DpdHeadword.id == Russian.id) \
-            .outerjoin(SBS, DpdHeadword.id == SBS.id) \
-            .order_by(DpdHeadword.lemma_1) \
-        
-        if lang == "ru":
-            dpd_db_query = dpd_db_query.filter(
-                    Russian.id.isnot(None)
-                )
-
-        dpd_db = dpd_db_query.limit(limit).offset(offset).all()
-
-        def _add_parts(i: DpdHeadwordDbRowItems) -> DpdHeadwordDbParts:
-            pw: DpdHeadword
-            fr: FamilyRoot
-            fw: FamilyWord
-            sbs: SBS
-            ru: Russian
-            pw, fr, fw, sbs, ru = i
-
-            return DpdHeadwordDbParts(
-                pali_word = pw,
-                pali_root = pw.rt,
-                sbs = sbs,
-                ru = ru,
-                family_root = fr,
-                family_word = fw,
-                family_compounds = get_family_compounds(pw),
-                family_idioms = get_family_idioms(pw),
-                family_set = get_family_set(pw),
-            )
-
-        dpd_db_data = [_add_parts(i.tuple()) for i in dpd_db]
-
-        rendered_sizes: List[RenderedSizes] = []
-
-        batches: List[List[DpdHeadwordDbParts]] = list_into_batches(dpd_db_data, num_logical_cores)
-
-        processes: List[Process] = []
-
-        render_data = DpdHeadwordRenderData(
-            pth = pth,
-            word_templates = word_templates,
-            sandhi_contractions = sandhi_contractions,
-            cf_set = cf_set,
-            idioms_set = idioms_set,
-            make_link = make_link,
-            show_id = show_id,
-            show_ebt_count = show_ebt_count,
-            show_sbs_data = show_sbs_data,
-            show_ru_data = show_ru_data,
-        )
-
-        def _parse_batch(batch: List[DpdHeadwordDbParts]):
-            res: List[Tuple[DictEntry, RenderedSizes]] = \
-                [render_pali_word_dpd_html(i, render_data, lang, extended_synonyms, show_sbs_data) for i in batch]
-
-            for i, j in res:
-                dpd_data_results_list.append(i)
-                rendered_sizes_results_list.append(j)
+    id_batches = _dpd_headword_id_batches(
+        db_session, lang, batch_size, data_limit)
 
-        for batch in batches:
-            p = Process(target=_parse_batch, args=(batch,))
+    with Pool(
+        processes=num_logical_cores,
+        initializer=_init_dpd_html_worker,
+        initargs=(
+            pth, rupth, sandhi_contractions, cf_set, idioms_set, make_link,
+            show_id, show_ebt_count, show_sbs_data, show_ru_data,
+            extended_synonyms, lang),
+    ) as pool:
 
-            p.start()
-            processes.append(p)
+        counter = 0
+        for results in pool.imap_unordered(_render_dpd_html_batch, id_batches):
+            for dict_entry, sizes in results:
+                dpd_data_list.append(dict_entry)
+                rendered_sizes.append(sizes)
 
-        for p in processes:
-            p.join()
-        
-        if offset % limit == 0:
-            p_counter(offset, pali_words_count, batch[0]["pali_word"].lemma_1)
+                if counter % 5000 == 0:
+                    p_counter(counter, pali_words_count, dict_entry.word)
+                counter += 1
 
-        offset += limit
-
-    dpd_data_list = list(dpd_data_results_list)
-    rendered_sizes = list(rendered_sizes_results_list)
     total_sizes = sum_rendered_sizes(rendered_sizes)
-    
+
     return dpd_data_list, total_sizes
 
 
@@ -518,8 +557,8 @@ def render_button_box_templ(
         __pth__: Union[ProjectPaths, RuPaths],
         i: DpdHeadword,
         sbs: SBS,
-        cf_set: Set[str],
-        idioms_set: Set[str],
+        cf_set: frozenset[str],
+        idioms_set: frozenset[str],
         button_box_templ: Template,
         lang="en",
         show_sbs_data=False
@@ -848,7 +887,7 @@ def render_family_compound_templ(
         __pth__: Union[ProjectPaths, RuPaths],
         i: DpdHeadword,
         fc: List[FamilyCompound],
-        cf_set: Set[str],
+        cf_set: frozenset[str],
         family_compound_templ: Template
 ) -> str:
     """render html table of all words containing the same compound"""
@@ -865,7 +904,7 @@ def render_family_idioms_templ(
         __pth__: Union[ProjectPaths, RuPaths],
         i: DpdHeadword,
         fi: List[FamilyIdiom],
-        idioms_set: Set[str],
+        idioms_set: frozenset[str],
         family_idioms_template: Template
 ) -> str:
     """render html table of all words containing the same compound"""
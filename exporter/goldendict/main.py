@@ -21,7 +21,7 @@ from exporter.goldendict.ru_components.tools.paths_ru import RuPaths
 from tools.cache_load import load_cf_set, load_idioms_set
 from tools.configger import config_read, config_test
 from tools.goldendict_exporter import DictEntry, DictInfo, DictVariables
-from tools.goldendict_exporter import export_to_goldendict_with_pyglossary
+from tools.goldendict_exporter import export_to_goldendict
 from tools.mdict_exporter import export_to_mdict
 from tools.paths import ProjectPaths
 from tools.printer import p_green, p_green_title, p_title, p_yes
@@ -39,8 +39,8 @@ class ProgData():
         self.rupth = RuPaths()
         self.db_session: Session = get_db_session(self.pth.dpd_db_path)
         self.sandhi_contractions = make_sandhi_contraction_dict(self.db_session)
-        self.cf_set: set = load_cf_set()
-        self.idioms_set: set = load_idioms_set()
+        self.cf_set: frozenset[str] = load_cf_set()
+        self.idioms_set: frozenset[str] = load_idioms_set()
         self.roots_count_dict = make_roots_count_dict(self.db_session)
         self.rendered_sizes: List[RenderedSizes] = []
         self.data_limit = int(config_read("dictionary", "data_limit") or "0")
@@ -186,10 +186,8 @@ def prepare_export_to_goldendict_mdict(g: ProgData) -> None:
         delete_original=False
     )   
 
-    export_to_goldendict_with_pyglossary(
-        dict_info, dict_var, g.dict_data,
-        zip_synonyms=True,
-        include_slob=False
+    export_to_goldendict(
+        dict_info, dict_var, g.dict_data
     )
 
     if g.make_mdict and g.data_limit == 0:
@@ -9,6 +9,8 @@
 
 import re
 import csv
+
+from functools import lru_cache
 from rich import print
 
 from db.models import DpdHeadword, Russian
@@ -117,19 +119,43 @@ def make_ru_meaning_for_ebook(i: DpdHeadword, ru: Russian) -> str:
 
 
 abbreviations_dict = None
+abbreviation_patterns = None
+
+
+def load_abbreviation_patterns():
+    """Compile the pattern of each abbreviation once, longest first:
+    [(abbreviation, pattern, russian)]"""
+
+    global abbreviations_dict, abbreviation_patterns
+
+    if abbreviation_patterns is None:
+        if abbreviations_dict is None:
+            abbreviations_dict = load_abbreviations_dict(pth.abbreviations_tsv_path)
+
+        abbreviation_patterns = []
+        for abbr, russian in abbreviations_dict.items():
+            # Escape special characters in the abbreviation
+            escaped_abbr = re.escape(abbr)
+            # Adjust the regex pattern to match abbreviations with optional "+" prefix and spaces
+            pattern = re.compile(r'\b\+' + escaped_abbr + r'\b|\b' + escaped_abbr + r'\b')
+            abbreviation_patterns.append((abbr, pattern, russian))
+
+    return abbreviation_patterns
 
 
 def ru_replace_abbreviations(value, kind = "meaning"):
+    """Replace english with russian abbreviations.
+    There are only a few thousand different values, so the results are cached."""
+
+    return _ru_replace_abbreviations(value, kind)
 
-    global abbreviations_dict
+
+@lru_cache(maxsize=100_000)
+def _ru_replace_abbreviations(value, kind):
 
     # debug
     # print(f"original value {value}")
 
-    if abbreviations_dict is None:
-        # load_abbreviations_dict(pth.abbreviations_tsv_path)
-        abbreviations_dict = load_abbreviations_dict(pth.abbreviations_tsv_path)
-
     # Perform basic replacements
     if kind == "meaning":
         value = value.replace(' or ', ' или ').replace(', from', ', от').replace(' of ', ' от ').replace('letter', 'буква').replace('form', 'форма').replace('normally', 'обычно')
@@ -149,18 +175,15 @@ def ru_replace_abbreviations(value, kind = "meaning"):
 
     # Step   3: Replace abbreviations in value
     # Use regex to match abbreviations, considering variations like "+acc" or "loc abs"
-    if abbreviations_dict is not None:
-        for abbr, russian in abbreviations_dict.items():
-            # Skip replacement for "pass" if kind is "inflect"
-            if kind == "inflect" and abbr == "pass":
-                continue
+    for abbr, pattern, russian in load_abbreviation_patterns():
+        # Skip replacement for "pass" if kind is "inflect"
+        if kind == "inflect" and abbr == "pass":
+            continue
 
-            # Escape special characters in the abbreviation
-            escaped_abbr = re.escape(abbr)
-            # Adjust the regex pattern to match abbreviations with optional "+" prefix and spaces
-            pattern = r'\b\+' + escaped_abbr + r'\b|\b' + escaped_abbr + r'\b'
+        # most abbreviations are not in the value at all
+        if abbr in value:
             # Replace the abbreviation with its Russian equivalent
-            value = re.sub(pattern, russian, value)
+            value = pattern.sub(russian, value)
     # debug
     # print(f"replaced value {value}")
     return value
@@ -3,13 +3,15 @@
 """Compile HTML table of all grammatical possibilities of every inflected word-form."""
 
 import pickle
+import psutil
 
 # from css_html_js_minify import css_minify, js_minify
 from json import loads
 from mako.template import Template
+from multiprocessing import Pool
+from sqlalchemy.orm import Session
 
-from db.db_helpers import get_db_session
-from db.models import DpdHeadword
+from db.db_helpers import get_db_session, iter_headwords
 from db.models import InflectionTemplates
 from db.models import Lookup
 
@@ -20,7 +22,7 @@ from tools.all_tipitaka_words import make_all_tipitaka_word_set
 from tools.configger import config_test
 from tools.deconstructed_words import make_words_in_deconstructions
 from tools.goldendict_exporter import DictInfo, DictVariables, DictEntry
-from tools.goldendict_exporter import export_to_goldendict_with_pyglossary
+from tools.goldendict_exporter import export_to_goldendict
 from tools.lookup_is_another_value import is_another_value
 from tools.mdict_exporter import export_to_mdict
 from tools.niggahitas import add_niggahitas
@@ -30,6 +32,12 @@ from tools.printer import p_counter, p_green, p_green_title, p_title, p_yes
 from tools.tic_toc import tic, toc
 from tools.update_test_add import update_test_add
 
+# the DpdHeadword columns used to make the grammar dictionary
+grammar_columns = ["id", "lemma_1", "pos", "grammar", "stem", "pattern"]
+
+# headwords per batch sent to a worker
+BATCH_SIZE = 1000
+
 
 class ProgData():
     def __init__(self) -> None:
@@ -65,7 +73,7 @@ class ProgData():
         self.dict_data: list[DictEntry]
 
     def load_db(self):
-        db = self.db_session.query(DpdHeadword).all()
+        db = iter_headwords(self.db_session, columns=grammar_columns)
         return sorted(db, key=lambda x: pali_sort_key(x.lemma_1))
     
     def close_db(self):
@@ -162,9 +170,8 @@ def generate_grammar_dict(g: ProgData):
     # 2. grammar_dict_table is just an html table {inflection: "html"}
     # 3. grammar_dict_html is full html page with header, style etc. {inflection: "html"}
 
-    grammar_dict = {}
-    grammar_dict_table = {}
-    grammar_dict_html = {}
+    # the data lines of each inflection, dicts are used as ordered sets
+    grammar_dict_lines: dict[str, dict[tuple[str, str, str], None]] = {}
 
     # create the header from a template
     header_templ = Template(filename=str(g.pth.grammar_dict_header_templ_path))
@@ -175,161 +182,197 @@ def generate_grammar_dict(g: ProgData):
     
     html_table_header = "<body><div class='grammar_dict'><table class='grammar_dict'>"
 
-    # process the inflections of each word in DpdHeadword
-    for counter, i in enumerate(g.db):
+    # all the templates are loaded and parsed once
+    templates = load_inflection_templates(g.db_session)
+
+    # indeclinables have no inflections
+    headwords = [
+        (i.lemma_clean, i.pos, i.stem, i.pattern)
+        for i in g.db if i.stem != "-"]
+    batches = [
+        headwords[start:start + BATCH_SIZE]
+        for start in range(0, len(headwords), BATCH_SIZE)]
+
+    # find the inflections of each word in DpdHeadword in parallel
+    num_logical_cores = psutil.cpu_count()
+    p_green_title(f"running with {num_logical_cores} cores")
+
+    with Pool(
+        processes=num_logical_cores,
+        initializer=_init_grammar_worker,
+        initargs=(templates, g.all_words_set),
+    ) as pool:
+
+        counter = 0
+        for batch, results in zip(
+            batches, pool.imap(_find_inflected_words, batches)
+        ):
+            for inflected_word, data_line in results:
+                if inflected_word not in grammar_dict_lines:
+                    grammar_dict_lines[inflected_word] = {}
+                grammar_dict_lines[inflected_word][data_line] = None
+
+            if counter % 5000 < BATCH_SIZE:
+                p_counter(counter, len(headwords), batch[0][0])
+            counter += len(batch)
+
+    # make the html once all the data is in
+    p_green("making html")
+
+    html_rows: dict[tuple[str, str, str], str] = {}
+    ru_html_rows: dict[str, str] = {}
+    if g.lang == "ru":
+        html_header = ru_replace_header_abbreviations(html_header)
 
-        # words with ! in the stem are inflected forms 
-        # and wil get dealt with under the main headwords 
-        if "!" in i.stem:
-            pass
-        
-        # words with '*' in stem are irregular inflections, remove the * for clean processing. 
-        if i.stem == "*":
-            i.stem = ""
-        
-        # process indeclinables
-        if i.stem == "-":
+    grammar_dict = {}
+    grammar_dict_table = {}
+    grammar_dict_html = {}
+
+    for inflected_word, data_lines in grammar_dict_lines.items():
+        grammar_dict[inflected_word] = list(data_lines)
+
+        # different data lines can make the same html row
+        rows: dict[str, None] = {}
+        for data_line in data_lines:
+            if data_line not in html_rows:
+                html_rows[data_line] = make_html_row(*data_line)
+            rows[html_rows[data_line]] = None
+
+        html_table = "".join(rows)
+        grammar_dict_table[inflected_word] = f"{html_table_header}{html_table}</table></div></tbody></table></div>"
+
+        # only the full html is translated
+        if g.lang == "ru":
+            for row in rows:
+                if row not in ru_html_rows:
+                    ru_html_rows[row] = "<tr>" + ru_replace_abbreviations(
+                        row.removeprefix("<tr>"), kind="gram")
+            html_table = "".join(ru_html_rows[row] for row in rows)
+
+        grammar_dict_html[inflected_word] = f"{html_header}{html_table}</table></div></body></html>"
+
+    # FIXME find out how to remove headings from table with only 1 row
+
+    g.grammar_dict = grammar_dict
+    g.grammar_dict_table = grammar_dict_table
+    g.grammar_dict_html = grammar_dict_html
+
+    p_yes(len(g.grammar_dict))
+
+
+def load_inflection_templates(db_session: Session) -> dict[str, list[tuple[str, str]]]:
+    """Parse all the inflection templates into
+    {pattern: [(inflection, grammar), ...]} in table order."""
+
+    templates: dict[str, list[tuple[str, str]]] = {}
+    for template in db_session.query(InflectionTemplates).all():
+        if template.pattern in templates:
             continue
-            data_line = (i.lemma_clean, i.pos, "indeclinable")
-            html_line = f"<tr><td><b>{i.pos}</b></td><td colspan='5'>indeclinable</td></tr>"
 
-            # grammar_dict update
-            if i.lemma_clean not in grammar_dict:
-                grammar_dict[i.lemma_clean] = [data_line]
-            else:
-                if data_line not in grammar_dict[i.lemma_clean]:
-                    grammar_dict[i.lemma_clean].append(data_line)
+        template_data = loads(template.data)
+        inflections: list[tuple[str, str]] = []
 
-            # grammar_dict_html update
-            if i.lemma_clean not in grammar_dict_html:
-                grammar_dict_html[i.lemma_clean] = f"{html_header}{html_line}"
-                grammar_dict_table[i.lemma_clean] = f"{html_table_header}{html_line}"
-            else:
-                if html_line not in grammar_dict_html[i.lemma_clean]:
-                    grammar_dict_html[i.lemma_clean] += html_line
-                    grammar_dict_table[i.lemma_clean] += html_line
+        # data is a nest of lists
+        # list[] table
+        # list[[]] row
+        # list[[[]]] cell
+        # row 0 is the top header
+        # column 0 is the grammar header
+        # odd rows > 0 are inflections
+        # even rows > 0 are grammar info
 
-        # all other words need an inflection table generated 
-        # to find out their grammatical category, i.e. masc nom sg
-        else:
-            # get template
-            template = g.db_session \
-                .query(InflectionTemplates) \
-                .filter(InflectionTemplates.pattern == i.pattern) \
-                .first()
-
-            if template is not None:
-                template_data = loads(template.data)
-                
-                # data is a nest of lists
-                # list[] table
-                # list[[]] row
-                # list[[[]]] cell
-                # row 0 is the top header
-                # column 0 is the grammar header
-                # odd rows > 0 are inflections
-                # even rows > 0 are grammar info
-
-                for row_number, row_data in enumerate(template_data):
-                    for column_number, cell_data in enumerate(row_data):
-
-                        if (
-                            row_number > 0                      #   skip the top header
-                            and column_number > 0               #   skip the side header
-                            and column_number % 2 == 1          #   skip even numbers = grammar info 
-                            and row_data[0][0] != "in comps"    #   skip this row
-                        ):
-                            grammar: str = [row_data[column_number+1]][0][0]
-
-                            for inflection in cell_data:
-                                if inflection:
-                                    inflected_word = f"{i.stem}{inflection}"
-                                    if inflected_word in g.all_words_set:
-
-                                        data_line = (i.lemma_clean, i.pos, grammar)
-                                        html_line = "<tr>"
-                                        html_line += f"<td><b>{i.pos}</b></td>"
-                                        # get grammatical_categories from grammar
-                                        grammatical_categories = []
-                                        if grammar.startswith("reflx"):
-                                            grammatical_categories.append(grammar.split()[0] + " " + grammar.split()[1])
-                                            grammatical_categories += grammar.split()[2:]
-                                            for grammatical_category in grammatical_categories:
-                                                html_line += f"<td>{grammatical_category}</td>"
-                                        elif grammar.startswith("in comps"):
-                                            html_line += f"<td colspan='3'>{grammar}</td>"
-                                        else:
-                                            grammatical_categories = grammar.split()
-                                            # adding empty values if there are less than 3
-                                            while len(grammatical_categories) < 3:
-                                                grammatical_categories.append("")
-                                            for grammatical_category in grammatical_categories:
-                                                html_line += f"<td>{grammatical_category}</td>"
-                                        html_line += "<td>of</td>"
-                                        html_line += f"<td>{i.lemma_clean}</td>"
-                                        html_line += "</tr>"
-
-                                        # grammar_dict update
-                                        if inflected_word not in grammar_dict:
-                                            grammar_dict[inflected_word] = [data_line]
-                                        else:
-                                            if data_line not in grammar_dict[inflected_word]:
-                                                grammar_dict[inflected_word].append(data_line)
-
-                                        # grammar_dict_html update
-                                        if inflected_word not in grammar_dict_html:
-                                            grammar_dict_html[inflected_word] = f"{html_header}{html_line}"
-                                            grammar_dict_table[inflected_word] = f"{html_table_header}{html_line}"
-                                        else:
-                                            if html_line not in grammar_dict_html[inflected_word]:
-                                                grammar_dict_html[inflected_word] += html_line
-                                                grammar_dict_table[inflected_word] += html_line
-
-        if counter % 5000 == 0:
-            p_counter(counter, len(g.db), i.lemma_1)
+        for row_number, row_data in enumerate(template_data):
+            for column_number, cell_data in enumerate(row_data):
 
-    if g.lang == "ru":
+                if (
+                    row_number > 0                      #   skip the top header
+                    and column_number > 0               #   skip the side header
+                    and column_number % 2 == 1          #   skip even numbers = grammar info 
+                    and row_data[0][0] != "in comps"    #   skip this row
+                ):
+                    grammar: str = [row_data[column_number+1]][0][0]
 
-        # !!! FIXME very slow!
+                    for inflection in cell_data:
+                        if inflection:
+                            inflections.append((inflection, grammar))
 
-        print_counter = 0
-        p_green("replacing abbreviations: en > ru")
-        for inflected_word, html_content in grammar_dict_html.items():
-            # Replace abbreviations in each HTML line
-            html_lines = html_content.split('<tr>')
-            for i, line in enumerate(html_lines):
-                if line:
-                    # Replace abbreviations in the line
-                    line = ru_replace_abbreviations(line, kind="gram")
-                    # Update the HTML lines with the modified line
-                    html_lines[i] = line
-            # Join the modified lines back into a single HTML string
-            grammar_dict_html[inflected_word] = '<tr>'.join(html_lines)
+        templates[template.pattern] = inflections
 
-            print_counter += 1
-            if print_counter % 5000 == 0:
-                p_counter(print_counter, len(grammar_dict_html), inflected_word)
+    return templates
 
 
-    # clean up the html
-    # FIXME what about using Jinja template here?
+_worker_templates: dict[str, list[tuple[str, str]]]
+_worker_all_words_set: set[str]
 
-    for item in grammar_dict_html:
-        grammar_dict_html[item] += "</table></div></body></html>"
 
-    for item in grammar_dict_table:
-        grammar_dict_table[item] += "</table></div>"
+def _init_grammar_worker(
+    templates: dict[str, list[tuple[str, str]]],
+    all_words_set: set[str],
+) -> None:
+    global _worker_templates, _worker_all_words_set
+    _worker_templates = templates
+    _worker_all_words_set = all_words_set
 
-    # FIXME find out how to remove headings from table with only 1 row
 
-    for item in grammar_dict_table:
-        grammar_dict_table[item] += "</tbody></table></div>"
-    
-    g.grammar_dict = grammar_dict
-    g.grammar_dict_table = grammar_dict_table
-    g.grammar_dict_html = grammar_dict_html
+def _find_inflected_words(
+    batch: list[tuple[str, str, str, str]]
+) -> list[tuple[str, tuple[str, str, str]]]:
+    """Find the inflected words of a batch of (lemma_clean, pos, stem, pattern)
+    which are in all_words_set, with their (headword, pos, grammar)."""
 
-    p_yes(len(g.grammar_dict))
+    results = []
+    for lemma_clean, pos, stem, pattern in batch:
+
+        # words with ! in the stem are inflected forms 
+        # and wil get dealt with under the main headwords 
+        
+        # words with '*' in stem are irregular inflections, remove the * for clean processing. 
+        if stem == "*":
+            stem = ""
+
+        for inflection, grammar in _worker_templates.get(pattern, []):
+            inflected_word = f"{stem}{inflection}"
+            if inflected_word in _worker_all_words_set:
+                results.append((inflected_word, (lemma_clean, pos, grammar)))
+
+    return results
+
+
+def make_html_row(lemma_clean: str, pos: str, grammar: str) -> str:
+    """The html table row of one data line."""
+
+    html_line = "<tr>"
+    html_line += f"<td><b>{pos}</b></td>"
+    # get grammatical_categories from grammar
+    grammatical_categories = []
+    if grammar.startswith("reflx"):
+        grammatical_categories.append(grammar.split()[0] + " " + grammar.split()[1])
+        grammatical_categories += grammar.split()[2:]
+        for grammatical_category in grammatical_categories:
+            html_line += f"<td>{grammatical_category}</td>"
+    elif grammar.startswith("in comps"):
+        html_line += f"<td colspan='3'>{grammar}</td>"
+    else:
+        grammatical_categories = grammar.split()
+        # adding empty values if there are less than 3
+        while len(grammatical_categories) < 3:
+            grammatical_categories.append("")
+        for grammatical_category in grammatical_categories:
+            html_line += f"<td>{grammatical_category}</td>"
+    html_line += "<td>of</td>"
+    html_line += f"<td>{lemma_clean}</td>"
+    html_line += "</tr>"
+    return html_line
+
+
+def ru_replace_header_abbreviations(html_header: str) -> str:
+    """Replace the abbreviations in each part of the header between <tr>s."""
+
+    html_parts = html_header.split("<tr>")
+    for i, part in enumerate(html_parts):
+        if part:
+            html_parts[i] = ru_replace_abbreviations(part, kind="gram")
+    return "<tr>".join(html_parts)
 
 
 def save_pickle_and_tsv(g: ProgData):
@@ -440,7 +483,7 @@ def prepare_gd_mdict_and_export(g: ProgData):
         delete_original=False
     )
 
-    export_to_goldendict_with_pyglossary(dict_info, dict_vars, g.dict_data)
+    export_to_goldendict(dict_info, dict_vars, g.dict_data)
     
     if g.make_mdict:
         export_to_mdict(dict_info, dict_vars, g.dict_data)
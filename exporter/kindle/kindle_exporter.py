@@ -14,7 +14,7 @@ from rich import print
 from typing import Dict, Union
 from zipfile import ZipFile, ZIP_DEFLATED
 
-from db.db_helpers import get_db_session
+from db.db_helpers import get_db_session, iter_headwords
 from db.models import DpdHeadword, Lookup
 
 from tools.configger import config_test
@@ -35,20 +35,30 @@ from tools.printer import p_counter, p_green, p_green_title, p_title, p_yes
 from tools.tic_toc import tic, toc
 from tools.tsv_read_write import read_tsv_dict
 
-from sqlalchemy.orm import joinedload
-
 from exporter.goldendict.ru_components.tools.paths_ru import RuPaths
 from exporter.goldendict.ru_components.tools.tools_for_ru_exporter import make_ru_meaning_for_ebook, ru_replace_abbreviations, ru_make_grammar_line
 
+# the DpdHeadword columns used in the ebook
+ebook_columns = [
+    "id", "lemma_1", "lemma_2", "pos", "grammar", "neg", "verb", "trans",
+    "plus_case", "meaning_1", "meaning_lit", "meaning_2",
+    "root_key", "root_sign", "root_base", "family_root", "family_word",
+    "construction", "derivative", "suffix", "phonetic",
+    "compound_type", "compound_construction", "antonym", "synonym", "variant",
+    "commentary", "notes", "cognate", "link", "non_ia", "sanskrit",
+    "source_1", "sutta_1", "example_1", "source_2", "sutta_2", "example_2",
+    "inflections", "inflections_api_ca_eva_iti",
+]
+
 
 def render_xhtml(pth: ProjectPaths, rupth: RuPaths, lang="en"):
 
     p_green("querying dpd db")
     db_session = get_db_session(pth.dpd_db_path)
     if lang == "en":
-        dpd_db = db_session.query(DpdHeadword).all()
+        dpd_db = iter_headwords(db_session, columns=ebook_columns, eager=["rt"])
     elif lang == "ru":
-        dpd_db = db_session.query(DpdHeadword).options(joinedload(DpdHeadword.ru)).all()
+        dpd_db = iter_headwords(db_session, columns=ebook_columns, eager=["rt", "ru"])
     dpd_db = sorted(dpd_db, key=lambda x: pali_sort_key(x.lemma_1))
     p_yes(len(dpd_db))
 
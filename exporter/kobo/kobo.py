@@ -4,8 +4,8 @@
 
 from jinja2 import Environment, FileSystemLoader
 
-from db.db_helpers import get_db_session
-from db.models import DpdHeadword, Lookup
+from db.db_helpers import get_db_session, iter_headwords
+from db.models import Lookup
 from tools.cst_sc_text_sets import make_cst_text_set, make_sc_text_set
 from tools.pali_sort_key import pali_sort_key
 from tools.paths import ProjectPaths
@@ -14,9 +14,17 @@ from tools.tic_toc import tic, toc
 
 from pathlib import Path
 from tools.goldendict_exporter import DictEntry, DictInfo, DictVariables
-from tools.goldendict_exporter import export_to_goldendict_with_pyglossary
+from tools.goldendict_exporter import export_to_goldendict
 from tools.kobo_exporter import export_to_kobo_with_pyglossary, DictVariablesKobo
 
+# the DpdHeadword columns used in the kobo template
+kobo_columns = [
+    "id", "lemma_1", "pos", "grammar", "neg", "verb", "trans", "plus_case",
+    "meaning_1", "meaning_lit", "meaning_2", "construction",
+    "root_key", "root_sign", "root_base", "family_root", "family_word",
+    "source_1", "inflections", "inflections_api_ca_eva_iti",
+]
+
 class GlobalData():
 
     def __init__(self) -> None:
@@ -50,7 +58,7 @@ class GlobalData():
 def compile_dict_data(g: GlobalData):
     p_green_title("compiling dict data")
     
-    db = g.db_session.query(DpdHeadword).all()
+    db = iter_headwords(g.db_session, columns=kobo_columns)
     db = sorted(db, key=lambda x: pali_sort_key(x.lemma_1))
     db_len = len(db)
     for count, i in enumerate(db):
@@ -139,7 +147,7 @@ def main():
         dict_info, dict_vars, g.dict_data
     )
     
-    export_to_goldendict_with_pyglossary(
+    export_to_goldendict(
         dict_info, dict_var_gd, g.dict_data
     )
 
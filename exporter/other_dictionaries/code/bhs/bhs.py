@@ -9,7 +9,7 @@ from tools.niggahitas import add_niggahitas
 from tools.paths import ProjectPaths
 from tools.tic_toc import tic, toc
 from tools.goldendict_exporter import DictEntry, DictInfo, DictVariables
-from tools.goldendict_exporter import export_to_goldendict_with_pyglossary
+from tools.goldendict_exporter import export_to_goldendict
 
 
 def main():
@@ -69,11 +69,10 @@ def main():
         delete_original=True
     )
 
-    export_to_goldendict_with_pyglossary(
+    export_to_goldendict(
         dict_info, 
         dict_vars,
-        dict_data, 
-        zip_synonyms=False
+        dict_data
     )
 
     # save as mdict
@@ -1,7 +1,7 @@
 import json
 import re
 
-from tools.goldendict_exporter import export_to_goldendict_with_pyglossary
+from tools.goldendict_exporter import export_to_goldendict
 from tools.goldendict_exporter import DictEntry, DictInfo, DictVariables
 from tools.mdict_exporter import export_to_mdict
 from tools.niggahitas import add_niggahitas
@@ -189,11 +189,10 @@ def main():
 
     p_yes("")
 
-    export_to_goldendict_with_pyglossary(
+    export_to_goldendict(
         dict_info,
         dict_var,
-        dict_data,
-        zip_synonyms=False
+        dict_data
     )
 
     export_to_mdict(
@@ -9,7 +9,7 @@ from tools.mdict_exporter import export_to_mdict
 from tools.niggahitas import add_niggahitas
 from tools.paths import ProjectPaths
 from tools.goldendict_exporter import DictEntry, DictInfo, DictVariables
-from tools.goldendict_exporter import export_to_goldendict_with_pyglossary
+from tools.goldendict_exporter import export_to_goldendict
 from tools.tic_toc import tic, toc
 
 def clean_text(text):
@@ -79,7 +79,7 @@ def main():
         delete_original=True
     )
     
-    export_to_goldendict_with_pyglossary(
+    export_to_goldendict(
         dict_info,
         dict_vars,
         dict_data
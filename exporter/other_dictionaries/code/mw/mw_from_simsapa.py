@@ -5,7 +5,7 @@ Export to GoldenDict andMDict.
 import sqlite3
 
 from tools.goldendict_exporter import DictEntry, DictInfo, DictVariables
-from tools.goldendict_exporter import export_to_goldendict_with_pyglossary
+from tools.goldendict_exporter import export_to_goldendict
 from tools.mdict_exporter import export_to_mdict
 
 from tools.niggahitas import add_niggahitas
@@ -78,7 +78,7 @@ def save_goldendict_and_mdict(g: GlobalVars):
     )
 
     # save goldendict
-    export_to_goldendict_with_pyglossary(
+    export_to_goldendict(
         dict_info, 
         dict_vars,
         g.dict_data,
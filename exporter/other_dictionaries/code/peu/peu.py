@@ -10,7 +10,7 @@ import sqlite3
 from rich import print
 
 from tools.goldendict_exporter import DictEntry, DictInfo, DictVariables
-from tools.goldendict_exporter import export_to_goldendict_with_pyglossary
+from tools.goldendict_exporter import export_to_goldendict
 from tools.mdict_exporter import export_to_mdict
 from tools.niggahitas import add_niggahitas
 from tools.paths import ProjectPaths
@@ -100,11 +100,10 @@ def main():
         delete_original=True
     )
 
-    export_to_goldendict_with_pyglossary(
+    export_to_goldendict(
         dict_info, 
         dict_vars,
-        dict_data, 
-        zip_synonyms=False
+        dict_data
     )
 
     # save as mdict
@@ -7,7 +7,7 @@ from bs4 import BeautifulSoup
 
 from tools.configger import config_read
 from tools.goldendict_exporter import DictEntry, DictInfo, DictVariables
-from tools.goldendict_exporter import export_to_goldendict_with_pyglossary
+from tools.goldendict_exporter import export_to_goldendict
 from tools.mdict_exporter import export_to_mdict
 from tools.niggahitas import add_niggahitas
 from tools.pali_sort_key import pali_sort_key
@@ -131,7 +131,7 @@ def save_goldendict_and_mdict(g: ProgData):
     )
 
     # save goldendict
-    export_to_goldendict_with_pyglossary(
+    export_to_goldendict(
         dict_info, 
         dict_vars,
         g.dict_data,
@@ -3,7 +3,7 @@
 
 
 from tools.goldendict_exporter import DictEntry, DictInfo, DictVariables
-from tools.goldendict_exporter import export_to_goldendict_with_pyglossary
+from tools.goldendict_exporter import export_to_goldendict
 from tools.mdict_exporter import export_to_mdict
 from tools.paths import ProjectPaths
 from tools.tic_toc import tic, toc
@@ -87,7 +87,7 @@ def export_goldendict_and_mdict(g: GlobalVars):
     )
 
     # save goldendict
-    export_to_goldendict_with_pyglossary(
+    export_to_goldendict(
         dict_info, 
         dict_vars,
         g.dict_data,
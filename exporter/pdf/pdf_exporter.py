@@ -8,8 +8,8 @@ import typst
 
 from jinja2 import Environment, FileSystemLoader
 
-from db.db_helpers import get_db_session
-from db.models import DpdHeadword, FamilyCompound, FamilyIdiom, FamilyRoot, FamilyWord, Lookup
+from db.db_helpers import get_db_session, iter_headwords
+from db.models import FamilyCompound, FamilyIdiom, FamilyRoot, FamilyWord, Lookup
 from tools.configger import config_test
 from tools.date_and_time import year_month_day_dash
 from tools.pali_sort_key import pali_sort_key
@@ -21,6 +21,14 @@ from tools.zip_up import zip_up_file
 
 debug = False
 
+# the DpdHeadword columns used in the headword template
+headword_columns = [
+    "id", "lemma_1", "pos", "grammar", "neg", "verb", "trans", "plus_case",
+    "meaning_1", "meaning_lit", "meaning_2", "construction",
+    "root_key", "root_sign", "root_base", "family_root", "family_word",
+    "source_1",
+]
+
 class GlobalVars():
     # database
     pth = ProjectPaths()
@@ -90,9 +98,9 @@ def make_pali_to_english(g: GlobalVars):
     p_green("compiling pali to english")
 
     if debug is True:
-        dpd_db = g.db_session.query(DpdHeadword).limit(100).all()
+        dpd_db = iter_headwords(g.db_session, columns=headword_columns, limit=100)
     else:
-        dpd_db = g.db_session.query(DpdHeadword).all()
+        dpd_db = iter_headwords(g.db_session, columns=headword_columns)
     dpd_db = sorted(dpd_db, key=lambda x: pali_sort_key(x.lemma_1))
 
     g.typst_data.append("#pagebreak()\n")
@@ -9,7 +9,7 @@ from sqlalchemy.orm import joinedload
 from db.db_helpers import get_db_session
 from db.models import DpdHeadword
 from tools.date_and_time import year_month_day_dash
-from tools.goldendict_exporter import DictEntry, DictInfo, DictVariables, export_to_goldendict_with_pyglossary
+from tools.goldendict_exporter import DictEntry, DictInfo, DictVariables, export_to_goldendict
 from tools.mdict_exporter import export_to_mdict
 from tools.paths import ProjectPaths
 from tools.printer import p_counter, p_green, p_green_title, p_title, p_yes
@@ -79,11 +79,10 @@ def main():
         delete_original = True
     )
 
-    export_to_goldendict_with_pyglossary(
+    export_to_goldendict(
         dict_info = dict_info,
         dict_var = dict_var,
-        dict_data = dict_data,
-        zip_synonyms = True
+        dict_data = dict_data
     )
 
     export_to_mdict(
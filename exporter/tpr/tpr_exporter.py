@@ -5,16 +5,17 @@
 import csv
 import json
 import os
-import pandas as pd
 import re
 import sqlite3
 
+from itertools import islice
 from mako.template import Template
 from sqlalchemy.orm import Session
+from typing import Iterable, TextIO
 from zipfile import ZipFile, ZIP_DEFLATED
 
-from db.db_helpers import get_db_session
-from db.models import DpdHeadword, DpdRoot, Lookup
+from db.db_helpers import get_db_session, iter_headwords
+from db.models import DpdRoot, Lookup
 from exporter.goldendict.export_dpd import render_dpd_definition_templ
 from tools.configger import config_test, config_read
 from tools.pali_sort_key import pali_sort_key
@@ -28,29 +29,50 @@ from exporter.goldendict.helpers import TODAY
 
 from exporter.goldendict.ru_components.tools.tools_for_ru_exporter import make_ru_meaning_simpl
 
+# the DpdHeadword columns used in the tpr data
+tpr_columns = [
+    "id", "lemma_1", "lemma_2", "pos", "grammar", "neg", "verb", "trans",
+    "plus_case", "meaning_1", "meaning_lit", "meaning_2",
+    "root_key", "root_sign", "root_base", "family_root", "family_word",
+    "family_set", "construction", "derivative", "suffix", "phonetic",
+    "compound_type", "compound_construction", "antonym", "synonym", "variant",
+    "commentary", "notes", "cognate", "link", "non_ia", "sanskrit",
+    "source_1", "ebt_count",
+]
+
+# rows per INSERT statement in the tpr sql updater
+SQL_INSERT_BATCH_SIZE = 100
+
+# tpr looks up words and inflections in these tables
+tpr_indexes = [
+    "CREATE INDEX IF NOT EXISTS dpd_word ON dpd (word)",
+    "CREATE INDEX IF NOT EXISTS dpd_inflections_to_headwords_inflection ON dpd_inflections_to_headwords (inflection)",
+    "CREATE INDEX IF NOT EXISTS dpd_word_split_word ON dpd_word_split (word)",
+]
+
 
 class ProgData():
     def __init__(self) -> None:
         self.pth = ProjectPaths()
         self.db_session: Session = get_db_session(self.pth.dpd_db_path)
-        self.dpd_db = self.make_dpd_db()
         
         self.all_headwords_clean: set[str]
 
         self.tpr_data_list: list[dict[str, str]]
         self.deconstructor_data_list: list[dict[str, str]]
         self.i2h_data_list: list[dict[str, str]]
-        
-        self.tpr_df: pd.DataFrame
-        self.i2h_df: pd.DataFrame
-        self.deconstructor_df: pd.DataFrame
 
         self.show_ru_data: bool = False
         if config_test("exporter", "language", "en") and config_test("dictionary", "show_ru_data", "yes"):
             self.show_ru_data: bool = True
+
+        self.dpd_db = self.make_dpd_db()
     
     def make_dpd_db(self):
-        dpd_db = self.db_session.query(DpdHeadword).all()
+        eager = ["rt"]
+        if self.show_ru_data:
+            eager.append("ru")
+        dpd_db = iter_headwords(self.db_session, columns=tpr_columns, eager=eager)
         dpd_db = sorted(dpd_db, key=lambda x: pali_sort_key(x.lemma_1))
         return dpd_db
 
@@ -427,19 +449,24 @@ def write_tsvs(g: ProgData):
 
 
 def copy_to_sqlite_db(g: ProgData):
+    """Bulk load the data lists into the tpr db in one transaction,
+    and build the indexes after the rows are in."""
+
     p_green("copying data_list to tpr db")
 
-    # data frames
-    tpr_df = pd.DataFrame(g.tpr_data_list)
-    i2h_df = pd.DataFrame(g.i2h_data_list)
-    deconstructor_df = pd.DataFrame(g.deconstructor_data_list)
     tpr_db_path = config_read("tpr", "db_path")
 
     if tpr_db_path:
         try:
-            conn = sqlite3.connect(tpr_db_path)
+            conn = sqlite3.connect(tpr_db_path, isolation_level=None)
             c = conn.cursor()
 
+            # the tables are rebuilt from scratch every time,
+            # so there is no need for a journal or syncing every write
+            c.execute("PRAGMA journal_mode = OFF")
+            c.execute("PRAGMA synchronous = OFF")
+            c.execute("BEGIN TRANSACTION")
+
             # dpd table
             c.execute("DROP TABLE if exists dpd")
             c.execute(
@@ -454,25 +481,32 @@ def copy_to_sqlite_db(g: ProgData):
                     "has_word_family" INTEGER DEFAULT 0,
                     "has_freq" INTEGER DEFAULT 0);
                 """)
-            
-
-            tpr_df.to_sql('dpd', conn, if_exists='append', index=False)
+            c.executemany(
+                """INSERT INTO dpd (id, word, definition, book_id) VALUES (?, ?, ?, ?)""",
+                ((i["id"], i["word"], i["definition"], i["book_id"])
+                    for i in g.tpr_data_list))
 
             # inflection_to_headwords
             c.execute("DROP TABLE if exists dpd_inflections_to_headwords")
             c.execute(
                 "CREATE TABLE dpd_inflections_to_headwords (inflection, headwords)")
-            i2h_df.to_sql(
-                'dpd_inflections_to_headwords',
-                conn, if_exists='append', index=False)
+            c.executemany(
+                """INSERT INTO dpd_inflections_to_headwords (inflection, headwords) VALUES (?, ?)""",
+                ((i["inflection"], i["headwords"]) for i in g.i2h_data_list))
 
             # dpd_word_split
             c.execute("DROP TABLE if exists dpd_word_split")
             c.execute(
                 "CREATE TABLE dpd_word_split (word, breakup)")
-            deconstructor_df.to_sql(
-                'dpd_word_split',
-                conn, if_exists='append', index=False)
+            c.executemany(
+                """INSERT INTO dpd_word_split (word, breakup) VALUES (?, ?)""",
+                ((i["word"], i["breakup"]) for i in g.deconstructor_data_list))
+
+            # indexes are quicker to build once all the rows are in
+            for index_sql in tpr_indexes:
+                c.execute(index_sql)
+
+            c.execute("COMMIT")
             p_yes("OK")
 
             conn.close()
@@ -481,53 +515,76 @@ def copy_to_sqlite_db(g: ProgData):
             p_red("an error occurred copying to db")
             p_red(e)
 
-    g.tpr_df = tpr_df
-    g.i2h_df = i2h_df
-    g.deconstructor_df = deconstructor_df
-
 
 def tpr_updater(g: ProgData):
-    p_green("making tpr sql updater")
+    """Write the sql file which TPR uses to update its db.
+    Rows are streamed to the file in multi-row INSERT statements,
+    one statement per line."""
 
-    sql_string = ""
-    sql_string += "BEGIN TRANSACTION;\n"
-    # sql_string += "DROP TABLE IF EXISTS dpd;\n"
-    # sql_string += """CREATE TABLE dpd ("id" INTEGER, "word" TEXT, "definition" TEXT, "book_id" INTEGER, "has_inflections" INTEGER DEFAULT 0, "has_root_family" INTEGER DEFAULT 0, has_compound_family" INTEGER DEFAULT 0, "has_word_family" INTEGER DEFAULT 0, "has_freq" INTEGER DEFAULT 0);\n"""
-    sql_string += "DELETE FROM dpd;\n"
-    sql_string += "DELETE FROM dpd_inflections_to_headwords;\n"
-    sql_string += "DELETE FROM dpd_word_split;\n"
-    sql_string += "COMMIT;\n"
-    sql_string += "BEGIN TRANSACTION;\n"
-
-    for row in range(len(g.i2h_df)):
-        inflection = g.i2h_df.iloc[row, 0]
-        headword = g.i2h_df.iloc[row, 1]
-        headword = headword.replace("'", "''")  #type:ignore
-        sql_string += f"""INSERT INTO "dpd_inflections_to_headwords" \
-("inflection", "headwords") VALUES ('{inflection}', '{headword}');\n"""
-
-    for row in range(len(g.tpr_df)):
-        id = g.tpr_df.iloc[row, 0]
-        word = g.tpr_df.iloc[row, 1]
-        definition = g.tpr_df.iloc[row, 2]
-        definition = definition.replace("'", "''") #type:ignore
-        book_id = g.tpr_df.iloc[row, 3]
-        sql_string += f"""INSERT INTO "dpd" ("id", "word", "definition", "book_id")\
- VALUES ({id}, '{word}', '{definition}', {book_id});\n"""
-
-    for row in range(len(g.deconstructor_df)):
-        word = g.deconstructor_df.iloc[row, 0]
-        breakup = g.deconstructor_df.iloc[row, 1]
-        sql_string += f"""INSERT INTO "dpd_word_split" ("word", "breakup")\
- VALUES ('{word}', '{breakup}');\n"""
-    
-    sql_string += "COMMIT;\n"
+    p_green("making tpr sql updater")
 
     with open(g.pth.tpr_sql_file_path, "w") as f:
-        f.write(sql_string)
+        f.write("BEGIN TRANSACTION;\n")
+        # f.write("DROP TABLE IF EXISTS dpd;\n")
+        # f.write("""CREATE TABLE dpd ("id" INTEGER, "word" TEXT, "definition" TEXT, "book_id" INTEGER, "has_inflections" INTEGER DEFAULT 0, "has_root_family" INTEGER DEFAULT 0, has_compound_family" INTEGER DEFAULT 0, "has_word_family" INTEGER DEFAULT 0, "has_freq" INTEGER DEFAULT 0);\n""")
+        f.write("DELETE FROM dpd;\n")
+        f.write("DELETE FROM dpd_inflections_to_headwords;\n")
+        f.write("DELETE FROM dpd_word_split;\n")
+        f.write("COMMIT;\n")
+        f.write("BEGIN TRANSACTION;\n")
+
+        write_sql_inserts(
+            f, "dpd_inflections_to_headwords",
+            ["inflection", "headwords"],
+            g.i2h_data_list)
+
+        write_sql_inserts(
+            f, "dpd",
+            ["id", "word", "definition", "book_id"],
+            g.tpr_data_list)
+
+        write_sql_inserts(
+            f, "dpd_word_split",
+            ["word", "breakup"],
+            g.deconstructor_data_list)
+
+        for index_sql in tpr_indexes:
+            f.write(f"{index_sql};\n")
+
+        f.write("COMMIT;\n")
+
     p_yes("OK")
 
 
+def sql_value(value: str | int) -> str:
+    """An sql literal, with quotes in strings escaped."""
+
+    if isinstance(value, int):
+        return str(value)
+    else:
+        value = value.replace("'", "''")
+        return f"'{value}'"
+
+
+def write_sql_inserts(
+    f: TextIO,
+    table: str,
+    columns: list[str],
+    data_list: Iterable[dict],
+) -> None:
+    """Write INSERT statements of up to SQL_INSERT_BATCH_SIZE rows."""
+
+    column_names = ", ".join(f'"{column}"' for column in columns)
+    insert = f'INSERT INTO "{table}" ({column_names}) VALUES '
+
+    data_iter = iter(data_list)
+    while batch := list(islice(data_iter, SQL_INSERT_BATCH_SIZE)):
+        values = ", ".join(
+            f"({', '.join(sql_value(i[column]) for column in columns)})"
+            for i in batch)
+        f.write(f"{insert}{values};\n")
+
+
 def copy_zip_to_tpr_downloads(g: ProgData):
     p_green("updating tpr_downloads")
 
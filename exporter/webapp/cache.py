@@ -0,0 +1,113 @@
+"""Caches for rendered webapp HTML.
+The db only changes at release time, so rendered HTML is keyed by the
+dpd_release_version in DbInfo and stays valid until a new db is deployed.
+The keys also include the render context, i.e. today's date in the
+feedback links and the config options, so those are never out of date."""
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Hashable
+
+from sqlalchemy.orm import Session
+
+from db.models import DbInfo
+from tools.configger import config_test
+from tools.date_and_time import today_dash
+
+
+class LruCache:
+    """A thread-safe, size-bounded LRU cache with hit and miss counters."""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class HtmlCache:
+    """Rendered HTML of whole search results and of single headwords.
+    1. results: (query, lang, db_version, *render_context) -> (dpd_html, summary_html)
+    2. headwords: (id, lang, db_version, *render_context) -> (lemma_1, summary_html, dpd_html)"""
+
+    def __init__(
+        self,
+        db_version: str,
+        max_results: int = 2048,
+        max_headwords: int = 4096,
+    ) -> None:
+        self.db_version = db_version
+        self.results = LruCache(max_results)
+        self.headwords = LruCache(max_headwords)
+
+    def results_key(self, q: str, lang: str) -> tuple:
+        return (q, lang, self.db_version, *render_context())
+
+    def headword_key(self, id: int, lang: str) -> tuple:
+        return (id, lang, self.db_version, *render_context())
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        return {
+            "db_version": self.db_version,
+            "results": self.results.stats,
+            "headwords": self.headwords.stats,
+        }
+
+
+def render_context() -> tuple[str, bool, bool]:
+    """What the rendered HTML depends on besides the db:
+    today's date, and the make_link and show_sbs_data config options."""
+
+    return (
+        today_dash(),
+        config_test("dictionary", "make_link", "yes"),
+        config_test("dictionary", "show_sbs_data", "yes"),
+    )
+
+
+def get_db_version(db_session: Session) -> str:
+    """Get the dpd_release_version from DbInfo, or an empty string."""
+
+    db_info = db_session.query(DbInfo).filter_by(key="dpd_release_version").first()
+    if db_info:
+        return db_info.value
+    else:
+        return ""
@@ -1,4 +1,5 @@
 from db.models import DpdRoot, Lookup
+from exporter.webapp.preloads import LookupEntry
 from exporter.goldendict.ru_components.tools.tools_for_ru_exporter import (
     make_ru_meaning,
     ru_make_grammar_line,
@@ -6,7 +7,7 @@ from exporter.goldendict.ru_components.tools.tools_for_ru_exporter import (
     ru_replace_abbreviations_list,
 )
 from tools.configger import config_test
-from tools.date_and_time import year_month_day_dash
+from tools.date_and_time import today_dash
 from tools.meaning_construction import (
     degree_of_completion,
     make_grammar_line,
@@ -34,7 +35,7 @@ class HeadwordData:
         self.fi = fi
         self.fs = fs
         self.app_name = "dpdict.net"
-        self.date = year_month_day_dash()
+        self.date = today_dash()
         self.inflections_html_ru = ru_replace_abbreviations(
             i.inflections_html, "inflect"
         )
@@ -70,38 +71,38 @@ class RootsData:
         self.r: DpdRoot = r
         self.frs = frs
         self.app_name = "dpdict.net"
-        self.date = year_month_day_dash()
+        self.date = today_dash()
         self.count = roots_count_dict[self.r.root]
         self.root_info_ru = ru_replace_abbreviations(r.root_info, "root")
         self.root_matrix_ru = ru_replace_abbreviations(r.root_matrix, "root")
 
 
 class DeconstructorData:
-    def __init__(self, result: Lookup):
+    def __init__(self, result: Lookup | LookupEntry):
         self.headword = result.lookup_key
         self.deconstructions = result.deconstructor_unpack
         self.app_name = "dpdict.net"
-        self.date = year_month_day_dash()
+        self.date = today_dash()
 
 
 class VariantData:
-    def __init__(self, result: Lookup):
+    def __init__(self, result: Lookup | LookupEntry):
         self.headword = result.lookup_key
         self.variants = result.variants_unpack
         self.app_name = "dpdict.net"
-        self.date = year_month_day_dash()
+        self.date = today_dash()
 
 
 class SpellingData:
-    def __init__(self, result: Lookup):
+    def __init__(self, result: Lookup | LookupEntry):
         self.headword = result.lookup_key
         self.spellings = result.spelling_unpack
         self.app_name = "dpdict.net"
-        self.date = year_month_day_dash()
+        self.date = today_dash()
 
 
 class GrammarData:
-    def __init__(self, result: Lookup):
+    def __init__(self, result: Lookup | LookupEntry):
         self.headword = result.lookup_key
         self.grammar = result.grammar_unpack
         self.ru_grammar = [
@@ -110,13 +111,13 @@ class GrammarData:
 
 
 class HelpData:
-    def __init__(self, result: Lookup):
+    def __init__(self, result: Lookup | LookupEntry):
         self.headword = result.lookup_key
         self.help = result.help_unpack
 
 
 class AbbreviationsData:
-    def __init__(self, result: Lookup):
+    def __init__(self, result: Lookup | LookupEntry):
         data = result.abbrev_unpack
         self.headword = result.lookup_key
         self.meaning = data["meaning"]
@@ -128,12 +129,12 @@ class AbbreviationsData:
 
 
 class EpdData:
-    def __init__(self, result: Lookup):
+    def __init__(self, result: Lookup | LookupEntry):
         self.headword = result.lookup_key
         self.epd = result.epd_unpack
 
 
 class RpdData:
-    def __init__(self, result: Lookup):
+    def __init__(self, result: Lookup | LookupEntry):
         self.headword = result.lookup_key
         self.rpd = result.rpd_unpack
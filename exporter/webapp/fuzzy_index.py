@@ -0,0 +1,108 @@
+"""Typo-tolerant closest matches for searches with no results.
+Words are indexed by the trigrams of their Pāḷi skeleton, so only
+words which share sounds with the query get scored with difflib."""
+
+import re
+from array import array
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from heapq import nlargest
+from typing import Iterable
+
+from unidecode import unidecode
+
+from tools.fuzzy_search_regex import pali_letter_groups
+
+# the same groups of interchangeable letters as fuzzy_replace,
+# each group is reduced to one letter
+pali_skeleton_dict: dict[str, str] = {}
+for replacement, letters in pali_letter_groups:
+    for letter in letters:
+        pali_skeleton_dict.setdefault(letter, replacement)
+
+# one pass, longest letters first
+pali_skeleton_pattern = re.compile(
+    "|".join(sorted(pali_skeleton_dict, key=len, reverse=True))
+)
+
+
+def pali_skeleton(word: str) -> str:
+    """Reduce a word to its sounds, ignoring diacritics,
+    double consonants and aspiration. eg. dhammā > dama"""
+
+    word = pali_skeleton_pattern.sub(
+        lambda match: pali_skeleton_dict[match.group(0)], word.casefold()
+    )
+    return unidecode(word)
+
+
+def make_trigrams(skeleton: str) -> set[str]:
+    padded = f"^{skeleton}$"
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class FuzzyIndex:
+    """Closest matches of a query in a large set of words,
+    similar to difflib.get_close_matches, but only scoring candidates
+    which share trigrams with the query."""
+
+    def __init__(self, words: Iterable[str], max_candidates: int = 500) -> None:
+        self.words: list[str] = sorted(set(words))
+        self.skeletons: list[str] = [pali_skeleton(word) for word in self.words]
+        self.max_candidates = max_candidates
+
+        postings: dict[str, list[int]] = defaultdict(list)
+        for index, skeleton in enumerate(self.skeletons):
+            for trigram in make_trigrams(skeleton):
+                postings[trigram].append(index)
+        self.postings: dict[str, array] = {
+            trigram: array("I", indexes) for trigram, indexes in postings.items()
+        }
+
+    def closest_matches(self, q: str, n: int = 10, cutoff: float = 0.7) -> list[str]:
+        """Return up to n words with a similarity of at least cutoff,
+        best first. Similarity is the best difflib ratio of either
+        the words themselves or their Pāḷi skeletons,
+        so dhama, damma and dhammā all find dhamma."""
+
+        q_skeleton = pali_skeleton(q)
+        if not q_skeleton:
+            return []
+
+        counts: Counter[int] = Counter()
+        for trigram in make_trigrams(q_skeleton):
+            if trigram in self.postings:
+                counts.update(self.postings[trigram])
+
+        matcher = SequenceMatcher()
+        matcher.set_seq2(q)
+        skeleton_matcher = SequenceMatcher()
+        skeleton_matcher.set_seq2(q_skeleton)
+
+        results: list[tuple[float, float, str]] = []
+        for index, count in counts.most_common(self.max_candidates):
+            word = self.words[index]
+
+            matcher.set_seq1(word)
+            score = 0.0
+            if matcher.real_quick_ratio() >= cutoff and matcher.quick_ratio() >= cutoff:
+                score = matcher.ratio()
+
+            skeleton_score = 0.0
+            if score < 1.0:
+                skeleton_matcher.set_seq1(self.skeletons[index])
+                if (
+                    skeleton_matcher.real_quick_ratio() >= cutoff
+                    and skeleton_matcher.quick_ratio() >= cutoff
+                ):
+                    skeleton_score = skeleton_matcher.ratio()
+
+            # rank by the best score, then by the exact spelling score
+            best_score = max(score, skeleton_score)
+            if best_score >= cutoff:
+                results.append((best_score, score, word))
+
+        return [word for best_score, score, word in nlargest(n, results)]
+
+    def __len__(self) -> int:
+        return len(self.words)
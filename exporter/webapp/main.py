@@ -6,16 +6,21 @@ from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import sessionmaker
 
-from db.db_helpers import get_db_session
-from db.models import BoldDefinition
-from exporter.webapp.preloads import (
-    make_ascii_to_unicode_dict,
-    make_headwords_clean_set,
-    make_roots_count_dict,
+from db.bold_definitions.bold_definitions_fts import (
+    bold_definitions_fts_exists,
+    fts_candidates,
+    make_fts_match,
 )
-from exporter.webapp.tools import fuzzy_replace, make_dpd_html
+from db.db_helpers import get_read_only_session
+from db.models import BoldDefinition
+from exporter.webapp.cache import HtmlCache, get_db_version
+from exporter.webapp.fuzzy_index import FuzzyIndex
+from exporter.webapp.preloads import make_lookup_index
+from exporter.webapp.preloads_snapshot import get_preloads
+from exporter.webapp.tools import make_dpd_html
+from exporter.webapp.workers import WorkerPool
+from tools.fuzzy_search_regex import fuzzy_replace
 from tools.paths import ProjectPaths
 
 app = FastAPI()
@@ -24,29 +29,33 @@ app.mount("/static", StaticFiles(directory="exporter/webapp/static"), name="stat
 
 pth: ProjectPaths = ProjectPaths()
 
-# Create session factory for database connections
-SessionLocal = sessionmaker(
-    autocommit=False, autoflush=False, bind=get_db_session(pth.dpd_db_path).bind
-)
-
 
 @contextmanager
 def get_db():
-    """Provide a transactional scope around a series of operations."""
-    db = SessionLocal()
+    """Provide a read-only session from the shared connection pool."""
+    db = get_read_only_session(pth.dpd_db_path)
     try:
         yield db
     finally:
         db.close()
 
 
-# Preload data that is shared across languages
+# Preload data that is shared across languages,
+# from the build time snapshot if it matches the db
 with get_db() as db_session:
-    roots_count_dict = make_roots_count_dict(db_session)
-    headwords_clean_set = make_headwords_clean_set(db_session)
-    headwords_clean_set_ru = make_headwords_clean_set(db_session, "ru")
-    ascii_to_unicode_dict = make_ascii_to_unicode_dict(db_session)
+    preloads = get_preloads(db_session, pth.webapp_preloads_snapshot_path)
+    roots_count_dict = preloads.roots_count_dict
+    headwords_clean_set = preloads.headwords_clean_set
+    headwords_clean_set_ru = preloads.headwords_clean_set_ru
+    ascii_to_unicode_dict = preloads.ascii_to_unicode_dict
+    lookup_index = make_lookup_index(db_session)
     bd_count = db_session.query(BoldDefinition).count()
+    bd_fts_exists = bold_definitions_fts_exists(db_session)
+    html_cache = HtmlCache(get_db_version(db_session))
+
+# Typo-tolerant closest matches for searches with no results
+fuzzy_index = FuzzyIndex(headwords_clean_set)
+fuzzy_index_ru = FuzzyIndex(headwords_clean_set_ru)
 
 # Set up templates
 templates = Jinja2Templates(directory="exporter/webapp/templates")
@@ -63,6 +72,17 @@ with open("exporter/webapp/static/home_simple.css") as f:
 
 # FIXME
 history_list: list[tuple[str, str, str]] = []
+bd_results_per_page = 100
+
+# Separate bounded pools for dictionary lookups and bold definition searches
+lookup_pool = WorkerPool("lookup", max_workers=8, max_waiting=64, timeout=10)
+bd_pool = WorkerPool("bd_search", max_workers=2, max_waiting=8, timeout=30)
+
+
+@app.on_event("shutdown")
+def shutdown_worker_pools():
+    lookup_pool.shutdown()
+    bd_pool.shutdown()
 
 
 @app.get("/")
@@ -93,11 +113,19 @@ def home_page_ru(request: Request, response_class=HTMLResponse):
 
 
 @app.get("/search_html", response_class=HTMLResponse)
-def db_search_html(request: Request, q: str):
+async def db_search_html(request: Request, q: str):
     """Returns a JSON with HTML."""
 
-    dpd_html, summary_html = make_dpd_html(
-        q, pth, templates, roots_count_dict, headwords_clean_set, ascii_to_unicode_dict
+    dpd_html, summary_html = await lookup_pool.run(
+        make_dpd_html,
+        q,
+        pth,
+        templates,
+        roots_count_dict,
+        fuzzy_index,
+        ascii_to_unicode_dict,
+        lookup_index,
+        html_cache,
     )
     return templates.TemplateResponse(
         "home.html",
@@ -110,16 +138,19 @@ def db_search_html(request: Request, q: str):
 
 
 @app.get("/ru/search_html", response_class=HTMLResponse)
-def db_search_html_ru(request: Request, q: str):
+async def db_search_html_ru(request: Request, q: str):
     """Returns a JSON with Russian HTML."""
 
-    dpd_html, summary_html = make_dpd_html(
+    dpd_html, summary_html = await lookup_pool.run(
+        make_dpd_html,
         q,
         pth,
         templates_ru,
         roots_count_dict,
-        headwords_clean_set_ru,
+        fuzzy_index_ru,
         ascii_to_unicode_dict,
+        lookup_index,
+        html_cache,
         "ru",
     )
     return templates_ru.TemplateResponse(
@@ -133,11 +164,19 @@ def db_search_html_ru(request: Request, q: str):
 
 
 @app.get("/search_json", response_class=JSONResponse)
-def db_search_json(request: Request, q: str):
+async def db_search_json(request: Request, q: str):
     """Main search route for website."""
 
-    dpd_html, summary_html = make_dpd_html(
-        q, pth, templates, roots_count_dict, headwords_clean_set, ascii_to_unicode_dict
+    dpd_html, summary_html = await lookup_pool.run(
+        make_dpd_html,
+        q,
+        pth,
+        templates,
+        roots_count_dict,
+        fuzzy_index,
+        ascii_to_unicode_dict,
+        lookup_index,
+        html_cache,
     )
     response_data = {"summary_html": summary_html, "dpd_html": dpd_html}
     headers = {"Accept-Encoding": "gzip"}
@@ -145,16 +184,19 @@ def db_search_json(request: Request, q: str):
 
 
 @app.get("/ru/search_json", response_class=JSONResponse)
-def db_search_json_ru(request: Request, q: str):
+async def db_search_json_ru(request: Request, q: str):
     """Main Russian search route for website."""
 
-    dpd_html, summary_html = make_dpd_html(
+    dpd_html, summary_html = await lookup_pool.run(
+        make_dpd_html,
         q,
         pth,
         templates_ru,
         roots_count_dict,
-        headwords_clean_set_ru,
+        fuzzy_index_ru,
         ascii_to_unicode_dict,
+        lookup_index,
+        html_cache,
         "ru",
     )
     response_data = {"summary_html": summary_html, "dpd_html": dpd_html}
@@ -163,16 +205,19 @@ def db_search_json_ru(request: Request, q: str):
 
 
 @app.get("/gd", response_class=HTMLResponse)
-def db_search_gd(request: Request, search: str):
+async def db_search_gd(request: Request, search: str):
     """Returns pure HTML for GoldenDict and MDict."""
 
-    dpd_html, summary_html = make_dpd_html(
+    dpd_html, summary_html = await lookup_pool.run(
+        make_dpd_html,
         search,
         pth,
         templates,
         roots_count_dict,
-        headwords_clean_set,
+        fuzzy_index,
         ascii_to_unicode_dict,
+        lookup_index,
+        html_cache,
     )
     global dpd_css, dpd_js, home_simple_css
 
@@ -191,16 +236,19 @@ def db_search_gd(request: Request, search: str):
 
 
 @app.get("/ru/gd", response_class=HTMLResponse)
-def db_search_gd_ru(request: Request, search: str):
+async def db_search_gd_ru(request: Request, search: str):
     """Returns pure HTML in Russian for GoldenDict and MDict."""
 
-    dpd_html, summary_html = make_dpd_html(
+    dpd_html, summary_html = await lookup_pool.run(
+        make_dpd_html,
         search,
         pth,
         templates_ru,
         roots_count_dict,
-        headwords_clean_set_ru,
+        fuzzy_index_ru,
         ascii_to_unicode_dict,
+        lookup_index,
+        html_cache,
         "ru",
     )
     global dpd_css, dpd_js, home_simple_css
@@ -219,52 +267,38 @@ def db_search_gd_ru(request: Request, search: str):
     )
 
 
+@app.get("/cache_stats", response_class=JSONResponse)
+def cache_stats():
+    """Hit and miss counters of the rendered HTML caches and worker pools."""
+
+    return JSONResponse(
+        content={
+            **html_cache.stats,
+            "lookup_pool": lookup_pool.stats,
+            "bd_pool": bd_pool.stats,
+        }
+    )
+
+
 @app.get("/bd_search", response_class=HTMLResponse)
-def db_search_bd(
+async def db_search_bd(
     request: Request,
     q1: str,
     q2: str,
     option: str,
+    after_id: int = 0,
+    start: int = 0,
 ):
-    """Search route for bold defintions."""
-
-    with get_db() as db_session:
-        # no search
-        if not q1 and not q2:
-            results = []
-
-        # starts_with search
-        elif option == "starts_with":
-            search_1_start = f"^{q1}"
-            results = (
-                db_session.query(BoldDefinition)
-                .filter(BoldDefinition.bold.regexp_match(search_1_start))
-                .filter(BoldDefinition.commentary.regexp_match(q2))
-                .all()
-            )
+    """Search route for bold defintions.
+    One page at a time, the next page starts after the last id of this one,
+    and start is the number of results on the pages before."""
 
-        # regex search
-        elif option == "regex":
-            results = (
-                db_session.query(BoldDefinition)
-                .filter(BoldDefinition.bold.regexp_match(q1))
-                .filter(BoldDefinition.commentary.regexp_match(q2))
-                .all()
-            )
-
-        # fuzzy search
-        elif option == "fuzzy":
-            search_1_fuzzy = fuzzy_replace(q1)
-            search_2_fuzzy = fuzzy_replace(q2)
-            results = (
-                db_session.query(BoldDefinition)
-                .filter(BoldDefinition.bold.regexp_match(search_1_fuzzy))
-                .filter(BoldDefinition.commentary.regexp_match(search_2_fuzzy))
-                .all()
-            )
+    results, total, next_after_id = await bd_pool.run(
+        search_bold_definitions, q1, q2, option, after_id
+    )
 
     if results:
-        message = f"<b>{len(results)}</b> results found"
+        message = f"<b>{total}</b> results found"
     else:
         message = "<b>0</b> results found - broaden your search or try the fuzzy option"
 
@@ -277,12 +311,6 @@ def db_search_bd(
 
     history_list = update_history(q1, q2, option)
 
-    # trim to 100 results
-    too_many_results = False
-    if len(results) > 100:
-        results = results[:100]
-        too_many_results = True
-
     return templates.TemplateResponse(
         "bold_definitions.html",
         {
@@ -292,12 +320,75 @@ def db_search_bd(
             "search_2": q2,
             "search_option": option,
             "message": message,
-            "too_many_results": too_many_results,
+            "start": start,
+            "next_after_id": next_after_id,
             "history": history_list,
         },
     )
 
 
+def search_bold_definitions(
+    q1: str, q2: str, option: str, after_id: int = 0
+) -> tuple[list[BoldDefinition], int, int | None]:
+    """Query the bold definitions, run in the bd_search worker pool.
+    Candidates are narrowed down with the full text index before any
+    regex runs, and only one page of results after after_id is fetched.
+    Returns the results, the total number of matches,
+    and the after_id of the next page, or None if this is the last."""
+
+    # no search
+    if not q1 and not q2:
+        return [], 0, None
+
+    # starts_with search
+    if option == "starts_with":
+        search_1 = f"^{q1}"
+        search_2 = q2
+
+    # regex search
+    elif option == "regex":
+        search_1 = q1
+        search_2 = q2
+
+    # fuzzy search
+    elif option == "fuzzy":
+        search_1 = fuzzy_replace(q1)
+        search_2 = fuzzy_replace(q2)
+
+    else:
+        return [], 0, None
+
+    with get_db() as db_session:
+        query = (
+            db_session.query(BoldDefinition)
+            .filter(BoldDefinition.bold.regexp_match(search_1))
+            .filter(BoldDefinition.commentary.regexp_match(search_2))
+        )
+
+        if bd_fts_exists:
+            fts_match = make_fts_match(q1, q2, option)
+            if fts_match:
+                query = query.filter(BoldDefinition.id.in_(fts_candidates(fts_match)))
+
+        results = (
+            query.filter(BoldDefinition.id > after_id)
+            .order_by(BoldDefinition.id)
+            .limit(bd_results_per_page + 1)
+            .all()
+        )
+        if after_id or len(results) > bd_results_per_page:
+            total = query.count()
+        else:
+            total = len(results)
+
+    next_after_id = None
+    if len(results) > bd_results_per_page:
+        results = results[:bd_results_per_page]
+        next_after_id = results[-1].id
+
+    return results, total, next_after_id
+
+
 def update_history(
     search_1: str, search_2: str, option: str
 ) -> list[tuple[str, str, str]]:
@@ -1,23 +1,29 @@
+import json
+import re
 from collections import defaultdict
-from typing import Dict
+from types import MappingProxyType
+from typing import Dict, Mapping
 
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from unidecode import unidecode
 
-from db.models import DpdHeadword, Lookup
-from tools.pali_sort_key import pali_list_sorter
+from db.models import DpdHeadword, DpdRoot, FamilyRoot, Lookup
+from tools.pali_sort_key import pali_list_sorter, pali_sort_key
+
+lemma_clean_pattern = re.compile(r" \d.*$")
 
 
 def make_roots_count_dict(db_session: Session) -> Dict[str, int]:
-    roots_db = db_session.query(DpdHeadword).all()
-    roots_count_dict: Dict[str, int] = dict()
-    for i in roots_db:
-        if i.root_key is None:
-            continue
-        if i.root_key in roots_count_dict:
-            roots_count_dict[i.root_key] += 1
-        else:
-            roots_count_dict[i.root_key] = 1
+    results = (
+        db_session.query(DpdHeadword.root_key, func.count())
+        .filter(DpdHeadword.root_key.isnot(None))
+        .group_by(DpdHeadword.root_key)
+        .all()
+    )
+    roots_count_dict: Dict[str, int] = {
+        root_key: count for root_key, count in results
+    }
 
     return roots_count_dict
 
@@ -26,23 +32,23 @@ def make_headwords_clean_set(db_session: Session, lang="en") -> set[str]:
     """Make a set of Pāḷi headwords and English meanings."""
 
     # add headwords
-    results = db_session.query(DpdHeadword).all()
-    headwords_clean_set = set([i.lemma_clean for i in results])
+    results = db_session.query(DpdHeadword.lemma_1).all()
+    headwords_clean_set = set([lemma_clean(lemma_1) for (lemma_1,) in results])
 
     if lang == "en":
         # add all english meanings
-        results = db_session.query(Lookup).filter(Lookup.epd != "").all()
-        headwords_clean_set.update([i.lookup_key for i in results])
+        results = db_session.query(Lookup.lookup_key).filter(Lookup.epd != "").all()
+        headwords_clean_set.update([lookup_key for (lookup_key,) in results])
 
     if lang == "ru":
         # add all english and russian meanings
         results = (
-            db_session.query(Lookup)
+            db_session.query(Lookup.lookup_key)
             .filter(Lookup.epd != "")
             .filter(Lookup.rpd != "")
             .all()
         )
-        headwords_clean_set.update([i.lookup_key for i in results])
+        headwords_clean_set.update([lookup_key for (lookup_key,) in results])
 
     return headwords_clean_set
 
@@ -50,11 +56,11 @@ def make_headwords_clean_set(db_session: Session, lang="en") -> set[str]:
 def make_ascii_to_unicode_dict(db_session: Session) -> dict[str, list[str]]:
     """ASCII Key: Unicode Value."""
 
-    results = db_session.query(DpdHeadword).all()
+    results = db_session.query(DpdHeadword.lemma_1, DpdHeadword.lemma_2).all()
     headwords_clean_set: set[str] = set()
-    for i in results:
-        headwords_clean_set.add(i.lemma_clean)
-        headwords_clean_set.add(i.lemma_2)
+    for lemma_1, lemma_2 in results:
+        headwords_clean_set.add(lemma_clean(lemma_1))
+        headwords_clean_set.add(lemma_2)
     headwords_sorted_list = pali_list_sorter(headwords_clean_set)
 
     ascii_to_unicode_dict = defaultdict(list)
@@ -67,3 +73,150 @@ def make_ascii_to_unicode_dict(db_session: Session) -> dict[str, list[str]]:
             ascii_to_unicode_dict[headword_ascii].append(headword)
 
     return ascii_to_unicode_dict
+
+
+def lemma_clean(lemma_1: str) -> str:
+    """Same as DpdHeadword.lemma_clean, without loading the whole row."""
+    return lemma_clean_pattern.sub("", lemma_1)
+
+
+class LookupEntry:
+    """One row of the Lookup table, unpacked once at startup.
+    Attribute names mirror the Lookup unpack properties,
+    so the webapp data classes accept either."""
+
+    __slots__ = (
+        "lookup_key",
+        "headwords_unpack",
+        "roots_unpack",
+        "deconstructor_unpack",
+        "variants_unpack",
+        "spelling_unpack",
+        "grammar_unpack",
+        "help_unpack",
+        "abbrev_unpack",
+        "epd_unpack",
+        "rpd_unpack",
+    )
+
+    def __init__(
+        self,
+        lookup_key: str,
+        headwords: str,
+        roots: str,
+        deconstructor: str,
+        variant: str,
+        spelling: str,
+        grammar: str,
+        help: str,
+        abbrev: str,
+        epd: str,
+        rpd: str,
+        tuple_cache: dict[tuple, tuple],
+    ) -> None:
+        self.lookup_key = lookup_key
+        self.headwords_unpack: tuple[int, ...] = _unpack_tuple(headwords)
+        self.roots_unpack: tuple[str, ...] = _unpack_tuple(roots)
+        self.deconstructor_unpack: tuple[str, ...] = _unpack_tuple(deconstructor)
+        self.variants_unpack: tuple[str, ...] = _unpack_tuple(variant)
+        self.spelling_unpack: tuple[str, ...] = _unpack_tuple(spelling)
+        self.grammar_unpack = _unpack_rows(grammar, tuple_cache)
+        self.help_unpack: str = json.loads(help) if help else ""
+        self.abbrev_unpack: Mapping[str, str] = MappingProxyType(
+            json.loads(abbrev) if abbrev else {}
+        )
+        self.epd_unpack = _unpack_rows(epd, tuple_cache)
+        self.rpd_unpack = _unpack_rows(rpd, tuple_cache)
+
+    def __repr__(self) -> str:
+        return f"LookupEntry: {self.lookup_key}"
+
+
+def _unpack_tuple(packed: str) -> tuple:
+    if packed:
+        return tuple(json.loads(packed))
+    else:
+        return ()
+
+
+def _unpack_rows(packed: str, tuple_cache: dict[tuple, tuple]) -> tuple[tuple, ...]:
+    """Unpack a list of lists into a tuple of tuples.
+    Identical rows (very common in grammar) share one object."""
+
+    if not packed:
+        return ()
+    rows = []
+    for row in json.loads(packed):
+        row = tuple(row)
+        rows.append(tuple_cache.setdefault(row, row))
+    return tuple(rows)
+
+
+class LookupIndex:
+    """Immutable in-memory index of the Lookup table,
+    with all roots and their root families.
+    Keys are casefolded, so a search is a dict lookup
+    instead of an ILIKE scan over the whole table."""
+
+    def __init__(
+        self,
+        entries: dict[str, tuple[LookupEntry, ...]],
+        roots: dict[str, DpdRoot],
+        family_roots: dict[str, tuple[FamilyRoot, ...]],
+    ) -> None:
+        self.entries: Mapping[str, tuple[LookupEntry, ...]] = MappingProxyType(entries)
+        self.roots: Mapping[str, DpdRoot] = MappingProxyType(roots)
+        self.family_roots: Mapping[str, tuple[FamilyRoot, ...]] = MappingProxyType(
+            family_roots
+        )
+
+    def get(self, q: str) -> tuple[LookupEntry, ...]:
+        return self.entries.get(q.casefold(), ())
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+def make_lookup_index(db_session: Session) -> LookupIndex:
+    """Build the LookupIndex from the Lookup, DpdRoot and FamilyRoot tables."""
+
+    results = db_session.query(
+        Lookup.lookup_key,
+        Lookup.headwords,
+        Lookup.roots,
+        Lookup.deconstructor,
+        Lookup.variant,
+        Lookup.spelling,
+        Lookup.grammar,
+        Lookup.help,
+        Lookup.abbrev,
+        Lookup.epd,
+        Lookup.rpd,
+    ).yield_per(10_000)
+
+    tuple_cache: dict[tuple, tuple] = {}
+    entries_lists: dict[str, list[LookupEntry]] = defaultdict(list)
+    for row in results:
+        entry = LookupEntry(*row, tuple_cache=tuple_cache)
+        entries_lists[entry.lookup_key.casefold()].append(entry)
+
+    entries = {
+        key: tuple(sorted(value, key=lambda x: x.lookup_key))
+        for key, value in entries_lists.items()
+    }
+
+    roots_db = db_session.query(DpdRoot).all()
+    roots = {r.root: r for r in roots_db}
+
+    family_roots_lists: dict[str, list[FamilyRoot]] = defaultdict(list)
+    for fr in db_session.query(FamilyRoot).all():
+        family_roots_lists[fr.root_key].append(fr)
+    family_roots = {
+        root_key: tuple(sorted(frs, key=lambda x: pali_sort_key(x.root_family)))
+        for root_key, frs in family_roots_lists.items()
+    }
+
+    # keep the ORM objects usable after the session closes
+    db_session.expunge_all()
+
+    return LookupIndex(entries, roots, family_roots)
@@ -0,0 +1,167 @@
+"""A binary snapshot of the webapp preloads, made once at build time,
+so each new webapp worker can load it instead of querying the whole db.
+The snapshot is only used if its fingerprint matches the one saved in
+DbInfo when it was made, otherwise the preloads are rebuilt from the db
+as before."""
+
+import os
+import pickle
+from hashlib import blake2b
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy.orm import Session
+
+from db.models import DbInfo, DpdHeadword, Lookup
+from exporter.webapp.cache import get_db_version
+from exporter.webapp.preloads import (
+    make_ascii_to_unicode_dict,
+    make_headwords_clean_set,
+    make_roots_count_dict,
+)
+
+# increase when the contents of the snapshot change
+snapshot_format_version = 3
+
+# the DbInfo key of the fingerprint of the db the snapshot was made from
+db_fingerprint_key = "webapp_preloads_fingerprint"
+
+
+class Preloads:
+    """Preloaded data shared by all webapp requests."""
+
+    def __init__(
+        self,
+        roots_count_dict: dict[str, int],
+        headwords_clean_set: set[str],
+        headwords_clean_set_ru: set[str],
+        ascii_to_unicode_dict: dict[str, list[str]],
+    ) -> None:
+        self.roots_count_dict = roots_count_dict
+        self.headwords_clean_set = headwords_clean_set
+        self.headwords_clean_set_ru = headwords_clean_set_ru
+        self.ascii_to_unicode_dict = ascii_to_unicode_dict
+
+
+def make_preloads(db_session: Session) -> Preloads:
+    """Build the preloads from the db."""
+
+    return Preloads(
+        make_roots_count_dict(db_session),
+        make_headwords_clean_set(db_session),
+        make_headwords_clean_set(db_session, "ru"),
+        make_ascii_to_unicode_dict(db_session),
+    )
+
+
+def make_db_fingerprint(db_session: Session) -> str:
+    """Identify the db contents the preloads are made from:
+    the release version, and a hash of the headwords' lemmas and root keys
+    and of the lookup keys with English or Russian meanings.
+    This reads the whole tables, so it's only made at build time."""
+
+    h = blake2b(digest_size=16)
+    headwords = db_session.query(
+        DpdHeadword.id,
+        DpdHeadword.lemma_1,
+        DpdHeadword.lemma_2,
+        DpdHeadword.root_key,
+    ).order_by(DpdHeadword.id)
+    for row in headwords.yield_per(10000):
+        h.update(repr(tuple(row)).encode("utf-8"))
+
+    meanings = db_session.query(
+        Lookup.lookup_key,
+        Lookup.rpd != "",
+    ).filter(Lookup.epd != "").order_by(Lookup.lookup_key)
+    for row in meanings.yield_per(10000):
+        h.update(repr(tuple(row)).encode("utf-8"))
+
+    return f"{get_db_version(db_session)}|{h.hexdigest()}"
+
+
+def save_db_fingerprint(db_session: Session, db_fingerprint: str) -> None:
+    """Save the fingerprint in DbInfo, without committing."""
+
+    db_info = db_session.query(DbInfo) \
+        .filter_by(key=db_fingerprint_key) \
+        .first()
+    if not db_info:
+        db_info = DbInfo(key=db_fingerprint_key)
+        db_session.add(db_info)
+    db_info.value = db_fingerprint
+
+
+def get_db_fingerprint(db_session: Session) -> str:
+    """The fingerprint saved in DbInfo when the snapshot was made,
+    or an empty string. One lookup by key, so workers start quickly."""
+
+    db_info = db_session.query(DbInfo) \
+        .filter_by(key=db_fingerprint_key) \
+        .first()
+    return db_info.value if db_info else ""
+
+
+def save_preloads_snapshot(
+    preloads: Preloads,
+    db_fingerprint: str,
+    snapshot_path: Path,
+) -> None:
+    """Write the snapshot as a header and a body, two pickles in one file.
+    The file is replaced atomically, so running workers never see half a file."""
+
+    header = {
+        "format_version": snapshot_format_version,
+        "db_fingerprint": db_fingerprint,
+    }
+    body = {
+        "roots_count_dict": preloads.roots_count_dict,
+        "headwords_clean_set": preloads.headwords_clean_set,
+        "headwords_clean_set_ru": preloads.headwords_clean_set_ru,
+        "ascii_to_unicode_dict": dict(preloads.ascii_to_unicode_dict),
+    }
+
+    temp_path = snapshot_path.with_suffix(".tmp")
+    with open(temp_path, "wb") as f:
+        pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(body, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, snapshot_path)
+
+
+def load_preloads_snapshot(
+    snapshot_path: Path,
+    db_fingerprint: str,
+) -> Preloads | None:
+    """Load the snapshot, or return None if it's missing, unreadable
+    or made from a different db. Only the header is read to check."""
+
+    try:
+        with open(snapshot_path, "rb") as f:
+            header: dict[str, Any] = pickle.load(f)
+            if (
+                header.get("format_version") != snapshot_format_version
+                or header.get("db_fingerprint") != db_fingerprint
+            ):
+                return None
+            body: dict[str, Any] = pickle.load(f)
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError, AttributeError):
+        return None
+
+    return Preloads(
+        body["roots_count_dict"],
+        body["headwords_clean_set"],
+        body["headwords_clean_set_ru"],
+        body["ascii_to_unicode_dict"],
+    )
+
+
+def get_preloads(db_session: Session, snapshot_path: Path) -> Preloads:
+    """Load the preloads from the snapshot, or rebuild them from the db."""
+
+    db_fingerprint = get_db_fingerprint(db_session)
+    preloads = None
+    if db_fingerprint:
+        preloads = load_preloads_snapshot(snapshot_path, db_fingerprint)
+    if preloads is None:
+        preloads = make_preloads(db_session)
+    return preloads
@@ -193,6 +193,9 @@ function hoverHelp(event) {
     }
 }
 
+// the last search, for fetching its next page
+let bdLastSearchUrl = "";
+
 async function handleBdFormSubmit(event) {
     if (event) {
         event.preventDefault();
@@ -208,14 +211,29 @@ async function handleBdFormSubmit(event) {
     }
     const searchUrl = '/bd_search';
     if (searchQuery1.trim() !== "" || searchQuery2.trim() !== "") {
-        try {
-            const response = await fetch(`${searchUrl}?q1=${encodeURIComponent(searchQuery1)}&q2=${encodeURIComponent(searchQuery2)}&option=${selectedOption}`);
-            const data = await response.text();
-            // Process the response data and update the DOM as needed
-            bdResults.innerHTML = data;
-        } catch (error) {
-            console.error("Error fetching data:", error);
-        }
+        bdLastSearchUrl = `${searchUrl}?q1=${encodeURIComponent(searchQuery1)}&q2=${encodeURIComponent(searchQuery2)}&option=${selectedOption}`;
+        await fetchBdResults(bdLastSearchUrl);
     }
     // history.pushState({ search_1: searchQuery1, search_2: searchQuery2, option: selectedOption }, "", url);
 }
+
+async function fetchBdResults(url) {
+    try {
+        const response = await fetch(url);
+        const data = await response.text();
+        // Process the response data and update the DOM as needed
+        bdResults.innerHTML = data;
+        bdResults.scrollTop = 0;
+    } catch (error) {
+        console.error("Error fetching data:", error);
+    }
+}
+
+// next page of results
+
+bdResults.addEventListener('click', function (event) {
+    const nextButton = event.target.closest(".bd-next-page");
+    if (nextButton && bdLastSearchUrl) {
+        fetchBdResults(`${bdLastSearchUrl}&after_id=${nextButton.dataset.afterId}&start=${nextButton.dataset.start}`);
+    }
+});
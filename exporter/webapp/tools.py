@@ -1,10 +1,9 @@
-import difflib
 import re
 
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import Session, joinedload
 
-from db.db_helpers import get_db_session
-from db.models import DpdHeadword, DpdRoot, FamilyRoot, Lookup
+from db.db_helpers import get_read_only_session
+from db.models import DpdHeadword
 from exporter.webapp.data_classes import (
     AbbreviationsData,
     DeconstructorData,
@@ -17,218 +16,73 @@ from exporter.webapp.data_classes import (
     SpellingData,
     VariantData,
 )
+from exporter.webapp.cache import HtmlCache
+from exporter.webapp.fuzzy_index import FuzzyIndex
+from exporter.webapp.preloads import LookupIndex
 
-from tools.exporter_functions import (
-    get_family_compounds,
-    get_family_idioms,
-    get_family_set,
-)
+from tools.exporter_functions import FamilyLookup
 from tools.pali_sort_key import pali_sort_key
 from tools.paths import ProjectPaths
 
 
-from sqlalchemy.exc import OperationalError
-import time
-
 def make_dpd_html(
     q: str,
     pth: ProjectPaths,
     templates,
     roots_count_dict,
-    headwords_clean_set,
+    fuzzy_index: FuzzyIndex,
     ascii_to_unicode_dict,
+    lookup_index: LookupIndex,
+    html_cache: HtmlCache,
     lang="en",
 ) -> tuple[str, str]:
-    retries = 3
-    for attempt in range(retries):
-        try:
-            with get_db_session(pth.dpd_db_path) as db_session:
-                with db_session.no_autoflush:
-                    dpd_html = ""
-                    summary_html = ""
-                    q = q.replace("'", "").replace("ṁ", "ṃ").strip()
-
-                    if lang == "ru":
-                        q = q.casefold()
-
-                    lookup_results = db_session.query(Lookup)\
-                        .filter(Lookup.lookup_key.ilike(q))\
-                        .all()
-
-                    # first try the lookup table, if no results, then try other options
-                    if lookup_results:
-                        for lookup_result in lookup_results:
-                            # headwords
-                            if lookup_result.headwords:
-                                headwords = lookup_result.headwords_unpack
-                                headword_results = db_session.query(DpdHeadword)\
-                                    .filter(DpdHeadword.id.in_(headwords))\
-                                    .options(joinedload(DpdHeadword.ru))\
-                                    .all()
-                                headword_results = sorted(
-                                    headword_results, key=lambda x: pali_sort_key(x.lemma_1))
-                                for i in headword_results:
-                                    fc = get_family_compounds(i)
-                                    fi = get_family_idioms(i)
-                                    fs = get_family_set(i)
-                                    d = HeadwordData(i, fc, fi, fs)
-                                    summary_html += templates.get_template(
-                                        "dpd_summary.html").render(d=d)
-                                    dpd_html += templates.get_template("dpd_headword.html").render(d=d)
-
-                            # roots
-                            if lookup_result.roots:
-                                roots_list = lookup_result.roots_unpack
-                                root_results = db_session.query(DpdRoot)\
-                                    .filter(DpdRoot.root.in_(roots_list))\
-                                    .all()
-                                for r in root_results:
-                                    frs = db_session.query(FamilyRoot)\
-                                        .filter(FamilyRoot.root_key == r.root)
-                                    frs = sorted(frs, key=lambda x: pali_sort_key(x.root_family))
-                                    d = RootsData(r, frs, roots_count_dict)
-                                    summary_html += templates.get_template(
-                                        "root_summary.html").render(d=d)
-                                    dpd_html += templates.get_template("root.html").render(d=d)
-
-                            # deconstructor
-                            if lookup_result.deconstructor:
-                                d = DeconstructorData(lookup_result)
-                                dpd_html += templates.get_template("deconstructor.html").render(d=d)
-
-                            # variant
-                            if lookup_result.variant:
-                                d = VariantData(lookup_result)
-                                dpd_html += templates.get_template("variant.html").render(d=d)
-
-                            # spelling mistake
-                            if lookup_result.spelling:
-                                d = SpellingData(lookup_result)
-                                dpd_html += templates.get_template("spelling.html").render(d=d)
-
-                            if lookup_result.grammar:
-                                d = GrammarData(lookup_result)
-                                dpd_html += templates.get_template("grammar.html").render(d=d)
-
-                            # help
-                            if lookup_result.help:
-                                d = HelpData(lookup_result)
-                                dpd_html += templates.get_template("help.html").render(d=d)
-
-                            # abbreviations
-                            if lookup_result.abbrev:
-                                d = AbbreviationsData(lookup_result)
-                                dpd_html += templates.get_template("abbreviations.html").render(d=d)
-
-                            # epd
-                            if lookup_result.epd:
-                                d = EpdData(lookup_result)
-                                dpd_html += templates.get_template("epd.html").render(d=d)
-
-                            # rpd
-                            if lang == "ru" and lookup_result.rpd:
-                                d = RpdData(lookup_result)
-                                dpd_html += templates.get_template("rpd.html").render(d=d)
-
-                    # the two cases below search directly in the DpdHeadwords table
-                    elif q.isnumeric():  # eg 78654
-                        search_term = int(q)
-                        headword_result = db_session.query(DpdHeadword)\
-                            .filter(DpdHeadword.id == search_term)\
-                            .options(joinedload(DpdHeadword.ru))\
-                            .first()
-                        if headword_result:
-                            fc = get_family_compounds(headword_result)
-                            fi = get_family_idioms(headword_result)
-                            fs = get_family_set(headword_result)
-                            d = HeadwordData(headword_result, fc, fi, fs)
-                            dpd_html += templates.get_template("dpd_headword.html").render(d=d)
-
-                        # return closest matches
-                        else:
-                            dpd_html = find_closest_matches(
-                                q, headwords_clean_set, ascii_to_unicode_dict, lang)
-
-                    elif re.search(r"\s\d", q):  # eg "kata 5"
-                        headword_result = db_session.query(DpdHeadword)\
-                            .filter(DpdHeadword.lemma_1 == q)\
-                            .options(joinedload(DpdHeadword.ru))\
-                            .first()
-                        if headword_result:
-                            fc = get_family_compounds(headword_result)
-                            fi = get_family_idioms(headword_result)
-                            fs = get_family_set(headword_result)
-                            d = HeadwordData(headword_result, fc, fi, fs)
-                            dpd_html += templates.get_template("dpd_headword.html").render(d=d)
-
-                        # return closest matches
-                        else:
-                            dpd_html = find_closest_matches(
-                                q, headwords_clean_set, ascii_to_unicode_dict, lang)
-
-                    # or finally return closest matches
-                    else:
-                        dpd_html = find_closest_matches(
-                            q, headwords_clean_set, ascii_to_unicode_dict, lang)
-
-                    return dpd_html, summary_html
-
-        except OperationalError as e:
-            if attempt == retries - 1:  # Last attempt
-                raise e
-            time.sleep(0.1 * (attempt + 1))  # Exponential backoff
+    q = q.replace("'", "").replace("ṁ", "ṃ").strip()
+
+    if lang == "ru":
+        q = q.casefold()
+
+    # return cached results if they exist
+    cache_key = html_cache.results_key(q, lang)
+    cached_results = html_cache.results.get(cache_key)
+    if cached_results is not None:
+        return cached_results
+
+    with get_read_only_session(pth.dpd_db_path) as db_session:
         dpd_html = ""
         summary_html = ""
-        q = q.replace("'", "").replace("ṁ", "ṃ").strip()
 
-        if lang == "ru":
-            q = q.casefold()
-
-        lookup_results = (
-            db_session.query(Lookup).filter(Lookup.lookup_key.ilike(q)).all()
-        )
+        lookup_results = lookup_index.get(q)
 
         # first try the lookup table, if no results, then try other options
 
         if lookup_results:
+            headword_ids = [
+                id for result in lookup_results for id in result.headwords_unpack
+            ]
+            headword_fragments = make_headword_fragments(
+                db_session, headword_ids, templates, html_cache, lang
+            )
+
             for lookup_result in lookup_results:
                 # headwords
-                if lookup_result.headwords:
-                    headwords = lookup_result.headwords_unpack
-                    headword_results = (
-                        db_session.query(DpdHeadword)
-                        .filter(DpdHeadword.id.in_(headwords))
-                        .options(joinedload(DpdHeadword.ru))
-                        .all()
-                    )
-                    headword_results = sorted(
-                        headword_results, key=lambda x: pali_sort_key(x.lemma_1)
-                    )
-                    for i in headword_results:
-                        fc = get_family_compounds(i)
-                        fi = get_family_idioms(i)
-                        fs = get_family_set(i)
-                        d = HeadwordData(i, fc, fi, fs)
-                        summary_html += templates.get_template(
-                            "dpd_summary.html"
-                        ).render(d=d)
-                        dpd_html += templates.get_template("dpd_headword.html").render(
-                            d=d
-                        )
+                if lookup_result.headwords_unpack:
+                    fragments = [
+                        headword_fragments[id]
+                        for id in lookup_result.headwords_unpack
+                        if id in headword_fragments
+                    ]
+                    fragments = sorted(fragments, key=lambda x: pali_sort_key(x[0]))
+                    for lemma_1, headword_summary_html, headword_html in fragments:
+                        summary_html += headword_summary_html
+                        dpd_html += headword_html
 
                 # roots
-                if lookup_result.roots:
-                    roots_list = lookup_result.roots_unpack
-                    root_results = (
-                        db_session.query(DpdRoot)
-                        .filter(DpdRoot.root.in_(roots_list))
-                        .all()
-                    )
-                    for r in root_results:
-                        frs = db_session.query(FamilyRoot).filter(
-                            FamilyRoot.root_key == r.root
-                        )
-                        frs = sorted(frs, key=lambda x: pali_sort_key(x.root_family))
+                if lookup_result.roots_unpack:
+                    for root in lookup_result.roots_unpack:
+                        r = lookup_index.roots.get(root)
+                        if r is None:
+                            continue
+                        frs = lookup_index.family_roots.get(r.root, ())
                         d = RootsData(r, frs, roots_count_dict)
                         summary_html += templates.get_template(
                             "root_summary.html"
@@ -236,41 +90,41 @@ def make_dpd_html(
                         dpd_html += templates.get_template("root.html").render(d=d)
 
                 # deconstructor
-                if lookup_result.deconstructor:
+                if lookup_result.deconstructor_unpack:
                     d = DeconstructorData(lookup_result)
                     dpd_html += templates.get_template("deconstructor.html").render(d=d)
 
                 # variant
-                if lookup_result.variant:
+                if lookup_result.variants_unpack:
                     d = VariantData(lookup_result)
                     dpd_html += templates.get_template("variant.html").render(d=d)
 
                 # spelling mistake
-                if lookup_result.spelling:
+                if lookup_result.spelling_unpack:
                     d = SpellingData(lookup_result)
                     dpd_html += templates.get_template("spelling.html").render(d=d)
 
-                if lookup_result.grammar:
+                if lookup_result.grammar_unpack:
                     d = GrammarData(lookup_result)
                     dpd_html += templates.get_template("grammar.html").render(d=d)
 
                 # help
-                if lookup_result.help:
+                if lookup_result.help_unpack:
                     d = HelpData(lookup_result)
                     dpd_html += templates.get_template("help.html").render(d=d)
 
                 # abbreviations
-                if lookup_result.abbrev:
+                if lookup_result.abbrev_unpack:
                     d = AbbreviationsData(lookup_result)
                     dpd_html += templates.get_template("abbreviations.html").render(d=d)
 
                 # epd
-                if lookup_result.epd:
+                if lookup_result.epd_unpack:
                     d = EpdData(lookup_result)
                     dpd_html += templates.get_template("epd.html").render(d=d)
 
                 # rpd
-                if lang == "ru" and lookup_result.rpd:
+                if lang == "ru" and lookup_result.rpd_unpack:
                     d = RpdData(lookup_result)
                     dpd_html += templates.get_template("rpd.html").render(d=d)
 
@@ -285,16 +139,17 @@ def make_dpd_html(
                 .first()
             )
             if headword_result:
-                fc = get_family_compounds(headword_result)
-                fi = get_family_idioms(headword_result)
-                fs = get_family_set(headword_result)
+                families = FamilyLookup(db_session, [headword_result])
+                fc = families.family_compounds(headword_result)
+                fi = families.family_idioms(headword_result)
+                fs = families.family_set(headword_result)
                 d = HeadwordData(headword_result, fc, fi, fs)
                 dpd_html += templates.get_template("dpd_headword.html").render(d=d)
 
             # return closest matches
             else:
                 dpd_html = find_closest_matches(
-                    q, headwords_clean_set, ascii_to_unicode_dict, lang
+                    q, fuzzy_index, ascii_to_unicode_dict, lang
                 )
 
         elif re.search(r"\s\d", q):  # eg "kata 5"
@@ -305,35 +160,81 @@ def make_dpd_html(
                 .first()
             )
             if headword_result:
-                fc = get_family_compounds(headword_result)
-                fi = get_family_idioms(headword_result)
-                fs = get_family_set(headword_result)
+                families = FamilyLookup(db_session, [headword_result])
+                fc = families.family_compounds(headword_result)
+                fi = families.family_idioms(headword_result)
+                fs = families.family_set(headword_result)
                 d = HeadwordData(headword_result, fc, fi, fs)
                 dpd_html += templates.get_template("dpd_headword.html").render(d=d)
 
             # return closest matches
             else:
                 dpd_html = find_closest_matches(
-                    q, headwords_clean_set, ascii_to_unicode_dict, lang
+                    q, fuzzy_index, ascii_to_unicode_dict, lang
                 )
 
         # or finally return closest matches
 
         else:
             dpd_html = find_closest_matches(
-                q, headwords_clean_set, ascii_to_unicode_dict, lang
+                q, fuzzy_index, ascii_to_unicode_dict, lang
             )
 
+    html_cache.results.put(cache_key, (dpd_html, summary_html))
     return dpd_html, summary_html
 
 
+def make_headword_fragments(
+    db_session: Session,
+    headword_ids: list[int],
+    templates,
+    html_cache: HtmlCache,
+    lang: str,
+) -> dict[int, tuple[str, str, str]]:
+    """Render the summary and entry html of each headword.
+    Cached fragments are reused, the rest are fetched in one batch.
+    Returns a dict of id: (lemma_1, summary_html, dpd_html)."""
+
+    fragments: dict[int, tuple[str, str, str]] = {}
+    missing_ids: list[int] = []
+    for id in dict.fromkeys(headword_ids):
+        fragment = html_cache.headwords.get(html_cache.headword_key(id, lang))
+        if fragment is not None:
+            fragments[id] = fragment
+        else:
+            missing_ids.append(id)
+
+    if missing_ids:
+        headword_results = (
+            db_session.query(DpdHeadword)
+            .filter(DpdHeadword.id.in_(missing_ids))
+            .options(joinedload(DpdHeadword.ru))
+            .all()
+        )
+        families = FamilyLookup(db_session, headword_results)
+        for i in headword_results:
+            id = i.id
+            lemma_1 = i.lemma_1
+            fc = families.family_compounds(i)
+            fi = families.family_idioms(i)
+            fs = families.family_set(i)
+            d = HeadwordData(i, fc, fi, fs)
+            fragment = (
+                lemma_1,
+                templates.get_template("dpd_summary.html").render(d=d),
+                templates.get_template("dpd_headword.html").render(d=d),
+            )
+            html_cache.headwords.put(html_cache.headword_key(id, lang), fragment)
+            fragments[id] = fragment
+
+    return fragments
+
+
 def find_closest_matches(
-    q, headwords_clean_set, ascii_to_unicode_dict, lang="en"
+    q, fuzzy_index: FuzzyIndex, ascii_to_unicode_dict, lang="en"
 ) -> str:
-    ascii_matches = ascii_to_unicode_dict[q]
-    closest_headword_matches = difflib.get_close_matches(
-        q, headwords_clean_set, n=10, cutoff=0.7
-    )
+    ascii_matches = ascii_to_unicode_dict.get(q, [])
+    closest_headword_matches = fuzzy_index.closest_matches(q, n=10, cutoff=0.7)
 
     combined_list = []
     combined_list.extend(ascii_matches)
@@ -362,25 +263,3 @@ def find_closest_matches(
             string += "</h3>"
 
     return string
-
-
-def fuzzy_replace(string: str) -> str:
-    string = re.sub("aa|aā|āa|a|ā", "(a|ā|aa|aā|āa)", string)
-    string = re.sub("ii|iī|īi|i|ī", "(i|ī|ii|iī|īi)", string)
-    string = re.sub("uu|uū|ūu|u|ū", "(u|ū|uu|uū|ūu)", string)
-    string = re.sub("kkh|kk|kh|k", "(k|kk|kh|kkh)", string)
-    string = re.sub("ggh|gg|gh|g", "(g|gh|gg|ggh)", string)
-    string = re.sub("ṅṅ|ññ|ṇṇ|nn|ṅ|ñ|ṇ|n|ṃ", "(ṅ|ñ|ṇ|n|ṅṅ|ññ|ṇṇ|nn|ṃ)", string)
-    string = re.sub("cch|cc|ch|c", "(c|ch|cc|cch)", string)
-    string = re.sub("jjh|jj|jh|j", "(j|jh|jj|jjh)", string)
-    string = re.sub("ṭṭh|tth|ṭṭ|tt|ṭh|th|ṭ|t", "(ṭ|ṭh|ṭṭ|ṭṭh|t|tt|th|tth)", string)
-    string = re.sub("ḍḍh|ddh|ḍḍ|dd|ḍh|dh|ḍ|d", "(ḍ|ḍh|ḍḍ|ḍḍh|d|dh|dd|ddh)", string)
-    string = re.sub("pph|pp|ph|p", "(p|ph|pp|pph)", string)
-    string = re.sub("bbh|bb|bh|b", "(b|bh|bb|bbh)", string)
-    string = re.sub("mm|m|ṃ", "(m|mm|ṃ)", string)
-    string = re.sub("yy|y", "(y|yy)", string)
-    string = re.sub("rr|r", "(r|rr)", string)
-    string = re.sub("ll|l|ḷ", "(l|ll|ḷ)", string)
-    string = re.sub("vv|v", "(v|vv)", string)
-    string = re.sub("ss|s", "(s|ss)", string)
-    return string
@@ -0,0 +1,91 @@
+"""Bounded worker pools for blocking db and rendering work in the webapp.
+Each kind of request gets its own pool, so slow regex searches can't
+starve ordinary dictionary lookups. When a pool is full, requests are
+refused at once with a 503 instead of queuing without limit."""
+
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from threading import Lock
+from typing import Any, Callable, TypeVar
+
+from fastapi import HTTPException
+
+T = TypeVar("T")
+
+
+class WorkerPool:
+    """A thread pool with a limit on requests in flight and a timeout.
+    1. max_workers: threads doing the work
+    2. max_waiting: requests allowed to wait for a free thread
+    3. timeout: seconds a request waits for its result"""
+
+    def __init__(
+        self,
+        name: str,
+        max_workers: int,
+        max_waiting: int,
+        timeout: float,
+    ) -> None:
+        self.name = name
+        self.max_workers = max_workers
+        self.max_in_flight = max_workers + max_waiting
+        self.timeout = timeout
+        self.in_flight = 0
+        self.refused = 0
+        self.timed_out = 0
+        self._lock = Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=name
+        )
+
+    def _acquire(self) -> bool:
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                self.refused += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def _release(self, future: Future) -> None:
+        # runs when the work is really finished, even after a timeout
+        with self._lock:
+            self.in_flight -= 1
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run func in the pool and return its result.
+        Raises 503 if the pool is full and 504 if it takes too long."""
+
+        if not self._acquire():
+            raise HTTPException(
+                status_code=503,
+                detail="Server busy, please try again.",
+                headers={"Retry-After": "1"},
+            )
+
+        future = self._executor.submit(partial(func, *args, **kwargs))
+        future.add_done_callback(self._release)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timed_out += 1
+            raise HTTPException(
+                status_code=504,
+                detail="Search took too long, please try a narrower search.",
+            )
+
+    @property
+    def stats(self) -> dict[str, int | float]:
+        return {
+            "max_workers": self.max_workers,
+            "max_in_flight": self.max_in_flight,
+            "timeout": self.timeout,
+            "in_flight": self.in_flight,
+            "refused": self.refused,
+            "timed_out": self.timed_out,
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -46,6 +46,8 @@ go run go_modules/frequency/main.go
 uv run python db/epd/epd_to_lookup.py
 uv run python db/rpd/rpd_to_lookup.py
 
+uv run python scripts/build/webapp_preloads_snapshot.py
+
 uv run python scripts/build/dealbreakers.py
 status=$?
 if [[ $status -ne  0 ]]; then
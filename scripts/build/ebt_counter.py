@@ -7,6 +7,11 @@ EBT books are VIN1, VIN2, DN, MN, SN, AN and KN1
 """
 
 import json
+import os
+
+from sqlalchemy import update
+from sqlalchemy.orm import load_only
+
 from db.db_helpers import get_db_session
 from db.models import DpdHeadword
 from tools.paths import ProjectPaths
@@ -14,6 +19,7 @@ from tools.printer import p_green, p_title, p_yes
 from tools.tic_toc import tic, toc
 from tools.pali_text_files import ebts
 
+
 def main():
 
     tic()
@@ -23,32 +29,74 @@ def main():
     pth = ProjectPaths()
     db_session = get_db_session(pth.dpd_db_path)
 
-    with open(pth.cst_file_freq) as f:
-        cst_file_freq_dict = json.load(f)
+    ebt_freq = load_ebt_freq(pth)
     
-    db = db_session.query(DpdHeadword).all()
-
-    ebt_files = [ebt_file.replace(".txt", ".xml") for ebt_file in ebts]
+    db = db_session.query(DpdHeadword) \
+        .options(load_only(
+            DpdHeadword.id,
+            DpdHeadword.inflections,
+            DpdHeadword.inflections_api_ca_eva_iti,
+            DpdHeadword.ebt_count)) \
+        .all()
     p_yes("ok")
 
     p_green("calculating")
+    updates = []
     for i in db:
-        total = 0
-        inflections = i.inflections_list_all
-        for ebt_file in ebt_files:
-            file_freq = cst_file_freq_dict[ebt_file]
-            for inflection in inflections:
-                total += file_freq.get(inflection, 0)
-        i.ebt_count = total
-    p_yes("ok")
+        total = sum(
+            ebt_freq.get(inflection, 0)
+            for inflection in i.inflections_list_all)
+        if total != i.ebt_count:
+            updates.append({"id": i.id, "ebt_count": total})
+    p_yes(len(updates))
 
     p_green("saving to db")
+    db_session.expunge_all()
+    if updates:
+        db_session.execute(update(DpdHeadword), updates)
     db_session.commit()
     p_yes("ok")
 
     toc()
 
 
+def load_ebt_freq(pth: ProjectPaths) -> dict[str, int]:
+    """The frequency of each word in all the EBT files together,
+    summed from cst_file_freq and saved to cst_ebt_freq.
+    It is only summed again when cst_file_freq changes."""
+
+    ebt_files = [ebt_file.replace(".txt", ".xml") for ebt_file in ebts]
+    stat = os.stat(pth.cst_file_freq)
+    source_version = [stat.st_mtime_ns, stat.st_size]
+
+    try:
+        with open(pth.cst_ebt_freq) as f:
+            saved = json.load(f)
+        if (
+            saved["source_version"] == source_version
+            and saved["ebt_files"] == ebt_files
+        ):
+            return saved["freq"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        pass
+
+    with open(pth.cst_file_freq) as f:
+        cst_file_freq_dict = json.load(f)
+
+    ebt_freq: dict[str, int] = {}
+    for ebt_file in ebt_files:
+        for word, count in cst_file_freq_dict[ebt_file].items():
+            ebt_freq[word] = ebt_freq.get(word, 0) + count
+
+    with open(pth.cst_ebt_freq, "w") as f:
+        json.dump({
+            "source_version": source_version,
+            "ebt_files": ebt_files,
+            "freq": ebt_freq,
+        }, f, ensure_ascii=False)
+
+    return ebt_freq
+
+
 if __name__ == "__main__":
     main()
-
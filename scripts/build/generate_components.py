@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+
+"""Generate all the db components, like generate_components.sh,
+as a build graph which skips the stages whose inputs haven't changed
+and runs independent stages at the same time.
+Add the exporters of makedict.sh with [build] export = yes in config.ini.
+Run everything regardless with [build] force = yes."""
+
+import sys
+
+from tools.build_graph import BuildGraph, Columns, Config, File, Table
+from tools.build_graph import go_stage, python_stage
+from tools.configger import config_read, config_test, config_update
+from tools.paths import ProjectPaths
+from tools.printer import p_red, p_title
+
+
+# the columns of dpd_headwords which are edited, not generated
+HEADWORD_SOURCE = [
+    "lemma_1", "lemma_2", "pos", "grammar", "derived_from", "neg", "verb",
+    "trans", "plus_case", "meaning_1", "meaning_lit", "meaning_2", "non_ia",
+    "sanskrit", "root_key", "root_sign", "root_base", "family_root",
+    "family_word", "family_compound", "family_idioms", "family_set",
+    "construction", "derivative", "suffix", "phonetic", "compound_type",
+    "compound_construction", "non_root_in_comps", "source_1", "sutta_1",
+    "example_1", "source_2", "sutta_2", "example_2", "antonym", "synonym",
+    "variant", "var_phonetic", "var_text", "commentary", "notes", "cognate",
+    "link", "origin", "stem", "pattern",
+]
+
+INFLECTIONS = ["inflections", "inflections_api_ca_eva_iti"]
+
+
+def headwords(*columns: str) -> Columns:
+    return Columns("dpd_headwords", "id", columns)
+
+
+def lookup(*columns: str) -> Columns:
+    return Columns("lookup", "lookup_key", columns)
+
+
+def db_info(key: str) -> Columns:
+    return Columns("db_info", "key", ["value"], where=f"key = '{key}'")
+
+
+def checkpoint(stage: str) -> Columns:
+    """A stage's checkpoint in the change journal.
+    The journal itself isn't declared, as it only follows the tables."""
+    return db_info(f"change_journal_{stage}")
+
+
+def make_component_stages(pth: ProjectPaths) -> list:
+    """The stages of generate_components.sh, in the same order."""
+
+    headword_source = headwords(*HEADWORD_SOURCE)
+    roots = Table("dpd_roots", "root")
+    russian = Table("russian", "id")
+    db_rebuild = Config("regenerate", "db_rebuild")
+    use_premade = Config("deconstructor", "use_premade")
+    # the families and the deconstructor only run for these exports
+    export_flags = [
+        db_rebuild,
+        Config("exporter", "make_dpd"),
+        Config("exporter", "make_ebook"),
+        Config("exporter", "make_tpr")]
+
+    return [
+        python_stage(
+            "version", "tools/version.py",
+            inputs=[File(pth.pyproject_path)],
+            outputs=[db_info("dpd_release_version"), Config("version")],
+            always=True),
+        python_stage(
+            "uposatha day", "scripts/build/config_uposatha_day.py",
+            outputs=[
+                Config("regenerate", "db_rebuild"), Config("dictionary"),
+                Config("exporter"), Config("goldendict")],
+            always=True),
+
+        # inflections
+        python_stage(
+            "inflection templates", "db/inflections/create_inflection_templates.py",
+            inputs=[File(pth.inflection_templates_path)],
+            outputs=[
+                Table("inflection_templates", "pattern"),
+                File(pth.template_changed_path),
+                db_info("changed_templates_list")]),
+        python_stage(
+            "inflection tables", "db/inflections/generate_inflection_tables.py",
+            inputs=[
+                headwords("lemma_1", "pos", "stem", "pattern"),
+                Table("inflection_templates", "pattern"),
+                File(pth.all_tipitaka_words_path),
+                db_rebuild, Config("regenerate", "inflections")],
+            outputs=[
+                headwords("inflections", "inflections_html"),
+                checkpoint("inflection_tables"),
+                Config("regenerate", "inflections")]),
+
+        # families
+        python_stage(
+            "sanskrit root families", "scripts/build/sanskrit_root_families_updater.py",
+            inputs=[File(pth.root_families_sanskrit_path), headword_source, roots],
+            outputs=[headwords("sanskrit"), File(pth.root_families_sanskrit_path)]),
+        python_stage(
+            "family root", "db/families/family_root.py",
+            inputs=[
+                headword_source, roots, russian, *export_flags,
+                Config("anki", "update"), Config("dictionary", "show_ru_data")],
+            outputs=[Table("family_root", "root_family_key, root_key"), lookup("roots")]),
+        python_stage(
+            "family word", "db/families/family_word.py",
+            inputs=[headword_source, russian, *export_flags, Config("anki", "update")],
+            outputs=[Table("family_word", "word_family")]),
+        python_stage(
+            "family compound", "db/families/family_compound.py",
+            inputs=[headword_source, russian, *export_flags, Config("anki", "update")],
+            outputs=[Table("family_compound", "compound_family"), db_info("cf_set")]),
+        python_stage(
+            "family set", "db/families/family_set.py",
+            inputs=[headword_source, russian, *export_flags],
+            outputs=[Table("family_set", "set")]),
+        python_stage(
+            "family idiom", "db/families/family_idiom.py",
+            inputs=[headword_source, russian, *export_flags],
+            outputs=[Table("family_idiom", "idiom"), db_info("idioms_set")]),
+        python_stage(
+            "families to json", "scripts/build/families_to_json.py",
+            inputs=[
+                Table("family_compound", "compound_family"),
+                Table("family_idiom", "idiom"),
+                Table("family_root", "root_family_key, root_key"),
+                Table("family_set", "set"),
+                Table("family_word", "word_family"),
+                Config("exporter", "language")],
+            outputs=[
+                File(pth.family_compound_json),
+                File(pth.family_idiom_json),
+                File(pth.family_root_json),
+                File(pth.family_set_json),
+                File(pth.family_word_json)]),
+        python_stage(
+            "anki updater", "scripts/build/anki_updater.py",
+            inputs=[headword_source, Config("anki")]),
+
+        # deconstructor
+        python_stage(
+            "deconstructor extract archive", "scripts/build/deconstructor_extract_archive.py",
+            inputs=[File(pth.deconstructor_output_tar_path), use_premade],
+            outputs=[File(pth.deconstructor_output_json)]),
+        python_stage(
+            "deconstructor output to db", "scripts/build/deconstructor_output_add_to_db.py",
+            inputs=[File(pth.deconstructor_output_json), use_premade],
+            outputs=[lookup("deconstructor")]),
+        go_stage(
+            "deconstructor", "go_modules/deconstructor/main.go",
+            inputs=[
+                File("go_modules/deconstructor/main.go"),
+                File("go_modules/deconstructor/data"),
+                File("go_modules/deconstructor/splitters"),
+                File("go_modules/dpdDb"),
+                File("shared_data/deconstructor"),
+                File(pth.cst_wordlist),
+                lookup("headwords"),
+                *export_flags, Config("exporter", "make_deconstructor"), use_premade],
+            outputs=[
+                lookup("deconstructor"),
+                File(pth.go_deconstructor_output_dir)]),
+        python_stage(
+            "deconstructor tarball", "scripts/build/tarball_deconstructor_output.py",
+            inputs=[File(pth.deconstructor_output_json), use_premade],
+            outputs=[File(pth.deconstructor_output_tar_path)]),
+
+        # inflections in the lookup table
+        python_stage(
+            "api ca eva iti", "scripts/build/api_ca_evi_iti.py",
+            inputs=[lookup("deconstructor"), headwords("inflections")],
+            outputs=[headwords("inflections_api_ca_eva_iti")]),
+        python_stage(
+            "transliterate inflections", "db/inflections/transliterate_inflections.py",
+            inputs=[
+                headwords("lemma_1", *INFLECTIONS),
+                Config("regenerate", "transliterations")],
+            outputs=[
+                headwords(
+                    "inflections_sinhala", "inflections_devanagari",
+                    "inflections_thai"),
+                checkpoint("transliterate_inflections"),
+                File(pth.inflections_to_translit_json_path),
+                File(pth.inflections_from_translit_json_path)]),
+        python_stage(
+            "inflections to headwords", "db/inflections/inflections_to_headwords.py",
+            inputs=[headwords("lemma_1", *INFLECTIONS)],
+            outputs=[lookup("headwords"), File(pth.tpr_i2h_tsv_path)]),
+
+        # lookup table
+        python_stage(
+            "variants and spelling mistakes", "db/lookup/variants_and_spelling_mistakes.py",
+            inputs=[File(pth.variant_readings_path), File(pth.spelling_mistakes_path)],
+            outputs=[lookup("variant", "spelling")]),
+        python_stage(
+            "transliterate lookup", "db/lookup/transliterate_lookup_table.py",
+            inputs=[lookup(), Config("regenerate", "transliterations")],
+            outputs=[
+                lookup("sinhala", "devanagari", "thai"),
+                File(pth.lookup_to_translit_path),
+                File(pth.lookup_from_translit_path),
+                Config("regenerate", "transliterations")]),
+        python_stage(
+            "help and abbreviations", "db/lookup/help_abbrev_add_to_lookup.py",
+            inputs=[File(pth.help_tsv_path), File(pth.abbreviations_tsv_path)],
+            outputs=[lookup("help", "abbrev")]),
+
+        # frequency
+        python_stage(
+            "ebt counter", "scripts/build/ebt_counter.py",
+            inputs=[File(pth.cst_file_freq), headwords(*INFLECTIONS)],
+            outputs=[headwords("ebt_count"), File(pth.cst_ebt_freq)]),
+        go_stage(
+            "frequency", "go_modules/frequency/main.go",
+            inputs=[
+                File("go_modules/frequency"),
+                File("go_modules/dpdDb"),
+                File("shared_data/frequency"),
+                File(pth.dpd_css_path),
+                headwords("lemma_1", "pos", "stem", *INFLECTIONS)],
+            outputs=[headwords("freq_html", "freq_data")]),
+
+        # english and russian to pāḷi
+        python_stage(
+            "epd", "db/epd/epd_to_lookup.py",
+            inputs=[headword_source, roots, Config("dictionary", "make_link")],
+            outputs=[lookup("epd")]),
+        python_stage(
+            "rpd", "db/rpd/rpd_to_lookup.py",
+            inputs=[headword_source, roots, russian, Config("dictionary", "make_link")],
+            outputs=[lookup("rpd")]),
+
+        python_stage(
+            "webapp preloads", "scripts/build/webapp_preloads_snapshot.py",
+            inputs=[
+                Table("dpd_headwords", "id"),
+                Table("lookup", "lookup_key"),
+                roots,
+                Table("family_compound", "compound_family"),
+                Table("family_idiom", "idiom"),
+                Table("family_root", "root_family_key, root_key"),
+                Table("family_set", "set"),
+                Table("family_word", "word_family"),
+                db_info("dpd_release_version")],
+            outputs=[
+                File(pth.webapp_preloads_snapshot_path),
+                db_info("webapp_preloads_fingerprint")]),
+        python_stage(
+            "dealbreakers", "scripts/build/dealbreakers.py",
+            inputs=[headword_source]),
+    ]
+
+
+def make_export_stages(pth: ProjectPaths) -> list:
+    """The exporters of makedict.sh, which read the whole db
+    and write to exporter/share, each one switched on or off in config.ini."""
+
+    whole_db = [
+        Table("dpd_headwords", "id"),
+        Table("lookup", "lookup_key"),
+        Table("dpd_roots", "root"),
+        Table("family_compound", "compound_family"),
+        Table("family_idiom", "idiom"),
+        Table("family_root", "root_family_key, root_key"),
+        Table("family_set", "set"),
+        Table("family_word", "word_family"),
+        Table("inflection_templates", "pattern"),
+        Table("russian", "id"),
+        Table("sbs", "id"),
+        Table("db_info", "key"),
+        Config("exporter"),
+        Config("dictionary"),
+    ]
+    share = File(pth.share_dir)
+
+    def exporter(name: str, script: str, code_dir: str, **kwargs):
+        return python_stage(
+            name, script,
+            inputs=[File(code_dir), *whole_db, *kwargs.pop("inputs", [])],
+            outputs=kwargs.pop("outputs", [share]),
+            requires=["dealbreakers"],
+            **kwargs)
+
+    return [
+        exporter(
+            "grammar dict", "exporter/grammar_dict/grammar_dict.py",
+            "exporter/grammar_dict"),
+        exporter(
+            "goldendict", "exporter/goldendict/main.py",
+            "exporter/goldendict"),
+        exporter(
+            "deconstructor dict", "exporter/deconstructor/deconstructor_exporter.py",
+            "exporter/deconstructor"),
+        exporter(
+            "variants dict", "db/variants/extract_variants_main.py",
+            "db/variants"),
+        exporter(
+            "tpr", "exporter/tpr/tpr_exporter.py",
+            "exporter/tpr",
+            inputs=[Config("tpr")],
+            outputs=[share, File("exporter/tpr/output")]),
+        exporter(
+            "kindle", "exporter/kindle/kindle_exporter.py",
+            "exporter/kindle"),
+        exporter(
+            "tbw", "exporter/tbw/tbw_exporter.py",
+            "exporter/tbw"),
+        exporter(
+            "pdf", "exporter/pdf/pdf_exporter.py",
+            "exporter/pdf"),
+
+        python_stage(
+            "zip goldendict mdict", "scripts/build/zip_goldendict_mdict.py",
+            inputs=[share, Config("goldendict")],
+            outputs=[share],
+            always=True),
+        python_stage(
+            "tarball db", "scripts/build/tarball_db.py",
+            inputs=whole_db,
+            outputs=[share],
+            always=True),
+        python_stage(
+            "summary", "scripts/build/summary.py",
+            inputs=whole_db,
+            always=True),
+    ]
+
+
+def main():
+    p_title("generating components")
+
+    pth = ProjectPaths()
+    if not pth.dpd_db_path.exists():
+        p_red("Error: dpd.db file not found.")
+        sys.exit(1)
+
+    stages = make_component_stages(pth)
+    if config_test("build", "export", "yes"):
+        stages += make_export_stages(pth)
+
+    jobs = int(config_read("build", "jobs") or "4")
+    force = config_test("build", "force", "yes")
+
+    graph = BuildGraph(stages, pth.dpd_db_path, pth.build_state_path)
+    success = graph.run(jobs=jobs, force=force)
+
+    if force:
+        config_update("build", "force", "no")
+    if not success:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+"""Save a snapshot of the webapp preloads, so webapp workers start quickly."""
+
+from rich import print
+
+from db.db_helpers import get_db_session
+from exporter.webapp.preloads_snapshot import (
+    make_db_fingerprint,
+    make_preloads,
+    save_db_fingerprint,
+    save_preloads_snapshot,
+)
+from tools.paths import ProjectPaths
+from tools.tic_toc import tic, toc
+
+
+def main():
+    tic()
+    print("[bright_yellow]making webapp preloads snapshot")
+
+    pth = ProjectPaths()
+    db_session = get_db_session(pth.dpd_db_path)
+
+    print("[green]making preloads", end=" ")
+    db_fingerprint = make_db_fingerprint(db_session)
+    preloads = make_preloads(db_session)
+    print("[white]ok")
+
+    print("[green]saving snapshot", end=" ")
+    save_preloads_snapshot(preloads, db_fingerprint, pth.webapp_preloads_snapshot_path)
+    # after the snapshot, so the db never points to a snapshot which isn't there
+    save_db_fingerprint(db_session, db_fingerprint)
+    db_session.commit()
+    db_session.close()
+    print("[white]ok")
+
+    toc()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,457 @@
+"""A build graph of stages with declared inputs and outputs.
+
+1. Each stage declares the db columns, files and config options
+   it reads (inputs) and writes (outputs),
+2. a stage depends on every earlier stage whose outputs it reads,
+   which reads its outputs, or which writes the same outputs,
+3. a stage is skipped when the content hashes of its inputs and outputs
+   are the same as after its last successful run,
+4. independent stages run concurrently, except exclusive stages,
+   which run on their own.
+
+A stage which writes anything it doesn't declare can make later builds
+skip stages which should have run, so declare generously."""
+
+import ast
+import configparser
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from functools import lru_cache
+from hashlib import blake2b
+from pathlib import Path
+from typing import Iterable, Optional
+
+from rich import print
+
+from tools.tic_toc import tic, toc
+
+# seconds to wait for another process's lock on the db while hashing
+DB_TIMEOUT = 600
+
+
+class Columns:
+    """Columns of a db table. Rows in which all the columns are empty
+    are left out, so rows added for other columns don't change the hash.
+    No columns means just the keys, i.e. which rows exist.
+    Different where clauses are taken to select different rows,
+    like the keys of db_info."""
+
+    def __init__(
+        self,
+        table: str,
+        key: str,
+        columns: Iterable[str] = (),
+        where: str = ""
+    ) -> None:
+        self.table = table
+        self.key = key
+        self.columns = list(columns)
+        self.where = where
+
+    def __repr__(self) -> str:
+        where = f" where {self.where}" if self.where else ""
+        return f"{self.table}[{', '.join(self.columns) or self.key}]{where}"
+
+    def overlaps(self, other) -> bool:
+        if not isinstance(other, Columns) or self.table != other.table:
+            return False
+        if self.where and other.where and self.where != other.where:
+            return False
+        if not self.columns or not other.columns:
+            return True
+        return bool(set(self.columns) & set(other.columns))
+
+    def select_sql(self) -> str:
+        key = _quote(self.key)
+        columns = [_quote(column) for column in self.columns]
+        conditions = []
+        if columns:
+            conditions.append(" OR ".join(
+                f"({column} IS NOT NULL AND {column} != '')"
+                for column in columns))
+        if self.where:
+            conditions.append(self.where)
+        where = " AND ".join(f"({c})" for c in conditions)
+
+        sql = f"SELECT {', '.join([key] + columns)} FROM {_quote(self.table)}"
+        if where:
+            sql += f" WHERE {where}"
+        sql += f" ORDER BY {key}"
+        return sql
+
+    def content_hash(self, db_path: Path) -> str:
+        conn = sqlite3.connect(
+            f"file:{db_path}?mode=ro", uri=True, timeout=DB_TIMEOUT)
+        try:
+            h = blake2b(digest_size=16)
+            for row in conn.execute(self.select_sql()):
+                h.update(repr(row).encode("utf-8"))
+            return h.hexdigest()
+        except sqlite3.OperationalError as e:
+            if "no such table" in str(e):
+                return "missing"
+            raise
+        finally:
+            conn.close()
+
+
+class Table(Columns):
+    """A whole db table, all rows and all columns."""
+
+    def __init__(self, table: str, key: str) -> None:
+        super().__init__(table, key)
+
+    def __repr__(self) -> str:
+        return f"{self.table}[*]"
+
+    def select_sql(self) -> str:
+        return f"SELECT * FROM {_quote(self.table)} ORDER BY {_quote(self.key)}"
+
+
+def _quote(names: str) -> str:
+    """Quote a name, or comma separated names, like set, which is a keyword."""
+    return ", ".join(f'"{name.strip()}"' for name in names.split(","))
+
+
+class File:
+    """A file, or all the files in a directory."""
+
+    def __init__(self, path: Path | str) -> None:
+        self.path = Path(path)
+
+    def __repr__(self) -> str:
+        return str(self.path)
+
+    def overlaps(self, other) -> bool:
+        if not isinstance(other, File):
+            return False
+        return (
+            self.path == other.path
+            or self.path in other.path.parents
+            or other.path in self.path.parents)
+
+    def content_hash(self, db_path: Path) -> str:
+        if self.path.is_file():
+            return _file_hash(self.path)
+        elif self.path.is_dir():
+            h = blake2b(digest_size=16)
+            for file_path in sorted(self.path.rglob("*")):
+                if file_path.is_file() and "__pycache__" not in file_path.parts:
+                    h.update(str(file_path.relative_to(self.path)).encode("utf-8"))
+                    h.update(_file_hash(file_path).encode("utf-8"))
+            return h.hexdigest()
+        else:
+            return "missing"
+
+
+def _file_hash(file_path: Path) -> str:
+    h = blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class Config:
+    """An option in config.ini, or a whole section."""
+
+    def __init__(self, section: str, option: Optional[str] = None) -> None:
+        self.section = section
+        self.option = option
+
+    def __repr__(self) -> str:
+        return f"config {self.section}" + (f", {self.option}" if self.option else "")
+
+    def overlaps(self, other) -> bool:
+        if not isinstance(other, Config) or self.section != other.section:
+            return False
+        return (
+            self.option is None or other.option is None
+            or self.option == other.option)
+
+    def content_hash(self, db_path: Path) -> str:
+        config = configparser.ConfigParser()
+        config.read("config.ini")
+        if not config.has_section(self.section):
+            return "missing"
+        if self.option is None:
+            return repr(sorted(config.items(self.section)))
+        return repr(config.get(self.section, self.option, fallback=None))
+
+
+Resource = Columns | Table | File | Config
+
+
+def resource_key(resource: Resource) -> str:
+    return f"{type(resource).__name__} {resource!r}"
+
+
+class Stage:
+    """A command with its declared inputs and outputs.
+    1. always: run even if nothing has changed,
+    2. exclusive: don't run at the same time as any other stage,
+       e.g. the Go modules, which don't wait for the db to be unlocked,
+    3. requires: names of other stages to wait for, besides the ones
+       it conflicts with, e.g. a check which has to pass first."""
+
+    def __init__(
+        self,
+        name: str,
+        command: list[str],
+        inputs: Iterable[Resource] = (),
+        outputs: Iterable[Resource] = (),
+        always: bool = False,
+        exclusive: bool = False,
+        requires: Iterable[str] = ()
+    ) -> None:
+        self.name = name
+        self.command = command
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.always = always
+        self.exclusive = exclusive
+        self.requires = set(requires)
+
+    def conflicts_with(self, later: "Stage") -> bool:
+        """Does the later stage have to wait for this one?"""
+
+        for a, b in [
+            (self.outputs, later.inputs),
+            (self.inputs, later.outputs),
+            (self.outputs, later.outputs),
+        ]:
+            if any(x.overlaps(y) for x in a for y in b):
+                return True
+        return False
+
+
+def python_stage(name: str, script: str, **kwargs) -> Stage:
+    """A Python script, which is one of its own inputs,
+    along with every project module it imports."""
+    kwargs["inputs"] = [
+        *(File(path) for path in project_modules(script)),
+        *kwargs.get("inputs", [])]
+    return Stage(name, [sys.executable, script], **kwargs)
+
+
+def project_modules(script: str | Path) -> list[Path]:
+    """The script and the project modules it imports, directly or not,
+    relative to the project root, which is the working directory."""
+
+    seen: set[Path] = set()
+    todo = [Path(script)]
+    while todo:
+        path = todo.pop()
+        if path not in seen:
+            seen.add(path)
+            todo.extend(_imported_modules(path))
+    return sorted(seen)
+
+
+@lru_cache(maxsize=None)
+def _imported_modules(path: Path) -> tuple[Path, ...]:
+    """The project modules imported anywhere in a module,
+    including the packages they are in."""
+
+    try:
+        tree = ast.parse(path.read_bytes())
+    except (OSError, SyntaxError, ValueError):
+        return ()
+
+    names: list[str] = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                # relative to the module's package
+                package = path.parents[node.level - 1]
+                module = ".".join([*package.parts, *filter(None, [node.module])])
+            else:
+                module = node.module or ""
+            names.append(module)
+            # from a package import a module
+            names.extend(f"{module}.{alias.name}" for alias in node.names)
+
+    modules: list[Path] = []
+    for name in names:
+        parts = [part for part in name.split(".") if part]
+        for n in range(1, len(parts) + 1):
+            module_path = Path(*parts[:n])
+            if module_path.with_suffix(".py").is_file():
+                modules.append(module_path.with_suffix(".py"))
+            elif (module_path / "__init__.py").is_file():
+                modules.append(module_path / "__init__.py")
+    return tuple(modules)
+
+
+def go_stage(name: str, main_go: str, **kwargs) -> Stage:
+    """A Go module, run with go run, which is exclusive by default."""
+    kwargs.setdefault("exclusive", True)
+    return Stage(name, ["go", "run", main_go], **kwargs)
+
+
+class BuildGraph:
+    """Run the stages in dependency order, skipping the unchanged ones."""
+
+    def __init__(
+        self,
+        stages: list[Stage],
+        db_path: Path,
+        state_path: Path
+    ) -> None:
+        self.stages = stages
+        self.db_path = db_path
+        self.state_path = state_path
+
+        names = [stage.name for stage in stages]
+        if len(set(names)) != len(names):
+            raise ValueError("stage names must be unique")
+
+        # each stage depends on the earlier stages it conflicts with
+        self.dependencies: dict[str, set[str]] = {}
+        for index, stage in enumerate(stages):
+            self.dependencies[stage.name] = stage.requires | {
+                earlier.name for earlier in stages[:index]
+                if earlier.conflicts_with(stage)}
+            if not stage.requires <= set(names[:index]):
+                raise ValueError(f"{stage.name} requires a later or unknown stage")
+
+        self.resources_by_key: dict[str, Resource] = {
+            resource_key(resource): resource
+            for stage in stages for resource in stage.inputs + stage.outputs}
+        self.state: dict[str, dict[str, str]] = self.load_state()
+        self.hash_cache: dict[str, str] = {}
+        self.lock = threading.Lock()
+
+    def load_state(self) -> dict[str, dict[str, str]]:
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save_state(self) -> None:
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.state_path.with_suffix(".tmp")
+        with open(temp_path, "w") as f:
+            json.dump(self.state, f, indent=1)
+        temp_path.replace(self.state_path)
+
+    def content_hash(self, resources: list[Resource]) -> str:
+        """The combined hash of some resources,
+        each one cached until a stage which writes to it has run."""
+
+        h = blake2b(digest_size=16)
+        for resource in resources:
+            key = resource_key(resource)
+            with self.lock:
+                value = self.hash_cache.get(key)
+            if value is None:
+                value = resource.content_hash(self.db_path)
+                with self.lock:
+                    self.hash_cache[key] = value
+            h.update(f"{key}={value}\n".encode("utf-8"))
+        return h.hexdigest()
+
+    def forget_hashes(self, stage: Stage) -> None:
+        """Forget the cached hashes of everything a stage writes."""
+
+        with self.lock:
+            for key in list(self.hash_cache):
+                resource = self.resources_by_key[key]
+                if any(resource.overlaps(output) for output in stage.outputs):
+                    del self.hash_cache[key]
+
+    def is_up_to_date(self, stage: Stage, force: bool) -> bool:
+        if force or stage.always or stage.name not in self.state:
+            return False
+        saved = self.state[stage.name]
+        return (
+            saved.get("inputs") == self.content_hash(stage.inputs)
+            and saved.get("outputs") == self.content_hash(stage.outputs))
+
+    def run_stage(self, stage: Stage, force: bool) -> str:
+        """Run a stage unless it's up to date.
+        Returns "skipped", "ok" or "failed"."""
+
+        if self.is_up_to_date(stage, force):
+            return "skipped"
+
+        print(f"[bright_yellow]>>> {stage.name}")
+        # scripts import from the project root, like uv run
+        pythonpath = [os.getcwd(), os.environ.get("PYTHONPATH", "")]
+        env = os.environ | {"PYTHONPATH": os.pathsep.join(filter(None, pythonpath))}
+        result = subprocess.run(stage.command, env=env)
+        self.forget_hashes(stage)
+        if result.returncode != 0:
+            return "failed"
+
+        # the inputs after the run, so a stage which updates its own inputs,
+        # like resetting a config flag, doesn't run again next time
+        inputs_hash = self.content_hash(stage.inputs)
+        with self.lock:
+            self.state[stage.name] = {"inputs": inputs_hash}
+        return "ok"
+
+    def run(self, jobs: int = 1, force: bool = False) -> bool:
+        """Run the build and return True if all the stages succeeded."""
+
+        tic()
+        jobs = max(jobs, 1)
+        results: dict[str, str] = {}
+        pending = list(self.stages)
+        running: dict[Future, Stage] = {}
+        failed = False
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            while pending or running:
+                for stage in list(pending):
+                    if (
+                        failed
+                        or len(running) >= jobs
+                        or any(s.exclusive for s in running.values())
+                    ):
+                        break
+                    if not self.dependencies[stage.name] <= results.keys():
+                        continue
+                    if stage.exclusive and running:
+                        # start nothing else until it can run
+                        break
+                    pending.remove(stage)
+                    running[executor.submit(self.run_stage, stage, force)] = stage
+
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    results[stage.name] = future.result()
+                    if results[stage.name] == "failed":
+                        failed = True
+                        print(f"[red]{stage.name} failed")
+                        self.state.pop(stage.name, None)
+                    else:
+                        print(f"[green]{stage.name:<40}[white]{results[stage.name]}")
+
+        # the outputs at the end of the build,
+        # as later stages can also change the outputs of earlier ones
+        self.hash_cache = {}
+        for stage in self.stages:
+            if results.get(stage.name) in ("ok", "skipped") and stage.name in self.state:
+                self.state[stage.name]["outputs"] = self.content_hash(stage.outputs)
+        self.save_state()
+
+        ran = [name for name, result in results.items() if result == "ok"]
+        skipped = [name for name, result in results.items() if result == "skipped"]
+        print(f"[green]ran [white]{len(ran)} [green]skipped [white]{len(skipped)}")
+        if pending:
+            print(f"[red]not run: {', '.join(stage.name for stage in pending)}")
+        toc()
+        return not failed and not pending
@@ -1,77 +1,82 @@
-
 #!/usr/bin/env python3
 
-"""Get cf_set and idioms_set from the DbInfo cache."""
+"""Get cf_set and idioms_set from the DbInfo cache.
+The sets are loaded on first use and returned as frozensets,
+and kept for the life of the process, or until invalidate_db_info_sets().
+No db session is kept open, so they are safe to use in worker processes."""
 
 import json
+
+from pathlib import Path
+from threading import Lock
+
 from db.db_helpers import get_db_session
 from tools.paths import ProjectPaths
 
 pth = ProjectPaths()
-db_session = get_db_session(pth.dpd_db_path)
-
-_cf_set_cache = None
-_idioms_set_cache = None
-
 
-def load_cf_set() -> set[str]:
-    """generate a list of all compounds families"""
-    from db.models import DbInfo 
-    global _cf_set_cache
 
-    if _cf_set_cache is not None:
-        return _cf_set_cache
-    else:
-        cf_set_cache = db_session \
-            .query(DbInfo) \
-            .filter_by(key="cf_set") \
+class DbInfoSetCache:
+    """A set stored as a json list in DbInfo, cached as a frozenset
+    for each db path. Getting a cached set doesn't touch the db or the disk,
+    as it's read in the exporters' innermost loops."""
+
+    def __init__(self, key: str) -> None:
+        self.key = key
+        self._values: dict[Path, frozenset[str]] = {}
+        self._lock = Lock()
+
+    def get(self, db_path: Path = pth.dpd_db_path) -> frozenset[str]:
+        value = self._values.get(db_path)
+        if value is None:
+            with self._lock:
+                value = self._values.get(db_path)
+                if value is None:
+                    value = self._load(db_path)
+                    self._values[db_path] = value
+        return value
+
+    def invalidate(self) -> None:
+        """Forget the cached sets, e.g. after updating them in the db."""
+        with self._lock:
+            self._values = {}
+
+    def _load(self, db_path: Path) -> frozenset[str]:
+        from db.models import DbInfo
+
+        db_session = get_db_session(db_path)
+        try:
+            db_info = db_session \
+                .query(DbInfo) \
+                .filter_by(key=self.key) \
                 .first()
-        cf_set = json.loads(cf_set_cache.value)
-        _cf_set_cache = cf_set
-        return cf_set
+        finally:
+            db_session.close()
 
+        if db_info is None:
+            return frozenset()
+        return frozenset(json.loads(db_info.value))
 
 
-def load_idioms_set() -> set[str]:
-    """generate a list of all compounds families"""
-    from db.models import DbInfo
+_cf_set_cache = DbInfoSetCache("cf_set")
+_idioms_set_cache = DbInfoSetCache("idioms_set")
 
-    global _idioms_set_cache
 
-    if _idioms_set_cache is not None:
-        return _idioms_set_cache
-    else:
-        idioms_set_cache = db_session \
-            .query(DbInfo) \
-            .filter_by(key="idioms_set") \
-            .first()
-        idioms_set = json.loads(idioms_set_cache.value)
-        _idioms_set_cache = idioms_set
-        return idioms_set
+def invalidate_db_info_sets() -> None:
+    """Reload cf_set and idioms_set from the db when they're next used."""
+    _cf_set_cache.invalidate()
+    _idioms_set_cache.invalidate()
 
-if __name__ == "__main__":
-    from db.models import DbInfo
-    print(load_cf_set(DbInfo))
-
-
-# --------------------------------------old-----------------
-# pth = ProjectPaths()
 
-# _cached_cf_set: Optional[Set[str]] = None
+def load_cf_set() -> frozenset[str]:
+    """A set of all compounds families."""
+    return _cf_set_cache.get()
 
-# def cf_set_gen() -> Set[str]:
-#     """generate a list of all compounds families"""
-#     global _cached_cf_set
 
-#     if _cached_cf_set is not None:
-#         return _cached_cf_set
+def load_idioms_set() -> frozenset[str]:
+    """A set of all idioms."""
+    return _idioms_set_cache.get()
 
-#     db_session = get_db_session(pth.dpd_db_path)
-#     cf_db = db_session.query(FamilyCompound).all()
 
-#     cf_set: Set[str] = set()
-#     for i in cf_db:
-#         cf_set.add(i.compound_family)
-
-#     _cached_cf_set = cf_set
-#     return cf_set
+if __name__ == "__main__":
+    print(load_cf_set())
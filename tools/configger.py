@@ -4,6 +4,10 @@
 config.ini file."""
 
 import configparser
+import fcntl
+import os
+
+from contextlib import contextmanager
 from typing import Optional
 from rich import print
 
@@ -83,19 +87,38 @@ DEFAULT_CONFIG = {
     },
     "tpr": {
         "db_path": ""
+    },
+    "build": {
+        "jobs": "4",
+        "export": "no",
+        "force": "no"
     }
 }
 
 
+@contextmanager
+def config_lock():
+    """Hold an exclusive lock on config.ini.lock,
+    so that concurrent processes update config.ini one at a time."""
+    with open("config.ini.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
 def config_initialize() -> None:
     """Initialize config.ini with default values."""
-    for section, options in DEFAULT_CONFIG.items():
-        if not config.has_section(section):
-            config.add_section(section)
-        for option, value in options.items():
-            if not config.has_option(section, option):
-                config.set(section, option, value)
-    config_write()
+    with config_lock():
+        config.read("config.ini")
+        for section, options in DEFAULT_CONFIG.items():
+            if not config.has_section(section):
+                config.add_section(section)
+            for option, value in options.items():
+                if not config.has_option(section, option):
+                    config.set(section, option, value)
+        config_write()
 
 
 def config_read(section: str, option: str, default_value: Optional[str]=None) -> str|None:
@@ -107,19 +130,25 @@ def config_read(section: str, option: str, default_value: Optional[str]=None) ->
 
 
 def config_write() -> None:
-    """Write config.ini."""
-    with open("config.ini", "w") as file:
+    """Write config.ini to a temp file and replace it,
+    so that readers never see a half written file."""
+    temp_path = f"config.ini.{os.getpid()}.tmp"
+    with open(temp_path, "w") as file:
         config.write(file)
+    os.replace(temp_path, "config.ini")
 
 
 def config_update(section: str, option: str, value, silent=False) -> None:
     """Update config.ini with a new section, option & value."""
-    if config.has_section(section):
-        config.set(section, option, str(value))
-    else:
-        config.add_section(section)
-        config.set(section, option, str(value))
-    config_write()
+    # another process may have updated it since it was read
+    with config_lock():
+        config.read("config.ini")
+        if config.has_section(section):
+            config.set(section, option, str(value))
+        else:
+            config.add_section(section)
+            config.set(section, option, str(value))
+        config_write()
     if not silent:
         print(f"[green]config setting updated: '{section}, {option}' is '{value}'")
 
@@ -13,6 +13,12 @@ def year_month_day_dash():
     return now.strftime("%Y-%m-%d")
 
 
+def today_dash():
+    """Today's date, not the date the module was imported,
+    for long running processes like the webapp."""
+    return datetime.now().strftime("%Y-%m-%d")
+
+
 def year_month_day():
     return now.strftime("%Y%m%d")
 
@@ -1,6 +1,6 @@
-from sqlalchemy.orm import object_session
+from sqlalchemy.orm import Session, object_session
 
-from typing import List
+from typing import Dict, Iterable, List, Optional, TypeVar
 
 from db.models import DpdHeadword, FamilyIdiom
 from db.models import FamilyCompound
@@ -10,31 +10,22 @@ from tools.paths import ProjectPaths
 
 pth = ProjectPaths()
 
+T = TypeVar("T")
+
 
 def get_family_compounds(i: DpdHeadword) -> List[FamilyCompound]:
     db_session = object_session(i)
     if db_session is None:
         raise Exception("No db_session")
 
-    if i.family_compound:
-        fc = db_session \
-            .query(FamilyCompound) \
-            .filter(FamilyCompound.compound_family.in_(i.family_compound_list)) \
-            .all()
-
-        # sort by order of the  family compound list
-        word_order = i.family_compound_list
-        fc = sorted(fc, key=lambda x: word_order.index(x.compound_family))
-
-    else:
-        fc = db_session.query(FamilyCompound) \
-            .filter(FamilyCompound.compound_family == i.lemma_clean) \
-            .all()
-
-    # Make sure it's not a lazy-loaded iterable.
-    fc = list(fc)
+    fc = db_session \
+        .query(FamilyCompound) \
+        .filter(FamilyCompound.compound_family.in_(i.family_compound_list)) \
+        .all()
 
-    return fc
+    # sort by order of the family compound list
+    fc_dict = {x.compound_family: x for x in fc}
+    return in_list_order(fc_dict, i.family_compound_list)
 
 
 def get_family_idioms(i: DpdHeadword) -> List[FamilyIdiom]:
@@ -42,25 +33,14 @@ def get_family_idioms(i: DpdHeadword) -> List[FamilyIdiom]:
     if db_session is None:
         raise Exception("No db_session")
 
-    if i.family_idioms:
-        fi = db_session \
-            .query(FamilyIdiom) \
-            .filter(FamilyIdiom.idiom.in_(i.family_idioms_list)) \
-            .all()
-
-        # sort by order of the  family compound list
-        word_order = i.family_idioms_list
-        fi = sorted(fi, key=lambda x: word_order.index(x.idiom))
-    else:
-        fi = db_session.query(FamilyIdiom) \
-            .filter(FamilyIdiom.idiom == i.lemma_clean) \
-            .all()
-
-    # Make sure it's not a lazy-loaded iterable.
-    fi = list(fi)
-
-    return fi
+    fi = db_session \
+        .query(FamilyIdiom) \
+        .filter(FamilyIdiom.idiom.in_(i.family_idioms_list)) \
+        .all()
 
+    # sort by order of the family idioms list
+    fi_dict = {x.idiom: x for x in fi}
+    return in_list_order(fi_dict, i.family_idioms_list)
 
 
 def get_family_set(i: DpdHeadword) -> List[FamilySet]:
@@ -72,11 +52,62 @@ def get_family_set(i: DpdHeadword) -> List[FamilySet]:
         .filter(FamilySet.set.in_(i.family_set_list)) \
         .all()
 
-    # sort by order of the  family set list
-    word_order = i.family_set_list
-    fs = sorted(fs, key=lambda x: word_order.index(x.set))
-
-    # Make sure it's not a lazy-loaded iterable.
-    fs = list(fs)
-
-    return fs
+    # sort by order of the family set list
+    fs_dict = {x.set: x for x in fs}
+    return in_list_order(fs_dict, i.family_set_list)
+
+
+def in_list_order(families: Dict[str, T], names: List[str]) -> List[T]:
+    """The families in the order of the names, without duplicates
+    and skipping names which don't exist."""
+
+    return [families[name] for name in dict.fromkeys(names) if name in families]
+
+
+class FamilyLookup():
+    """Family compounds, idioms and sets fetched with one query per table,
+    either for a batch of headwords or, if none are given, for all headwords.
+    After that, the families of any headword in the batch need no queries."""
+
+    def __init__(
+            self,
+            db_session: Session,
+            headwords: Optional[Iterable[DpdHeadword]] = None
+    ) -> None:
+
+        if headwords is None:
+            compound_names = idiom_names = set_names = None
+        else:
+            compound_names, idiom_names, set_names = set(), set(), set()
+            for i in headwords:
+                compound_names.update(i.family_compound_list)
+                idiom_names.update(i.family_idioms_list)
+                set_names.update(i.family_set_list)
+
+        self.compounds: Dict[str, FamilyCompound] = {
+            x.compound_family: x for x in
+            self._query(db_session, FamilyCompound, FamilyCompound.compound_family, compound_names)}
+        self.idioms: Dict[str, FamilyIdiom] = {
+            x.idiom: x for x in
+            self._query(db_session, FamilyIdiom, FamilyIdiom.idiom, idiom_names)}
+        self.sets: Dict[str, FamilySet] = {
+            x.set: x for x in
+            self._query(db_session, FamilySet, FamilySet.set, set_names)}
+
+    @staticmethod
+    def _query(db_session: Session, table, key_column, names: Optional[set[str]]) -> list:
+        if names is None:
+            return db_session.query(table).all()
+        elif names:
+            return db_session.query(table).filter(key_column.in_(names)).all()
+        else:
+            return []
+
+    def family_compounds(self, i: DpdHeadword) -> List[FamilyCompound]:
+        return in_list_order(self.compounds, i.family_compound_list)
+
+    def family_idioms(self, i: DpdHeadword) -> List[FamilyIdiom]:
+        return in_list_order(self.idioms, i.family_idioms_list)
+
+    def family_set(self, i: DpdHeadword) -> List[FamilySet]:
+        return in_list_order(self.sets, i.family_set_list)
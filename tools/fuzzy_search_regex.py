@@ -1,22 +1,44 @@
+"""Groups of Pāḷi letters which sound alike,
+used for fuzzy searches and fuzzy indexes."""
+
 import re
 
+# each group of interchangeable letters, and the one letter it reduces to
+pali_letter_groups: list[tuple[str, list[str]]] = [
+    ("a", ["a", "ā", "aa", "aā", "āa"]),
+    ("i", ["i", "ī", "ii", "iī", "īi"]),
+    ("u", ["u", "ū", "uu", "uū", "ūu"]),
+    ("k", ["k", "kk", "kh", "kkh"]),
+    ("g", ["g", "gh", "gg", "ggh"]),
+    ("n", ["ṅ", "ñ", "ṇ", "n", "ṅṅ", "ññ", "ṇṇ", "nn", "ṃ"]),
+    ("c", ["c", "ch", "cc", "cch"]),
+    ("j", ["j", "jh", "jj", "jjh"]),
+    ("t", ["ṭ", "ṭh", "ṭṭ", "ṭṭh", "t", "tt", "th", "tth"]),
+    ("d", ["ḍ", "ḍh", "ḍḍ", "ḍḍh", "d", "dh", "dd", "ddh"]),
+    ("p", ["p", "ph", "pp", "pph"]),
+    ("b", ["b", "bh", "bb", "bbh"]),
+    ("m", ["m", "mm", "ṃ"]),
+    ("y", ["y", "yy"]),
+    ("r", ["r", "rr"]),
+    ("l", ["l", "ll", "ḷ"]),
+    ("v", ["v", "vv"]),
+    ("s", ["s", "ss"]),
+]
+
+# longest letters first, so kh is never k + h
+fuzzy_replacements: list[tuple[re.Pattern, str]] = [
+    (
+        re.compile("|".join(sorted(letters, key=len, reverse=True))),
+        f"({'|'.join(letters)})",
+    )
+    for _, letters in pali_letter_groups
+]
+
+
 def fuzzy_replace(string: str) -> str:
-    string = re.sub("aa|aā|āa|a|ā", "(a|ā|aa|aā|āa)", string)
-    string = re.sub("ii|iī|īi|i|ī", "(i|ī|ii|iī|īi)", string)
-    string = re.sub("uu|uū|ūu|u|ū", "(u|ū|uu|uū|ūu)", string)
-    string = re.sub("kkh|kk|kh|k", "(k|kk|kh|kkh)", string)
-    string = re.sub("ggh|gg|gh|g", "(g|gh|gg|ggh)", string)
-    string = re.sub("ṅṅ|ññ|ṇṇ|nn|ṅ|ñ|ṇ|n|ṃ", "(ṅ|ñ|ṇ|n|ṅṅ|ññ|ṇṇ|nn|ṃ)", string)
-    string = re.sub("cch|cc|ch|c","(c|ch|cc|cch)", string)
-    string = re.sub("jjh|jj|jh|j","(j|jh|jj|jjh)", string)
-    string = re.sub("ṭṭh|tth|ṭṭ|tt|ṭh|th|ṭ|t","(ṭ|ṭh|ṭṭ|ṭṭh|t|tt|th|tth)", string)
-    string = re.sub("ḍḍh|ddh|ḍḍ|dd|ḍh|dh|ḍ|d","(ḍ|ḍh|ḍḍ|ḍḍh|d|dh|dd|ddh)", string)
-    string = re.sub("pph|pp|ph|p","(p|ph|pp|pph)", string)
-    string = re.sub("bbh|bb|bh|b","(b|bh|bb|bbh)", string)
-    string = re.sub("mm|m|ṃ","(m|mm|ṃ)", string)
-    string = re.sub("yy|y","(y|yy)", string)
-    string = re.sub("rr|r","(r|rr)", string)
-    string = re.sub("ll|l|ḷ","(l|ll|ḷ)", string)
-    string = re.sub("vv|v","(v|vv)", string)
-    string = re.sub("ss|s","(s|ss)", string)
-    return string
\ No newline at end of file
+    """Make a regex in which each letter matches any letter of its group.
+    Groups are replaced in turn, so ṃ in the n group also gets the m group."""
+
+    for pattern, replacement in fuzzy_replacements:
+        string = pattern.sub(replacement, string)
+    return string
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
-"""Generic GoldenDict exporter using pyglossary."""
+"""Generic GoldenDict exporter, with the native StarDict writer
+or using pyglossary."""
 
 import shutil
 import idzip
@@ -9,12 +10,13 @@ import os
 from pathlib import Path
 from pyglossary import Glossary
 from subprocess import Popen
-from typing import Optional
+from typing import Iterable, Optional
 from zipfile import ZipFile, ZIP_DEFLATED
 
 from tools.date_and_time import make_timestamp
 from tools.goldendict_path import make_goldendict_path
 from tools.printer import p_green_title, p_no, p_red, p_white, p_yes
+from tools.stardict_writer import write_stardict
 
 
 class DictEntry():
@@ -120,6 +122,55 @@ class DictVariables():
                 .joinpath(dict_name).with_suffix(".zip")
 
 
+def export_to_goldendict(
+    dict_info: DictInfo,
+    dict_var: DictVariables,
+    dict_data: Iterable[DictEntry],
+) -> None:
+
+    """Export to GoldenDict with the native StarDict writer.
+    dict_data can be any iterable of DictEntry, including a generator,
+    it is only read once and never held in memory as a whole.
+    
+    Usage:
+    export_to_goldendict(
+        dict_info,
+        dict_var,
+        dict_data,
+    )
+    """
+
+    p_green_title("exporting to goldendict")
+    write_stardict_files(dict_info, dict_var, dict_data)
+    add_icon(dict_var)
+    copy_dir(dict_var)
+    if dict_var.zip_up:
+        zip_folder(dict_var)
+    if dict_var.delete_original:
+        delete_original(dict_var)
+
+
+def write_stardict_files(
+    dict_info: DictInfo,
+    dict_var: DictVariables,
+    dict_data: Iterable[DictEntry],
+) -> None:
+    """Write .ifo, .idx, .dict.dz and .syn.dz files, and css and js to res/"""
+
+    p_white("writing goldendict files")
+    resource_paths = []
+    if dict_var.css_path and dict_var.css_path.exists():
+        resource_paths.append(dict_var.css_path)
+    if dict_var.js_paths:
+        for js_path in dict_var.js_paths:
+            if js_path and js_path.exists():
+                resource_paths.append(js_path)
+
+    word_count, _ = write_stardict(
+        dict_info, dict_var.gd_path_name, dict_data, resource_paths)
+    p_yes(word_count)
+
+
 def export_to_goldendict_with_pyglossary(
     dict_info: DictInfo,
     dict_var: DictVariables,
@@ -12,8 +12,7 @@ from db.db_helpers import get_db_session
 from db.models import DpdHeadword, SBS, Russian
 
 from tools.configger import config_test
-from tools.exporter_functions import get_family_compounds
-from tools.exporter_functions import get_family_set
+from tools.exporter_functions import FamilyLookup
 from tools.paths import ProjectPaths
 from tools.meaning_construction import summarize_construction
 from tools.meaning_construction import make_meaning_combo_html
@@ -107,9 +106,10 @@ def make_html(
     results = db_session.query(DpdHeadword)\
         .filter(DpdHeadword.lemma_1.in_(headwords)).all()
 
+    families = FamilyLookup(db_session, results)
     for counter, i in enumerate(results):
-        fc = get_family_compounds(i)
-        fs = get_family_set(i)
+        fc = families.family_compounds(i)
+        fs = families.family_set(i)
         sbs = db_session.query(SBS).filter_by(id=i.id).first()
         ru = db_session.query(Russian).filter_by(id=i.id).first()
         d = HeadwordData(css, js, i, fc, fs, sbs, ru)
@@ -2,7 +2,8 @@
 
 """Generic MDict exporter."""
 
-from functools import reduce
+from functools import partial
+from typing import Iterable, Iterator
 from zipfile import ZIP_DEFLATED, ZipFile
 from tools.goldendict_exporter import DictEntry
 from tools.goldendict_exporter import DictInfo
@@ -16,13 +17,12 @@ class ProgData():
         self,
         dict_info: DictInfo,
         dict_var: DictVariables,
-        dict_data: list[DictEntry],
+        dict_data: Iterable[DictEntry],
         h3_header: bool
 ) -> None:
         self.dict_info: DictInfo = dict_info
         self.dict_var: DictVariables = dict_var
-        self.dict_data: list[DictEntry] = dict_data
-        self.reduced_data: list
+        self.dict_data: Iterable[DictEntry] = dict_data
         self.needs_h3_header: bool = h3_header
         self.assets: list
 
@@ -30,21 +30,17 @@ class ProgData():
 def export_to_mdict(
         dict_info: DictInfo,
         dict_var: DictVariables,
-        dict_data: list[DictEntry],
+        dict_data: Iterable[DictEntry],
         h3_header = True
 ) -> None:
 
-    """Export to MDict"""
+    """Export to MDict.
+    dict_data can be any iterable of DictEntry, including a generator,
+    it is only read once and the entries are not changed."""
 
     p_green_title("exporting to mdict")
     g = ProgData(dict_info, dict_var, dict_data, h3_header)
     
-    replace_goldendict(g)
-    
-    if h3_header:
-        add_h3_header(g)
-    
-    reduce_synonyms(g)
     write_mdx_file(g)
     compile_css_js_assets(g)
     write_mdd_file(g)
@@ -56,38 +52,33 @@ def export_to_mdict(
         delete_original(g)
 
 
-def replace_goldendict(g: ProgData) -> None:
-    
-    p_white("adding 'mdict'")
-    for i in g.dict_data:
-        i.definition_html = i.definition_html.replace(
-            "GoldenDict", "MDict")
-    p_yes("ok")
-
+def make_mdict_items(
+        dict_data: Iterable[DictEntry]
+) -> Iterator[tuple[str, DictEntry | str]]:
+    """Yield (key, value) pairs for the MDictWriter:
+    each entry itself, whose record is made by make_mdict_record,
+    followed by a @@@LINK= record for each of its synonyms."""
 
-def add_h3_header(g: ProgData) -> None:
-    p_white("adding h3 tag")
-    for i in g.dict_data:
-        i.definition_html = f"<h3>{i.word}</h3>{i.definition_html}"
-    p_yes("ok")
+    for i in dict_data:
+        yield (i.word, i)
 
+        for word in i.synonyms:
+            if word != i.word:
+                yield (word, f"""@@@LINK={i.word}""")
 
-def reduce_synonyms(g: ProgData) -> None:
-    p_white("reducing synonyms")
-    try:
-        g.reduced_data = reduce(make_synonyms, g.dict_data, [])
-        p_yes("ok")
-    except Exception as e:
-        p_no("error")
-        p_red(e)
 
+def make_mdict_record(value: DictEntry | str, h3_header: bool) -> str:
+    """The record of an entry, with 'MDict' instead of 'GoldenDict'
+    and an optional h3 tag, or a link record as it is.
+    The MDictWriter calls this when it needs the record, and doesn't keep it,
+    so the html isn't copied for all the entries at once."""
 
-def make_synonyms(all_items, item: DictEntry):
-    all_items.append((item.word, item.definition_html))
-    for word in item.synonyms:
-        if word != item.word:
-            all_items.append((word, f"""@@@LINK={item.word}"""))
-    return all_items
+    if isinstance(value, str):
+        return value
+    definition_html = value.definition_html.replace("GoldenDict", "MDict")
+    if h3_header:
+        definition_html = f"<h3>{value.word}</h3>{definition_html}"
+    return definition_html
 
 
 def write_mdx_file(g: ProgData) -> None:
@@ -95,9 +86,10 @@ def write_mdx_file(g: ProgData) -> None:
     p_white("writing .mdx file")
     try:
         writer = MDictWriter(
-            g.reduced_data,
+            make_mdict_items(g.dict_data),
             title=g.dict_info.bookname,
-            description=g.dict_info.description)
+            description=g.dict_info.description,
+            make_record=partial(make_mdict_record, h3_header=g.needs_h3_header))
         with open(g.dict_var.mdict_mdx_path, 'wb') as outfile:
             writer.write(outfile)
         p_yes("ok")
@@ -1,7 +1,18 @@
-"""Functions for sorting by Pāḷi alphabetical order."""
+"""Functions for sorting by Pāḷi alphabetical order.
+
+Sort keys are compact bytes, one byte per letter of the alphabet.
+Digraphs like kh and ṭh are one letter, always matching the longest letter.
+1. ASCII characters like spaces, numbers and punctuation sort before letters,
+2. letters sort in alphabetical order,
+3. any other characters sort after letters, in unicode order.
+
+The same order is available in SQLite as COLLATE PALI and COLLATE SANSKRIT,
+once register_collations has been called on the connection."""
 
 import re
 
+from functools import lru_cache
+
 letter_to_number = {
         "√": "00",
         "a": "01",
@@ -101,30 +112,78 @@ sanksrit_letter_to_number = {
     }
 
 
+class SortKeyMaker:
+    """Make bytes sort keys for an alphabet.
+
+    Each letter becomes a code point from U+0080 in alphabetical order,
+    and any other non-ASCII character is moved up past them.
+    Encoded as UTF-8, all these are C2 xx, and without the C2
+    each letter is a single byte between ASCII and the other characters.
+    Characters moved into the surrogates are encoded as they are,
+    which keeps them in order between U+D7FF and U+E000."""
+
+    def __init__(self, alphabet: list[str]) -> None:
+        self.table = _TranslateTable(len(alphabet))
+        for index, letter in enumerate(alphabet):
+            if len(letter) == 1:
+                self.table[ord(letter)] = 0x80 + index
+
+        # letters like kh are replaced after the single letters,
+        # longest letters first, so kh is never k + h
+        multi_letters = sorted(
+            [letter for letter in alphabet if len(letter) > 1],
+            key=len, reverse=True)
+        self.multi_letter_dict = {
+            letter.translate(self.table): chr(0x80 + alphabet.index(letter))
+            for letter in multi_letters}
+        self.multi_letter_pattern = re.compile(
+            "|".join(re.escape(letter) for letter in self.multi_letter_dict))
+
+    def _replace_multi_letter(self, match: re.Match) -> str:
+        return self.multi_letter_dict[match.group(0)]
+
+    def __call__(self, word: str) -> bytes:
+        word = word.translate(self.table)
+        if self.multi_letter_dict:
+            word = self.multi_letter_pattern.sub(self._replace_multi_letter, word)
+        return word.encode("utf-8", "surrogatepass").replace(b"\xc2", b"")
+
+
+class _TranslateTable(dict):
+    """Keep ASCII as it is and move other non-ASCII characters
+    past the letters, remembering each one on first use."""
+
+    def __init__(self, shift: int) -> None:
+        super().__init__((code, code) for code in range(0x80))
+        self.shift = shift
+
+    def __missing__(self, code: int) -> int:
+        self[code] = min(code + self.shift, 0x10FFFF)
+        return self[code]
+
+
+def _alphabet(letter_dict: dict[str, str]) -> list[str]:
+    return sorted(letter_dict, key=lambda letter: int(letter_dict[letter]))
+
+
+make_pali_key = SortKeyMaker(_alphabet(letter_to_number))
+make_sanskrit_key = SortKeyMaker(_alphabet(sanksrit_letter_to_number))
+
+
 def pali_list_sorter(words: list[str] | set[str]) -> list:
     """Sort a list or a set of words in Pāḷi alphabetical order.
     Usage:
     pali_list_sorter(list_of_pali_words)"""
 
-    if isinstance(words, set):
-        words = list(words)
-
     if words is None:
         return []
 
     else:
-        pattern = "|".join(key for key in letter_to_number.keys())
-
-        def replace(match):
-            return letter_to_number[match.group(0)]
-
-        sorted_words = sorted(
-            words, key=lambda word: re.sub(pattern, replace, word))
-
-        return sorted_words
+        return sorted(words, key=pali_sort_key)
 
 
-def pali_sort_key(word: str) -> str:
+@lru_cache(maxsize=262_144)
+def pali_sort_key(word: str) -> bytes:
     """A key for sorting in Pāḷi alphabetical order."
     Usage:
     list = sorted(list, key=pali_sort_key)
@@ -133,32 +192,87 @@ def pali_sort_key(word: str) -> str:
         by="lemma_1", inplace=True, ignore_index=True,
         key=lambda x: x.map(pali_sort_key))"""
 
-    pattern = '|'.join(re.escape(key) for key in letter_to_number.keys())
-
-    def replace(match):
-        return letter_to_number[match.group(0)]
-
     if isinstance(word, int):
         return word
     else:
-        return re.sub(pattern, replace, word)
+        return make_pali_key(word)
 
 
-def sanskrit_sort_key(word: str) -> str:
+@lru_cache(maxsize=262_144)
+def sanskrit_sort_key(word: str) -> bytes:
     """A key for sorting in Sanskrit alphabetical order."
     Usage:
-    list = sorted(list, key=pali_sort_key)
+    list = sorted(list, key=sanskrit_sort_key)
     db = sorted(db, key=lambda x: sanskrit_sort_key(x.lemma_1))
     df.sort_values(
         by="lemma_1", inplace=True, ignore_index=True,
         key=lambda x: x.map(sanskrit_sort_key))"""
 
-    pattern = '|'.join(re.escape(key) for key in sanksrit_letter_to_number.keys())
-
-    def replace(match):
-        return sanksrit_letter_to_number[match.group(0)]
-
     if isinstance(word, int):
         return word
     else:
-        return re.sub(pattern, replace, word)
+        return make_sanskrit_key(word)
+
+
+def pali_collation(word1: str, word2: str) -> int:
+    """Compare two words in Pāḷi alphabetical order, for SQLite."""
+
+    key1 = pali_sort_key(word1)
+    key2 = pali_sort_key(word2)
+    return (key1 > key2) - (key1 < key2)
+
+
+def sanskrit_collation(word1: str, word2: str) -> int:
+    """Compare two words in Sanskrit alphabetical order, for SQLite."""
+
+    key1 = sanskrit_sort_key(word1)
+    key2 = sanskrit_sort_key(word2)
+    return (key1 > key2) - (key1 < key2)
+
+
+def check_all_code_points() -> None:
+    """Check that every code point has a sort key,
+    and that the keys are in the order described at the top."""
+
+    for name, letter_dict in [
+        ("pali", letter_to_number),
+        ("sanskrit", sanksrit_letter_to_number),
+    ]:
+        alphabet = _alphabet(letter_dict)
+        make_key = SortKeyMaker(alphabet)
+        letters = [letter for letter in alphabet if len(letter) == 1]
+        ascii_characters = [chr(code) for code in range(0x80) if chr(code) not in letters]
+        others = [
+            chr(code) for code in range(0x80, 0x110000)
+            if chr(code) not in letters]
+        in_order = ascii_characters + letters + others
+
+        keys = [make_key(character) for character in in_order]
+        ties = 0
+        for index in range(1, len(keys)):
+            previous, key = keys[index - 1], keys[index]
+            if key < previous:
+                raise ValueError(
+                    f"{name}: U+{ord(in_order[index]):04X} sorts before "
+                    f"U+{ord(in_order[index - 1]):04X}")
+            elif key == previous:
+                ties += 1
+
+        # the last few code points all become U+10FFFF
+        if ties > len(alphabet):
+            raise ValueError(f"{name}: {ties} code points share a key")
+        print(f"{name}: {len(keys)} code points ok")
+
+
+def register_collations(dbapi_connection) -> None:
+    """Add COLLATE PALI and COLLATE SANSKRIT to a sqlite3 connection.
+    Usage:
+    db_session.query(DpdHeadword).order_by(collate(DpdHeadword.lemma_1, "PALI"))
+    SELECT lemma_1 FROM dpd_headwords ORDER BY lemma_1 COLLATE PALI"""
+
+    dbapi_connection.create_collation("PALI", pali_collation)
+    dbapi_connection.create_collation("SANSKRIT", sanskrit_collation)
+
+
+if __name__ == "__main__":
+    check_all_code_points()
@@ -153,6 +153,9 @@ class ProjectPaths:
         self.tpr_output_dir = base_dir / "exporter/tpr/output"
         self.tpr_sql_file_path = base_dir / "exporter/tpr/output/dpd.sql"
 
+        # exporter/webapp
+        self.webapp_preloads_snapshot_path = base_dir / "exporter/webapp/preloads_snapshot.pickle"
+
         # exporter/grammar_dict/output
         self.grammar_dict_output_dir = base_dir / "exporter/grammar_dict/output"
         self.grammar_dict_output_html_dir = base_dir / "exporter/grammar_dict/output/html"
@@ -235,6 +238,7 @@ class ProjectPaths:
         self.tipitaka_raw_text_path = base_dir / "db/frequency/output/raw_text/tipitaka.txt"
         self.tipitaka_word_count_path = base_dir / "db/frequency/output/word_count/tipitaka.csv"
         self.word_count_dir = base_dir / "db/frequency/output/word_count"
+        self.word_count_matrix_path = base_dir / "db/frequency/output/word_count_matrix"
 
         # gui
         self.additions_tsv_path = base_dir / "gui/additions.tsv"
@@ -368,6 +372,7 @@ class ProjectPaths:
 
         # share/frequency
         self.cst_file_freq = base_dir / "shared_data/frequency/cst_file_freq.json"
+        self.cst_ebt_freq = base_dir / "shared_data/frequency/cst_ebt_freq.json"
         self.cst_wordlist = base_dir / "shared_data/frequency/cst_wordlist.json"
         
         self.bjt_file_freq = base_dir / "shared_data/frequency/bjt_file_freq.json"
@@ -381,6 +386,8 @@ class ProjectPaths:
 
         # temp
         self.temp_dir = base_dir / "temp/"
+        self.deconstructor_html_cache_path = base_dir / "temp/deconstructor_html_cache"
+        self.build_state_path = base_dir / "temp/build_state.json"
 
         # db_tests/
         self.antonym_dict_path = base_dir / "db_tests/test_antonyms.json"
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+
+"""A streaming StarDict writer, without pyglossary's in-memory Glossary.
+
+Writes .ifo, .idx, .dict.dz, .syn.dz and res/ files in the same format
+and order as pyglossary's StarDict writer with sametypesequence="h",
+merge_syns=False and dictzip=True.
+
+1. Entries are written to the .idx and .dict.dz as they come in,
+   in input order, like Glossary.write,
+2. synonyms are sorted with an external sort and written to the .syn.dz,
+3. dictzip chunks are compressed in parallel."""
+
+import heapq
+import os
+import pickle
+import re
+import shutil
+import struct
+import tempfile
+import time
+import zlib
+
+from itertools import chain
+from multiprocessing import Pool
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Iterable, Iterator, Optional
+
+if TYPE_CHECKING:
+    from tools.goldendict_exporter import DictEntry, DictInfo
+
+# dictzip format, as written by idzip
+CHUNK_LENGTH = 58315
+MAX_NUM_CHUNKS = (0xffff - 10) // 2
+GZIP_HEADER = b"\x1f\x8b\x08"
+FEXTRA, FNAME = 4, 8
+XFL_BEST_COMPRESSION = b"\x02"
+OS_CODE_UNIX = b"\x03"
+
+newline_pattern = re.compile("\n\r?|\r\n?")
+
+# records per sorted run of the external sort
+RUN_SIZE = 500_000
+
+
+def write_stardict(
+    dict_info: "DictInfo",
+    ifo_path: Path,
+    dict_data: Iterable["DictEntry"],
+    resource_paths: Iterable[Path] = (),
+    processes: Optional[int] = None,
+) -> tuple[int, int]:
+    """Write a StarDict dictionary from any iterable of DictEntry,
+    which is only read once. Resources like css and js are copied to res/.
+    Returns the number of headwords and synonyms."""
+
+    processes = processes or os.cpu_count() or 1
+    base_path = ifo_path.with_suffix("")
+    base_path.parent.mkdir(parents=True, exist_ok=True)
+    write_resources(base_path.parent.joinpath("res"), resource_paths)
+
+    with tempfile.TemporaryDirectory(dir=base_path.parent) as temp_dir:
+        synonyms = _ExternalSorter(temp_dir)
+        word_count = _write_idx_and_dict(
+            base_path, dict_data, synonyms, processes, temp_dir)
+        syn_word_count = _write_syn(
+            base_path, synonyms.sorted(), processes, temp_dir)
+
+    _write_ifo(base_path, dict_info, word_count, syn_word_count)
+    return word_count, syn_word_count
+
+
+def write_resources(res_dir: Path, resource_paths: Iterable[Path]) -> None:
+    """Copy resource files to res/"""
+
+    for resource_path in resource_paths:
+        res_dir.mkdir(exist_ok=True)
+        shutil.copyfile(resource_path, res_dir.joinpath(resource_path.name))
+
+
+def _write_idx_and_dict(
+    base_path: Path,
+    dict_data: Iterable["DictEntry"],
+    synonyms: "_ExternalSorter",
+    processes: int,
+    temp_dir: str,
+) -> int:
+    """Write each entry to the .idx and the .dict.dz, and add its
+    synonyms to the sorter. Returns the number of entries."""
+
+    dict_path = Path(f"{base_path}.dict.dz")
+    with (
+        open(f"{base_path}.idx", "wb") as idx_file,
+        _DictzipWriter(dict_path, f"{base_path.name}.dict", processes, temp_dir) as dict_file
+    ):
+        dict_offset = 0
+        entry_index = 0
+        for i in dict_data:
+            b_defi = i.definition_html.encode("utf-8")
+            dict_file.write(b_defi)
+            idx_file.write(
+                i.word.encode("utf-8") + b"\x00"
+                + struct.pack(">LL", dict_offset, len(b_defi)))
+            dict_offset += len(b_defi)
+            if dict_offset > 0xFFFFFFFF:
+                raise ValueError(
+                    f"StarDict: .dict size {dict_offset} is too big for 32 bit offsets")
+
+            for synonym in i.synonyms:
+                b_synonym = synonym.encode("utf-8")
+                synonyms.add((b_synonym.lower(), b_synonym, entry_index))
+            entry_index += 1
+
+    return entry_index
+
+
+def _write_syn(
+    base_path: Path,
+    sorted_synonyms: Iterator[tuple],
+    processes: int,
+    temp_dir: str,
+) -> int:
+    """Write the sorted synonyms to the .syn.dz and return their number.
+    The same synonym of several entries goes in the order of the entries,
+    like pyglossary's stable sort. Without synonyms, there is no .syn.dz"""
+
+    first_synonym = next(sorted_synonyms, None)
+    if first_synonym is None:
+        return 0
+
+    syn_count = 0
+    syn_path = Path(f"{base_path}.syn.dz")
+    with _DictzipWriter(syn_path, f"{base_path.name}.syn", processes, temp_dir) as syn_file:
+        for _, b_synonym, entry_index in chain([first_synonym], sorted_synonyms):
+            syn_file.write(b_synonym + b"\x00" + struct.pack(">L", entry_index))
+            syn_count += 1
+    return syn_count
+
+
+def _newlines_to(text: str, replacement: str) -> str:
+    return newline_pattern.sub(replacement, text)
+
+
+def _write_ifo(
+    base_path: Path,
+    dict_info: "DictInfo",
+    word_count: int,
+    syn_word_count: int,
+) -> None:
+    """Write the .ifo file."""
+
+    bookname = _newlines_to(dict_info.bookname, " ")
+    if dict_info.source_lang and dict_info.target_lang:
+        langs = f"{dict_info.source_lang}-{dict_info.target_lang}"
+        if langs not in bookname.lower():
+            bookname = f"{bookname} ({langs})"
+
+    ifo = [
+        ("version", "3.0.0"),
+        ("bookname", bookname),
+        ("wordcount", str(word_count)),
+        ("idxfilesize", str(os.path.getsize(f"{base_path}.idx"))),
+        ("sametypesequence", "h"),
+    ]
+    if syn_word_count > 0:
+        ifo.append(("synwordcount", str(syn_word_count)))
+    for key, value in [
+        ("author", dict_info.author),
+        ("website", dict_info.website),
+        ("date", dict_info.date),
+    ]:
+        if value:
+            ifo.append((key, _newlines_to(value, " ")))
+    ifo.append(("description", _newlines_to(dict_info.description, "<br>")))
+
+    with open(f"{base_path}.ifo", "w", encoding="utf-8", newline="\n") as f:
+        f.write("StarDict's dict ifo file\n")
+        for key, value in ifo:
+            f.write(f"{key}={value}\n")
+
+
+class _ExternalSorter:
+    """Sort records which may not fit in memory. Records are sorted
+    in runs, which are written to temporary files and merged."""
+
+    def __init__(self, temp_dir: str, run_size: int = RUN_SIZE) -> None:
+        self.temp_dir = temp_dir
+        self.run_size = run_size
+        self.run: list[tuple] = []
+        self.run_files: list[IO[bytes]] = []
+
+    def add(self, record: tuple) -> None:
+        self.run.append(record)
+        if len(self.run) >= self.run_size:
+            self._write_run()
+
+    def _write_run(self) -> None:
+        self.run.sort()
+        run_file = tempfile.TemporaryFile(dir=self.temp_dir)
+        for start in range(0, len(self.run), 10_000):
+            pickle.dump(
+                self.run[start:start + 10_000], run_file,
+                protocol=pickle.HIGHEST_PROTOCOL)
+        run_file.seek(0)
+        self.run_files.append(run_file)
+        self.run = []
+
+    @staticmethod
+    def _read_run(run_file: IO[bytes]) -> Iterator[tuple]:
+        try:
+            while True:
+                yield from pickle.load(run_file)
+        except EOFError:
+            run_file.close()
+
+    def sorted(self) -> Iterator[tuple]:
+        if not self.run_files:
+            self.run.sort()
+            yield from self.run
+            return
+        if self.run:
+            self._write_run()
+        yield from heapq.merge(*[self._read_run(f) for f in self.run_files])
+
+
+def _compress_chunk(chunk: bytes) -> bytes:
+    """Compress one dictzip chunk. After a full flush, each chunk
+    is independent, so this is the same as idzip's single stream."""
+
+    compressor = zlib.compressobj(
+        zlib.Z_BEST_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(chunk) + compressor.flush(zlib.Z_FULL_FLUSH)
+
+
+class _DictzipWriter:
+    """Write a dictzip file, in the same format as idzip,
+    with the chunks compressed in a process pool.
+    The header holds the number and compressed lengths of the chunks,
+    so the compressed chunks go to a temporary file until close."""
+
+    def __init__(
+        self,
+        path: Path,
+        basename: str,
+        processes: int,
+        temp_dir: str,
+    ) -> None:
+        self.path = path
+        self.basename = basename.encode("utf-8")
+        self.mtime = int(time.time())
+        self.processes = processes
+        self.pool: Optional[Pool] = None
+        self.temp_file = tempfile.TemporaryFile(dir=temp_dir)
+        self.buffer = bytearray()
+        self.chunks: list[bytes] = []
+        # each gzip member has up to MAX_NUM_CHUNKS chunks:
+        # [compressed chunk lengths, crc, uncompressed size]
+        self.members: list[list] = []
+
+    def __enter__(self) -> "_DictzipWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        try:
+            if exc_type is None:
+                self.close()
+        finally:
+            if self.pool is not None:
+                self.pool.terminate()
+            self.temp_file.close()
+
+    def write(self, data: bytes) -> None:
+        self.buffer += data
+        full_length = len(self.buffer) // CHUNK_LENGTH * CHUNK_LENGTH
+        if full_length:
+            for start in range(0, full_length, CHUNK_LENGTH):
+                self.chunks.append(bytes(self.buffer[start:start + CHUNK_LENGTH]))
+            del self.buffer[:full_length]
+            if len(self.chunks) >= self.processes * 4:
+                self._compress_chunks()
+
+    def _compress_chunks(self) -> None:
+        if self.processes > 1 and len(self.chunks) > 1:
+            if self.pool is None:
+                self.pool = Pool(self.processes)
+            compressed = self.pool.map(_compress_chunk, self.chunks)
+        else:
+            compressed = [_compress_chunk(chunk) for chunk in self.chunks]
+
+        for chunk, zchunk in zip(self.chunks, compressed):
+            if not self.members or len(self.members[-1][0]) == MAX_NUM_CHUNKS:
+                self.members.append([[], 0, 0])
+            member = self.members[-1]
+            member[0].append(len(zchunk))
+            member[1] = zlib.crc32(chunk, member[1])
+            member[2] += len(chunk)
+            self.temp_file.write(zchunk)
+        self.chunks = []
+
+    def close(self) -> None:
+        if self.buffer:
+            self.chunks.append(bytes(self.buffer))
+            self.buffer = bytearray()
+        self._compress_chunks()
+        if not self.members:
+            # an empty file is a single empty member
+            self.members.append([[], 0, 0])
+
+        # an empty block with the final flag ends each deflate stream
+        final_block = zlib.compressobj(
+            zlib.Z_BEST_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS
+        ).flush(zlib.Z_FINISH)
+
+        self.temp_file.seek(0)
+        with open(self.path, "wb") as f:
+            for member_index, (zlengths, crc, size) in enumerate(self.members):
+                # only the first member has the basename and mtime
+                if member_index == 0:
+                    self._write_header(f, zlengths, self.basename, self.mtime)
+                else:
+                    self._write_header(f, zlengths, b"", 0)
+                _copy_bytes(self.temp_file, f, sum(zlengths))
+                f.write(final_block)
+                f.write(struct.pack("<II", crc, size & 0xFFFFFFFF))
+
+    @staticmethod
+    def _write_header(f: IO[bytes], zlengths: list[int], basename: bytes, mtime: int) -> None:
+        """Write the gzip header with the dictzip extra field."""
+
+        field_length = 3 * 2 + 2 * len(zlengths)
+        flags = FEXTRA | FNAME if basename else FEXTRA
+        f.write(GZIP_HEADER + bytes([flags]))
+        f.write(struct.pack("<I", mtime if mtime <= 0xFFFFFFFF else 0))
+        f.write(XFL_BEST_COMPRESSION + OS_CODE_UNIX)
+        f.write(struct.pack("<H", 2 * 2 + field_length))
+        f.write(b"RA" + struct.pack("<HHHH", field_length, 1, CHUNK_LENGTH, len(zlengths)))
+        f.write(b"".join(struct.pack("<H", zlen & 0xFFFF) for zlen in zlengths))
+        if basename:
+            f.write(basename + b"\0")
+
+
+def _copy_bytes(source: IO[bytes], target: IO[bytes], size: int) -> None:
+    while size > 0:
+        data = source.read(min(size, 1 << 20))
+        target.write(data)
+        size -= len(data)
@@ -32,11 +32,13 @@ import string
 import struct
 import functools
 import locale
+import os
 
 import zlib
 import datetime
 
 from html import escape
+from multiprocessing import Pool
 from tools.writemdict.ripemd128 import ripemd128
 from tools.writemdict.pureSalsa20 import Salsa20
 
@@ -50,6 +52,9 @@ from tools.writemdict.pureSalsa20 import Salsa20
 # Not using lzo compression.
 HAVE_LZO = False
 
+# punctuation and spaces are ignored when sorting mdx keys
+_regex_strip = re.compile('[%s ]+' % string.punctuation)
+
 class ParameterError(Exception):
     ### Raised when some parameter to MdxWriter is invalid or uninterpretable.
     pass
@@ -154,12 +159,15 @@ class _OffsetTableEntry(object):
     # In addition to the values themselves, it contains information about
     # the offset at which this entry will be placed (i.e. the total length
     # of records before it) which is required by the MDX format.
-    def __init__(self, key, key_null, key_len, offset, record_null):
+    __slots__ = ("key", "key_null", "key_len", "offset", "record", "record_len")
+
+    def __init__(self, key, key_null, key_len, offset, record, record_len):
         self.key = key
         self.key_null = key_null
         self.key_len = key_len
         self.offset = offset
-        self.record_null = record_null
+        self.record = record
+        self.record_len = record_len
 
 
 class MDictWriter(object):
@@ -174,12 +182,15 @@ class MDictWriter(object):
                  register_by=None,
                  user_email=None,
                  user_device_id=None,
-                 is_mdd=False):
+                 is_mdd=False,
+                 processes=None,
+                 make_record=None):
         """
         Prepares the records. A subsequent call to write() writes
         the mdx or mdd file.
 
-        d is a dictionary. The keys should be (unicode) strings. If used for an mdx
+        d is a dictionary, or an iterable of (key, value) pairs, which is
+          only read once. The keys should be (unicode) strings. If used for an mdx
           file (the parameter is_mdd is False), then the values should also be
           (unicode) strings, containing HTML snippets. If used to write an mdd
           file (the parameter is_mdd is True), then the values should be binary
@@ -232,9 +243,17 @@ class MDictWriter(object):
         is_mdd is a boolean specifying whether the file written will be an mdx file
           or an mdd file. By default this is False, meaning that an mdd file will
           be written.
+
+        processes is the number of processes used to compress the blocks.
+          By default this is the number of CPUs. With 1, no process pool is used.
+
+        make_record is an optional function which makes the record of each value
+          of d. The records it makes are not kept, it's called again when the
+          record blocks are written, so the values of d can be the source of the
+          records, e.g. the entries of a dictionary export, without keeping a
+          second copy of all the records in memory.
         """
 
-        self._num_entries = len(d)
         self._title = title
         self._description = description
         self._block_size = block_size
@@ -248,6 +267,8 @@ class MDictWriter(object):
         self._user_device_id = user_device_id
         self._compression_type = compression_type
         self._is_mdd = is_mdd
+        self._processes = processes or os.cpu_count() or 1
+        self._make_record = make_record
 
         # encoding is set to the string used in the mdx header.
         # python_encoding is passed on to the python .encode()
@@ -281,10 +302,10 @@ class MDictWriter(object):
             raise ParameterError("Unknown version")
         self._version = version
         self._build_offset_table(d)
+        self._num_entries = len(self._offset_table)
         self._build_key_blocks()
         self._build_keyb_index()
         self._build_record_blocks()
-        self._build_recordb_index()
 
     def _build_offset_table(self, d):
         # Sets self._offset_table to a table of entries _OffsetTableEntry objects e.
@@ -295,148 +316,171 @@ class MDictWriter(object):
         #  e.key_len: the length of the key, in either bytes or 2-byte units, not counting the null character
         #        (as required by the MDX format in the keyword index)
         #  e.offset: the cumulative sum of len(record_null) for preceding records
-        #  e.record_null: encoded version of the record, null-terminated
+        #  e.record: the value, as given
+        #  e.record_len: the length of the encoded, null-terminated record
+        #
+        # The records are not kept, they are made and encoded again
+        # when the record blocks are written.
         #
         # Also sets self._total_record_len to the total length of all record fields.
-        def mdict_cmp(item1, item2, prevent_link_to_link=True, sort_definitions=False):
-            # sort following mdict standard
-
-            key1 = item1[0]
-            key2 = item2[0]
-
-            key1 = key1.lower()
-            key2 = key2.lower()
-            if not self._is_mdd:
-                key1 = regex_strip.sub('', key1)
-                key2 = regex_strip.sub('', key2)
-            # locale key
-            key1 = locale.strxfrm(key1)
-            key2 = locale.strxfrm(key2)
-            if key1 > key2:
-                return 1
-            elif key1 < key2:
-                return -1
-            # reverse
-            if len(key1) > len(key2):
-                return -1
-            elif len(key1) < len(key2):
-                return 1
-            key1 = key1.rstrip(string.punctuation)
-            key2 = key2.rstrip(string.punctuation)
-            if key1 > key2:
-                return -1
-            elif key1 < key2:
-                return 1
-
-            # dpd: link to link bug prevention (08.03.2023)
-            if prevent_link_to_link or sort_definitions:
-                #if key1 & key2 are equal: compare the values
-                #if value 1&2 are links to another definition: dont change order
-                value1 = item1[1].lower()
-                value2 = item2[1].lower()
-                if value1.startswith("@@@link=") and value2.startswith("@@@link="):
-                    if sort_definitions:
-                        value1 = locale.strxfrm(value1)
-                        value2 = locale.strxfrm(value2)
-                        if value1 > value2:
-                            return 1
-                        if value1 < value2:
-                            return -1
-                    return 0
-                #if value1 is link, but value2 is not: link->lower pos
-                if value1.startswith("@@@link="):
-                    return 1
-                #if value2 is link, but value1 is not: link->lower pos
-                if value2.startswith("@@@link="):
-                    return -1
-                #disabled by default: sorting definitions is probably not neccessary..
-                if sort_definitions:
-                    #if value1&2 are both normal definitions, only compare the fist 50 characters 
-                    # (otherwise its probably some long html where the difference could just be some css)
-                    value1 = value1[:50]
-                    value2 = value2[:50]
-                    if value1 > value2:
-                        return 1
-                    if value1 < value2:
-                        return -1
-            return 0
-
-        pattern = '[%s ]+' % string.punctuation
-        regex_strip = re.compile(pattern)
 
         if isinstance(d, dict):
-            items = list(d.items())
-        else:
-            items = list(d)
-        items.sort(key=functools.cmp_to_key(mdict_cmp))
+            d = d.items()
 
-        self._offset_table = []
-        offset = 0
-        for key, record in items:
+        entries = []
+        for key, value in d:
+            record = self._get_record(value)
             key_enc = key.encode(self._python_encoding)
-            key_null = (key+"\0").encode(self._python_encoding)
-            key_len = len(key_enc) // self._encoding_length
-
-            # set record_null to a the the value of the record. If it's
-            # an MDX file, append an extra null character.
-            if self._is_mdd:
-                record_null = record
-            else:
-                record_null = (record+"\0").encode(self._python_encoding)
-            self._offset_table.append(_OffsetTableEntry(
-                key=key_enc,
-                key_null=key_null,
-                key_len=key_len,
-                record_null=record_null,
-                offset=offset))
-            offset += len(record_null)
+            entries.append((
+                self._mdict_sort_key(key, record),
+                _OffsetTableEntry(
+                    key=key_enc,
+                    key_null=(key+"\0").encode(self._python_encoding),
+                    key_len=len(key_enc) // self._encoding_length,
+                    record=value,
+                    record_len=len(self._encode_record(record)),
+                    offset=0)))
+            del record
+        entries.sort(key=lambda entry: entry[0])
+
+        self._offset_table = [t for __sort_key__, t in entries]
+        del entries
+        offset = 0
+        for t in self._offset_table:
+            t.offset = offset
+            offset += t.record_len
         self._total_record_len = offset
 
-    def _split_blocks(self, block_type):
+    def _mdict_sort_key(self, key, record):
+        # sort following mdict standard: by the locale key of the
+        # lowercase key, without punctuation and spaces.
+        # equal keys keep their order, except that links go after definitions
+        # dpd: link to link bug prevention (08.03.2023)
+        # this gives the same order as the old mdict_cmp comparison function,
+        # but each key is only transformed once.
+
+        key = key.lower()
+        if not self._is_mdd:
+            key = _regex_strip.sub("", key)
+        is_link = (
+            isinstance(record, str)
+            and record[:8].lower() == "@@@link=")
+        return (locale.strxfrm(key), is_link)
+
+    def _get_record(self, value):
+        # Returns the record of a value of d.
+        if self._make_record is None:
+            return value
+        else:
+            return self._make_record(value)
+
+    def _encode_record(self, record):
+        # Returns the record as it is written to the file. If it's
+        # an MDX file, append an extra null character.
+        if self._is_mdd:
+            return record
+        else:
+            return (record+"\0").encode(self._python_encoding)
+
+    def _split_blocks(self, len_block_entry):
         # Split either the records or the keys into blocks for compression.
         #
-        # Returns a list of _MdxBlock, where the decompressed size of each block is (as
-        # far as practicable) less than self._block_size.
+        # Returns a list of (start, end) ranges of the offset table, where the
+        # decompressed size of each block is (as far as practicable) less than
+        # self._block_size.
         #
-        # block_type should be a subclass of _MdxBlock, i.e. either _MdxRecordBlock or
+        # len_block_entry is the _len_block_entry of either _MdxRecordBlock or
         # _MdxKeyBlock.
 
+        if not self._offset_table:
+            return []
+
         this_block_start = 0
         cur_size = 0
-        blocks = []
-        for ind in range(len(self._offset_table)+1):
-            if ind != len(self._offset_table):
-                t = self._offset_table[ind]
-            else:
-                t = None
-
-            if ind == 0:
-                flush = False
-                # nothing to flush yet
-                # this part is needed in case the first entry is longer than
-                # self._block_size.
-            elif ind == len(self._offset_table):
-                flush = True  # always flush the last block
-            elif cur_size + block_type._len_block_entry(t) > self._block_size:
-                flush = True  # Adding this entry to make us larger than
-                     #self._block_size, so flush now.
-            else:
-                flush = False
-            if flush:
-                blocks.append(block_type(
-                    self._offset_table[this_block_start:ind], self._compression_type, self._version))
+        ranges = []
+        for ind, t in enumerate(self._offset_table):
+            entry_len = len_block_entry(t)
+            # the first block is never flushed empty, in case the first entry
+            # is longer than self._block_size.
+            if ind != 0 and cur_size + entry_len > self._block_size:
+                # Adding this entry would make us larger than self._block_size,
+                # so flush now.
+                ranges.append((this_block_start, ind))
                 cur_size = 0
                 this_block_start = ind
-            if t is not None:  # mentally add this entry to list of things
-                cur_size += block_type._len_block_entry(t)
-        return blocks
+            cur_size += entry_len
+        # always flush the last block
+        ranges.append((this_block_start, len(self._offset_table)))
+        return ranges
+
+    def _compress_blocks(self, blocks_data):
+        # Compresses each block of blocks_data, an iterable of bytes objects,
+        # and yields the compressed blocks in order.
+        #
+        # The blocks are compressed in a process pool, a window of blocks at a
+        # time, so only that window is held in memory.
+
+        if self._processes == 1:
+            for data in blocks_data:
+                yield _mdx_compress(data, self._compression_type)
+            return
+
+        compress = functools.partial(
+            _mdx_compress, compression_type=self._compression_type)
+        window_size = self._processes * 4
+        pool = None
+        try:
+            window = []
+            for data in blocks_data:
+                window.append(data)
+                if len(window) == window_size:
+                    if pool is None:
+                        pool = Pool(self._processes)
+                    yield from pool.map(compress, window)
+                    window = []
+            # a few blocks are not worth starting a pool
+            if pool is None and len(window) >= 8:
+                pool = Pool(self._processes)
+            if pool is None:
+                yield from map(compress, window)
+            else:
+                yield from pool.map(compress, window)
+        finally:
+            if pool is not None:
+                pool.terminate()
 
     def _build_key_blocks(self):
         # Sets self._key_blocks to a list of _MdxKeyBlocks.
-        self._key_blocks = self._split_blocks(_MdxKeyBlock)
+        ranges = self._split_blocks(_MdxKeyBlock._len_block_entry)
+        blocks_data = [
+            _MdxKeyBlock.decomp_data(self._offset_table[start:end], self._version)
+            for start, end in ranges]
+        comp_blocks = self._compress_blocks(blocks_data)
+        self._key_blocks = [
+            _MdxKeyBlock(self._offset_table[start:end], comp_data, len(data), self._version)
+            for (start, end), data, comp_data in zip(ranges, blocks_data, comp_blocks)]
 
     def _build_record_blocks(self):
-        self._record_blocks = self._split_blocks(_MdxRecordBlock)
+        # Sets self._record_block_ranges to the (start, end) ranges of the
+        # offset table in each record block.
+        #
+        # The record blocks themselves are only made in _write_record_sect(),
+        # one window at a time.
+        self._record_block_ranges = self._split_blocks(_MdxRecordBlock._len_block_entry)
+
+    def _record_blocks_data(self):
+        # Yields the decompressed data of each record block.
+        for start, end in self._record_block_ranges:
+            yield b"".join(
+                self._encode_record(self._get_record(t.record))
+                for t in self._offset_table[start:end])
+
+    def _record_blocks(self):
+        # Yields an _MdxRecordBlock for each record block, in order.
+        comp_blocks = self._compress_blocks(self._record_blocks_data())
+        for (start, end), comp_data in zip(self._record_block_ranges, comp_blocks):
+            decomp_size = sum(t.record_len for t in self._offset_table[start:end])
+            yield _MdxRecordBlock(comp_data, decomp_size, self._version)
 
     def _build_keyb_index(self):
         # Sets self._keyb_index to a bytes object, containing the index of key blocks, in
@@ -456,16 +500,6 @@ class MDictWriter(object):
         else:
             self._keyb_index = decomp_data
 
-    def _build_recordb_index(self):
-        # Sets self._recordb_index to a bytes object, containing the index of key blocks,
-        # in a format suitable for direct writing to the file.
-
-        # Also sets self._recordb_index_size.
-
-        self._recordb_index = b"".join(
-            (b.get_index_entry() for b in self._record_blocks))
-        self._recordb_index_size = len(self._recordb_index)
-
     def _write_key_sect(self, outfile):
         # Writes the key section header, key block index, and all the key blocks to
         # outfile.
@@ -504,21 +538,51 @@ class MDictWriter(object):
         # to outfile.
         #
         # outfile: a file-like object, opened in binary mode.
+        #
+        # The header and the index depend on the compressed sizes of the blocks.
+        # If outfile is seekable, they are written as placeholders first and
+        # filled in after the blocks are streamed to outfile, so the compressed
+        # records are never all held in memory.
 
-        recordblocks_total_size = sum(
-            (len(b.get_block()) for b in self._record_blocks))
         if self._version == "2.0":
             format = b">QQQQ"
         else:
             format = b">LLLL"
-        outfile.write(struct.pack(format,
-                            len(self._record_blocks),
+        num_blocks = len(self._record_block_ranges)
+        recordb_index_size = num_blocks * _MdxRecordBlock.index_entry_size(self._version)
+
+        def section_header(recordblocks_total_size):
+            return struct.pack(format,
+                            num_blocks,
                             self._num_entries,
-                            self._recordb_index_size,
-                            recordblocks_total_size))
-        outfile.write(self._recordb_index)
-        for b in self._record_blocks:
+                            recordb_index_size,
+                            recordblocks_total_size)
+
+        if not outfile.seekable():
+            record_blocks = list(self._record_blocks())
+            recordb_index = b"".join(b.get_index_entry() for b in record_blocks)
+            outfile.write(section_header(
+                sum(len(b.get_block()) for b in record_blocks)))
+            outfile.write(recordb_index)
+            for b in record_blocks:
+                outfile.write(b.get_block())
+            return
+
+        header_pos = outfile.tell()
+        outfile.write(section_header(0))
+        outfile.write(bytes(recordb_index_size))
+        index_entries = []
+        recordblocks_total_size = 0
+        for b in self._record_blocks():
             outfile.write(b.get_block())
+            index_entries.append(b.get_index_entry())
+            recordblocks_total_size += len(b.get_block())
+        end_pos = outfile.tell()
+
+        outfile.seek(header_pos)
+        outfile.write(section_header(recordblocks_total_size))
+        outfile.write(b"".join(index_entries))
+        outfile.seek(end_pos)
 
     def write(self, outfile):
         """ 
@@ -630,18 +694,22 @@ class _MdxBlock(object):
     # be built in a uniform manner.
     #
 
-    def __init__(self, offset_table, compression_type, version):
-        # Builds the data from offset_table.
+    def __init__(self, comp_data, decomp_size, version):
+        # comp_data is the compressed data of the block, as returned by
+        # _mdx_compress(), and decomp_size the size of the data before compression.
+        self._decomp_size = decomp_size
+        self._comp_data = comp_data
+        self._comp_size = len(comp_data)
+        self._version = version
+
+    @classmethod
+    def decomp_data(cls, offset_table, version):
+        # Returns the data of the block, before compression.
         #
         # offset_table is a iterable containing _OffsetTableEntry objects.
-
-        decomp_data = b"".join(
-            type(self)._block_entry(t, version)
+        return b"".join(
+            cls._block_entry(t, version)
             for t in offset_table)
-        self._decomp_size = len(decomp_data)
-        self._comp_data = _mdx_compress(decomp_data, compression_type)
-        self._comp_size = len(self._comp_data)
-        self._version = version
 
     def get_block(self):
         # Returns a bytes object, containing the data for this block.
@@ -676,32 +744,30 @@ class _MdxRecordBlock(_MdxBlock):
     # both the block itself, as well as the entry in the record block index for that
     # block.
 
-    def __init__(self, offset_table, compression_type, version):
-        # Builds the data for offset_table.
-        #
-        # offset_table is a iterable containing _OffsetTableEntry objects.
-        #
-        # Actually only uses the record parts.
-
-        _MdxBlock.__init__(self, offset_table, compression_type, version)
+    # The record data is encoded by MDictWriter._record_blocks_data(),
+    # so only the sizes of the entries are needed here.
 
     def get_index_entry(self):
         # Returns a bytes object, containing the entry for this block in the record
         # block index.
 
-        if self._version == "2.0":
-            format = b">QQ"
-        else:
-            format = b">LL"
-        return struct.pack(format, self._comp_size, self._decomp_size)
+        return struct.pack(
+            self._index_entry_format(self._version), self._comp_size, self._decomp_size)
 
     @staticmethod
-    def _block_entry(t, __version__):
-        return t.record_null
+    def _index_entry_format(version):
+        if version == "2.0":
+            return b">QQ"
+        else:
+            return b">LL"
+
+    @classmethod
+    def index_entry_size(cls, version):
+        return struct.calcsize(cls._index_entry_format(version))
 
     @staticmethod
     def _len_block_entry(t):
-        return len(t.record_null)
+        return t.record_len
 
 
 class _MdxKeyBlock(_MdxBlock):
@@ -710,14 +776,12 @@ class _MdxKeyBlock(_MdxBlock):
     # Has the ability to return (in the format suitable for insertion in an mdx file)
     # both the block itself, as well as the entry in the record block index for that
     # block.
-    def __init__(self, offset_table, compression_type, version):
-        # Builds the data for offset_table.
-        #
-        # offset_table is a iterable containing _OffsetTableEntry objects.
+    def __init__(self, offset_table, comp_data, decomp_size, version):
+        # offset_table is the list of _OffsetTableEntry objects in this block.
         #
-        # Only uses the key, key_len, key_null and offset fields, and effectively ignores record_null.
+        # Only uses the key, key_len, key_null and offset fields, and effectively ignores the record.
 
-        _MdxBlock.__init__(self, offset_table, compression_type, version)
+        _MdxBlock.__init__(self, comp_data, decomp_size, version)
         self._num_entries = len(offset_table)
         if version == "2.0":
             self._first_key = offset_table[0].key_null